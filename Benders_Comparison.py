@@ -0,0 +1,27 @@
+from benders import compare
+from pipeline import generate_instance
+
+# Mid-sized instances generated with Main: (items, root items, locations), all with the same seed
+sizes = ((30, 4, 20), (60, 6, 40), (100, 8, 60))
+seed = 1
+
+# Scenarios solved by both the monolithic scipy LP and Benders decomposition, and the studies solved
+n_scenarios = 3
+studies = ('TTS', 'TTR')
+
+# Benders options: worker processes solving the subproblems (None uses every CPU) and certified relative gap
+processes = None
+gap_tolerance = 1e-6
+
+# The guard keeps worker processes that import this script from running the comparison again
+if __name__ == '__main__':
+    for items, num_roots, locations in sizes:
+        instance = generate_instance({'n': items, 'num_roots': num_roots, 'num_locations': locations, 'seed': seed})
+        comparison = compare(instance, n_scenarios, studies, processes=processes, gap_tolerance=gap_tolerance)
+        times = comparison['times']
+        print(f"{items} items, {len(instance['factory_product'])} factory products: monolithic {times['monolithic']:.2f} s, "
+              f"Benders {times['benders']:.2f} s")
+        for metric, difference in comparison['differences'].items():
+            print(f"  {metric}: largest relative difference {difference:.2e}")
+        for stage, gap in comparison['gaps'].items():
+            print(f"  {stage}: largest certified gap {gap:.2e}, mean {comparison['iterations'][stage]:.1f} iterations")
@@ -0,0 +1,44 @@
+import instance_data
+from disruption_library import DisruptionLibrary, compare_reduction
+from scenario_engine import ScenarioEngine
+
+# Disruption scenario library: every set of 1 to max_size disrupted factories, each at every disruption rate
+# (sample_size sets are drawn at random instead when it is not None)
+max_size = 2
+rates = (0.5, 1.0)
+sample_size = None
+sample_seed = 0
+
+# Scenario reduction: 'fast_forward' selection or 'cluster' (k-means) on the capacity-loss signatures
+reduction_method = 'fast_forward'
+n_representatives = 20
+
+# Studies solved for every disruption set at the nominal process times, capacities and demands
+studies = ('TTS',)
+backend = 'scipy'
+
+
+def main():
+    """Reduce the disruption library of the instance with the settings above and print the comparison."""
+    instance = instance_data.get_instance()
+    engine = ScenarioEngine(instance, backend=backend)
+    library = DisruptionLibrary(instance['factories'], instance['capacity'], max_size=max_size, rates=rates,
+                                fixed_disruption=instance['fixed_disruption'])
+    if sample_size is None:
+        disruptions, weights = library.enumerate()
+    else:
+        disruptions, weights = library.sample(sample_size, seed=sample_seed)
+
+    report = compare_reduction(engine, library, disruptions, weights, n_representatives, studies=studies,
+                               method=reduction_method)
+    print(f"{report['scenarios']} disruption sets reduced to {report['representatives']} representatives "
+          f"(reduction ratio {report['reduction_ratio']:.1f})")
+    for metric in report:
+        if isinstance(report[metric], dict):
+            print(f"{metric}: full enumeration {report[metric]['full']:.4f}, reduced {report[metric]['reduced']:.4f}, "
+                  f"relative error {100 * report[metric]['error']:.2f}%")
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+from generator_service import GeneratorService
+
+# Local address of the service, and worker processes generating instances concurrently (None uses every CPU)
+host = '127.0.0.1'
+port = 8765
+workers = None
+shapefile_path = 'shapefiles/TM_WORLD_BORDERS-0.3.shp'
+# Directory the output directories of the requests are resolved in; requests cannot write outside it
+output_root = 'service_output'
+
+# Clients call generator_service.request_instance({'n': 15, 'num_locations': 10, 'seed': 3}, url), or POST the
+# settings as JSON to <url>/instance; GET <url>/status reports the requests served and their latency
+if __name__ == '__main__':
+    service = GeneratorService(host=host, port=port, workers=workers, shapefile_path=shapefile_path,
+                               output_root=output_root)
+    url = service.start()
+    print(f"Generator service with {service.workers} warm workers at {url} (Ctrl+C to stop)")
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Stopped after {service.requests} requests")
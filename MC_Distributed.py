@@ -0,0 +1,61 @@
+import importlib
+import os
+import sys
+from multiprocessing import Process
+
+from shard_queue import ShardQueue
+from shared_instance import publish_instance
+
+# Distributed Monte Carlo over a shared directory, run as
+#   python MC_Distributed.py coordinator   writes the scenario shards
+#   python MC_Distributed.py worker        solves shards until none is left (start one or more per node)
+#   python MC_Distributed.py merge         assembles the results and prints the statistics
+#   python MC_Distributed.py local         all three, with local worker processes standing in for nodes
+mode = sys.argv[1] if len(sys.argv) > 1 else 'local'
+
+queue_directory = 'mc_queue'
+studies = ('TTS',)
+n_scenarios = 200
+shard_size = 20
+# Module providing get_instance(), imported by every worker
+instance_module = 'instance_data'
+engine_options = {'backend': 'scipy', 'sampling': 'random', 'sampling_seed': 0}
+# Publish the instance tables and LP arrays once in the queue directory (scipy backend): workers memory-map them, so
+# the memory of the workers of a node does not grow with their number and no worker builds the LP
+share_instance = True
+local_workers = 4
+# Seconds without progress after which the shard of a worker is considered lost and handed out again
+lease_timeout = 300
+confidence_level = 0.95
+
+
+def merge(queue):
+    values, summary = queue.merge(confidence_level)
+    for metric, statistics in summary.items():
+        low, high = statistics['confidence_interval']
+        print(f"{metric}: mean {statistics['mean']:.4f}, std {statistics['std']:.4f}, "
+              f"{100 * confidence_level:.0f}% confidence interval [{low:.4f}, {high:.4f}] over {len(values[metric])} scenarios")
+    return values
+
+
+# The guard keeps worker processes that import this script from running it again
+if __name__ == '__main__':
+    queue = ShardQueue(queue_directory, lease_timeout=lease_timeout)
+    if mode in ('coordinator', 'local'):
+        shared_instance = None
+        if share_instance:
+            shared_instance = publish_instance(importlib.import_module(instance_module).get_instance(),
+                                               os.path.join(queue_directory, 'instance'),
+                                               engine_options.get('aggregate_flows', False))
+        shards = queue.write_shards(n_scenarios, shard_size, studies, instance_module, engine_options, shared_instance)
+        print(f"{len(shards)} shards of {shard_size} scenarios written to {queue_directory}")
+    if mode == 'worker':
+        print(f"{queue.run_worker()} shards solved")
+    if mode == 'local':
+        workers = [Process(target=queue.run_worker, args=(f'local-{k}',)) for k in range(local_workers)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    if mode in ('merge', 'local'):
+        merge(queue)
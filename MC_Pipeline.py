@@ -0,0 +1,44 @@
+from pipeline import Pipeline
+
+# Instances generated with Main: n_instances random networks of the given size, seeds seed, seed + 1, ...
+n_instances = 20
+items = 15
+num_roots = 4
+locations = 10
+seed = 0
+
+# Monte Carlo scenarios solved per instance
+studies = ('TTS', 'TTR')
+n_scenarios = 20
+engine_options = {'backend': 'scipy'}
+
+# Concurrency: generation runs in generate_workers processes and solving in solve_workers processes ('process')
+# or threads ('thread', scipy backend only). At most queue_size generated instances wait for a solve worker;
+# generation pauses while the queue is full.
+generate_workers = 1
+solve_workers = 1
+queue_size = 2
+solve_executor = 'process'
+
+# Folder of the generated files of every instance (None discards them), and the results, one JSON line per instance
+output_root = None
+results_path = 'output/pipeline_results.jsonl'
+
+if __name__ == '__main__':
+    settings = ({'n': items, 'num_roots': num_roots, 'num_locations': locations, 'seed': seed + k}
+                for k in range(n_instances))
+    pipeline = Pipeline(settings, studies=studies, n_scenarios=n_scenarios, engine_options=engine_options,
+                        generate_workers=generate_workers, solve_workers=solve_workers, queue_size=queue_size,
+                        solve_executor=solve_executor, output_root=output_root, results_path=results_path)
+    results = pipeline.run()
+    errors = [result for result in results if 'error' in result]
+    print(f"{len(results) - len(errors)} instances solved, {len(errors)} failed")
+    for result in errors:
+        print(f"Instance {result['index']} (seed {result['settings'].get('seed')}): {result['error']}")
+
+    report = pipeline.report()
+    print(f"Wall time {report['wall_time']:.1f} s, at most {report['max_queued']} of {report['queue_size']} "
+          f"queued instances")
+    for name, stage in report['stages'].items():
+        print(f"{name}: {stage['items']} instances on {stage['workers']} workers, utilization "
+              f"{100 * stage['utilization']:.0f}%, busy {stage['busy']:.1f} s, waiting {stage['waiting']:.1f} s")
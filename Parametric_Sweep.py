@@ -0,0 +1,39 @@
+import numpy as np
+
+import instance_data
+from parametric import ParametricSweep
+from scenario_engine import ScenarioEngine
+
+# Objective of the nominal scenario ('TTS' or 'Lostmargin') as a function of one parameter along a grid
+objective = 'Lostmargin'
+# 'disruption' or 'capacity' of factories, 'demand' of final products, or 'process_time' of (factory, product) pairs
+parameter = 'disruption'
+# Keys varied together (None varies every key), e.g. ['F1'] for the disruption rate of factory F1 alone
+keys = ['F1']
+# Grid values the parameter is set to, or scaled by if relative (e.g. demand scaling np.linspace(0.5, 2, 31))
+grid = np.linspace(0, 1, 101)
+relative = False
+
+# Show the curve (False for headless runs)
+show_plots = True
+
+if __name__ == '__main__':
+    instance = instance_data.get_instance()
+    sweep = ParametricSweep(ScenarioEngine(instance, backend='scipy'), objective=objective)
+    curve = sweep.run(grid, parameter, keys=keys, relative=relative)
+    print(f"{curve['solved'].sum()} of {len(grid)} points solved ({curve['iterations']} simplex iterations), "
+          f"{len(curve['pieces'])} linear pieces found by ranging")
+    for piece in curve['pieces']:
+        print(f"  {parameter} {piece['start']:.4g} to {piece['end']:.4g}: {objective} {piece['value']:.2f} "
+              f"+ {piece['slope']:.2f} per unit")
+
+    if show_plots:
+        import matplotlib.pyplot as plt
+
+        plt.figure(figsize=(8, 5))
+        plt.plot(curve['grid'], curve['values'], label=objective)
+        plt.scatter(curve['grid'][curve['solved']], curve['values'][curve['solved']], s=12, label='Solved points')
+        plt.xlabel(f"{parameter} {'scale' if relative else 'value'} of {', '.join(map(str, keys)) if keys else 'all'}")
+        plt.ylabel(objective)
+        plt.legend()
+        plt.show()
@@ -0,0 +1,35 @@
+import matplotlib.pyplot as plt
+
+import instance_data
+from pareto_front import ParetoFront
+from scenario_engine import ScenarioEngine
+
+# Trade-off between lost margin (obj1), GHG (obj2) and SI (obj3) of the first scenarios of the TTR study:
+# a grid_points x grid_points grid of GHG and SI epsilon bounds per scenario, its rows solved in parallel
+n_scenarios = 2
+grid_points = 6
+processes = None  # None uses every CPU
+
+# The guard keeps worker processes that import this script from running the study again
+if __name__ == '__main__':
+    instance = instance_data.get_instance()
+    scenarios = ScenarioEngine(instance, backend='scipy').scenarios(n_scenarios)
+    pareto = ParetoFront(instance, grid_points=grid_points, processes=processes)
+    fronts = pareto.fronts(scenarios)
+
+    for k, (front, counts) in enumerate(zip(fronts, pareto.counts)):
+        print(f"Scenario {k}: {len(front)} non-dominated points, {counts['solved']} LPs solved, "
+              f"{counts['redundant']} redundant and {counts['infeasible']} infeasible grid cells skipped")
+        for lostmargin, ghg, si in front:
+            print(f"  Lostmargin {lostmargin:.1f}, GHG {ghg:.1f}, SI {si:.1f}")
+
+    # Fronts in the GHG / lost margin plane, coloured by SI
+    plt.figure(figsize=(8, 6))
+    for k, front in enumerate(fronts):
+        points = list(zip(*front))
+        plt.scatter(points[1], points[0], c=points[2], marker='os^v<>'[k % 6], label=f'Scenario {k}')
+    plt.colorbar(label='SI')
+    plt.xlabel('GHG (ton CO2)')
+    plt.ylabel('Lostmargin (€)')
+    plt.legend()
+    plt.show()
@@ -0,0 +1,49 @@
+import os
+
+from benchmark import ScalingBenchmark, compare, load_results, startup_times, write_results
+
+# Size ladder: at size n the BOM has n items and n facilities are generated
+sizes = (10, 30, 100, 300, 1000, 3000, 10000, 30000, 100000)
+seed = 0
+# A stage is not run at a size its extrapolated time exceeds this many seconds at
+time_limit = 60
+# Override the largest size run per stage, e.g. {'model_build': 300} (see benchmark.MAX_SIZES)
+max_sizes = None
+solver_mode = 'persistent'
+
+# Machine-readable results of this run, and the baseline they are compared against per stage and size.
+# The first run (or a run with update_baseline = True) stores its results as the baseline
+results_path = 'output/benchmark_results.json'
+baseline_path = 'benchmark_baseline.json'
+update_baseline = False
+# Ratio of time or peak memory to the baseline above which a stage is reported as a regression
+regression_threshold = 1.25
+
+
+def main():
+    """Run the benchmark with the settings above, compare it with the baseline and write its results."""
+    benchmark = ScalingBenchmark(sizes, seed=seed, time_limit=time_limit, max_sizes=max_sizes, solver_mode=solver_mode)
+    results = benchmark.run()
+
+    # Import time of headless generation and of the MC studies against their targets (see benchmark.STARTUP_TARGETS)
+    results['startup'] = startup_times()
+    for module, startup in results['startup'].items():
+        print(f"import {module}: {startup['time']:.3f} s (target {startup['target']} s): "
+              f"{'met' if startup['met'] else 'missed'}")
+
+    if os.path.exists(baseline_path) and not update_baseline:
+        results['comparison'] = compare(results, load_results(baseline_path), regression_threshold)
+        print("\nComparison with the baseline:")
+        for row in results['comparison']:
+            print(f"{row['stage']:12s} n={row['size']:<7d} time {row['time']:.4f} s (baseline {row['baseline_time']:.4f} s), "
+                  f"peak {row['peak_mb']:.1f} MB (baseline {row['baseline_peak_mb']:.1f} MB): {row['status']}")
+    else:
+        write_results(baseline_path, results)
+        print(f"\nBaseline stored in {baseline_path}")
+    write_results(results_path, results)
+    print(f"Results written to {results_path}")
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import instance_data
+from instrumentation import instrumentation
+from scenario_engine import ScenarioEngine, run_monte_carlo
+
+# Runs the TTS and TTR studies in one pass: every scenario is generated and built once, then solved
+# for TTS and for the three lexicographic TTR stages.
+
+# Engine options, documented in ScenarioEngine
+# LP backend: 'pyomo' (CBC, reference path), 'scipy' (in-process HiGHS) or 'benders' (decomposition per child product)
+backend = 'pyomo'
+decomposition_options = {'processes': 1, 'gap_tolerance': 1e-6}
+# 'cold' or 'persistent' (pyomo backend)
+solver_mode = 'cold'
+# Scenarios stacked into one LP per solver call
+batch_size = 1
+# 'random', 'mc', 'sobol', 'lhs' or 'antithetic'; the same sampling and seed give the studies common random numbers
+sampling = 'random'
+sampling_seed = 0
+# Reduce the LP before solving it, bound scenarios by BOM explosion, screen them against the nominal bases
+presolve = False
+aggregate_flows = False
+prefilter = False
+screening = False
+# Cache of solved scenarios (None disables it)
+cache_path = None
+
+# Mont_carlo simulation.
+confidence_level = 0.95   # confidence level
+Initial_iterations = 20
+Step_size = 10
+tolerance = 0.3
+max_iterations = 50  # Set a maximum to avoid infinite loops
+# Checkpointed log of the scenario results, resumed when re-run (None keeps them in memory only)
+log_path = None
+
+# Time and memory per stage written as JSON (None disables it); trace_memory also traces Python allocations
+metrics_path = None
+trace_memory = False
+
+# Show the box plots of the results (False for headless runs)
+show_plots = True
+
+
+def run_study():
+    """Run the TTS and TTR Monte Carlo study with the settings above and return the engine and the values of every objective."""
+    if metrics_path is not None:
+        instrumentation.enable(trace_memory)
+    with instrumentation.stage('engine'):
+        engine = ScenarioEngine(instance_data.get_instance(), backend=backend, solver_mode=solver_mode,
+                                batch_size=batch_size, sampling=sampling, sampling_seed=sampling_seed,
+                                presolve=presolve, aggregate_flows=aggregate_flows, prefilter=prefilter,
+                                cache_path=cache_path, decomposition_options=decomposition_options,
+                                screening=screening)
+    with instrumentation.stage('monte_carlo'):
+        results = run_monte_carlo(engine, ('TTS', 'TTR'), confidence_level=confidence_level,
+                                  Initial_iterations=Initial_iterations, Step_size=Step_size, tolerance=tolerance,
+                                  max_iterations=max_iterations, log_path=log_path)
+    if metrics_path is not None:
+        instrumentation.write(metrics_path, studies=['TTS', 'TTR'], backend=backend, **engine.run_description())
+    return engine, results
+
+
+def plot_results(results):
+    """Show the box plots of the values of every objective."""
+    # Plotting libraries are only imported to plot
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    #Results in box plot
+    titles = {'TTS': 'TTS (Days)', 'Lostmargin': 'Lostmargin (€)', 'PGHG': 'PGHG (ton CO2)', 'TGHG': 'TGHG (ton CO2)', 'SI': 'SI'}
+    colors = ['#1F618D', '#FF5733', '#33FF57', '#3357FF', '#FF33A1']
+
+    # Create a figure with 5 subplots (1 row, 5 columns)
+    plt.figure(figsize=(20, 6))
+    for i, (metric, values) in enumerate(results.items()):
+        plt.subplot(1, len(results), i + 1)
+        sns.boxplot(data=values, color=colors[i])
+        plt.title(titles[metric], fontsize=18, fontweight='bold')
+        plt.ylabel('Values' if i == 0 else '')
+
+    # Adjust layout for better spacing
+    plt.tight_layout()
+
+    # Show the plot
+    plt.show()
+
+
+if __name__ == '__main__':
+    engine, results = run_study()
+    for metric, values in results.items():
+        print(f"{metric}_values:", values)
+
+    engine.report_stage_times()
+
+    if show_plots:
+        plot_results(results)
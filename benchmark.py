@@ -0,0 +1,260 @@
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from bom import BOM
+from main import Main
+from random_location_generator import RandomLocationGenerator
+from scenario_engine import ScenarioEngine
+
+# Stages of one benchmark run, in order, and the stages each one needs the outputs of
+STAGES = ('bom', 'sample', 'distances', 'tables', 'exports', 'model_build', 'solve_tts', 'solve_ttr')
+REQUIRES = {'bom': (), 'sample': (), 'distances': (), 'tables': ('bom',), 'exports': ('bom', 'distances', 'tables'),
+            'model_build': ('bom', 'distances', 'tables'), 'solve_tts': ('model_build',), 'solve_ttr': ('model_build',)}
+
+# Largest size run per stage: the distances, parameter tables and exports hold items x facilities or
+# facilities x facilities entries, and the number of flows of the models grows with the square of the
+# facilities an item can be made at
+MAX_SIZES = {'bom': 10 ** 5, 'sample': 10 ** 5, 'distances': 1000, 'tables': 1000, 'exports': 1000,
+             'model_build': 100, 'solve_tts': 100, 'solve_ttr': 100}
+
+# Times and peak memory below these are too noisy to flag as a regression or an improvement
+MIN_COMPARED_TIME = 0.01
+MIN_COMPARED_PEAK_MB = 1
+
+# Import time targets in seconds of the modules a headless run starts with: instance generation and the MC studies
+STARTUP_TARGETS = {'main': 0.5, 'scenario_engine': 0.5}
+
+# Bounding box of the facility locations drawn when the shapefile is not available (Europe)
+FALLBACK_BOUNDS = (-10, 30, 35, 60)
+
+
+class ScalingBenchmark:
+    """Time and memory of every stage of generating an instance and solving its models, over a ladder of sizes.
+
+    At size n the BOM has n items and n facilities are generated. Each stage is run once per size and
+    reports its wall time and the peak of the memory Python allocated during it (tracemalloc, which
+    slows the stage down and does not see the memory of the solver). A stage is skipped above its
+    maximum size, when the stages it needs were skipped, or when its time extrapolated from the
+    smaller sizes exceeds time_limit seconds.
+    """
+
+    def __init__(self, sizes, seed=0, time_limit=60, max_sizes=None, min_demand=10, max_demand=100,
+                 shapefile_path='shapefiles/TM_WORLD_BORDERS-0.3.shp', solver_mode='persistent'):
+        self.sizes = sorted(sizes)
+        self.seed = seed
+        self.time_limit = time_limit
+        self.max_sizes = dict(MAX_SIZES, **(max_sizes or {}))
+        self.min_demand = min_demand
+        self.max_demand = max_demand
+        self.shapefile_path = shapefile_path
+        self.solver_mode = solver_mode
+        self.location_generator = None
+
+    def run(self):
+        """Run every stage at every size and return the results."""
+        results = {'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                            'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'seed': self.seed,
+                            'time_limit': self.time_limit, 'sizes': self.sizes},
+                   'stages': {stage: {} for stage in STAGES}}
+        with tempfile.TemporaryDirectory() as directory:
+            for n in self.sizes:
+                state = {'n': n, 'directory': directory, 'done': set()}
+                for stage in STAGES:
+                    record = self._run_stage(stage, state, results['stages'])
+                    results['stages'][stage][str(n)] = record
+                    print(f"{stage} n={n}: " + (f"{record['time']:.4f} s, {record['peak_mb']:.1f} MB"
+                                                 if 'time' in record else f"skipped ({record['skipped']})"))
+        return results
+
+    def _run_stage(self, stage, state, measured):
+        n = state['n']
+        if n > self.max_sizes[stage]:
+            return {'skipped': f'above the maximum size {self.max_sizes[stage]}'}
+        missing = [required for required in REQUIRES[stage] if required not in state['done']]
+        if missing:
+            return {'skipped': f"needs {', '.join(missing)}"}
+        predicted = self._predicted_time(measured[stage], n)
+        if predicted > self.time_limit:
+            return {'skipped': f'predicted time {predicted:.0f} s above the time limit'}
+        setup = getattr(self, f'_setup_{stage}', None)
+        if setup is not None:
+            skipped = setup(state)
+            if skipped:
+                return {'skipped': skipped}
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        elapsed = getattr(self, f'_stage_{stage}')(state)
+        wall_time = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        state['done'].add(stage)
+        return {'time': wall_time if elapsed is None else elapsed, 'peak_mb': peak / 2 ** 20}
+
+    @staticmethod
+    def _predicted_time(records, n):
+        """Extrapolate the time of a stage at size n from its two largest measured sizes."""
+        timed = sorted((int(size), record['time']) for size, record in records.items() if 'time' in record)
+        if not timed:
+            return 0
+        size, last_time = timed[-1]
+        # Growth exponent between the last two sizes, kept between linear and cubic against timing noise
+        exponent = 2
+        if len(timed) > 1 and timed[-2][1] > 0 and last_time > 0:
+            exponent = math.log(last_time / timed[-2][1]) / math.log(size / timed[-2][0])
+        return last_time * (n / size) ** min(max(exponent, 1), 3)
+
+    def _stage_bom(self, state):
+        n = state['n']
+        state['bom'] = BOM(n, max(2, n // 10), 3, 2, self.min_demand, self.max_demand, self.seed)
+
+    def _setup_sample(self, state):
+        if self.location_generator is None:
+            if not os.path.exists(self.shapefile_path):
+                return 'shapefile not found'
+            # Loading the shapefile is done once, outside of the measured stage
+            self.location_generator = RandomLocationGenerator(self.shapefile_path, self.seed, self.min_demand,
+                                                              self.max_demand)
+        np.random.seed(self.seed)
+        return None
+
+    def _stage_sample(self, state):
+        state['locations'] = self.location_generator.sample(state['n'])
+
+    def _setup_distances(self, state):
+        # The shapefile is only needed to sample the locations: without it they are drawn in a bounding box
+        if 'locations' not in state:
+            rng = np.random.default_rng(self.seed)
+            min_x, max_x, min_y, max_y = FALLBACK_BOUNDS
+            state['locations'] = list(zip(rng.uniform(min_x, max_x, state['n']), rng.uniform(min_y, max_y, state['n'])))
+        generator = RandomLocationGenerator.__new__(RandomLocationGenerator)
+        generator.min_demand = self.min_demand
+        np.random.seed(self.seed)
+        generator.create_facilities(state['locations'])
+        state['generator'] = generator
+        return None
+
+    def _stage_distances(self, state):
+        state['generator'].compute_distances()
+
+    def _setup_tables(self, state):
+        # Main asks for its settings on the console: the benchmark sets them and only builds the tables
+        main = Main.__new__(Main)
+        main.report_file = os.path.join(state['directory'], 'instance_report.txt')
+        main.bom = state['bom']
+        main.seed = self.seed
+        main.nodes = state['bom'].get_nodes()
+        main.facilities = state['generator'].get_facilities()
+        main.min_demand = self.min_demand
+        main.max_demand = self.max_demand
+        main.profit_margins = {}
+        main.locality = None
+        state['main'] = main
+        random.seed(self.seed)
+        return None
+
+    def _stage_tables(self, state):
+        main = state['main']
+        main.node_facilities_mapping = main.create_node_facilities_mapping()
+        main.processing_times = main.create_processing_times()
+        main.inventory = main.create_inventory()
+        main.pghg = main.create_pghg()
+
+    def _stage_exports(self, state):
+        directory = state['directory']
+        bom = state['bom']
+        labels = {"nodes": [f"Node {i}" for i in range(bom.n)], "demand": "Demand"}
+        bom.export_bom_matrix_to_json(bom.create_bom_matrix(), os.path.join(directory, 'bom_matrix.json'), labels)
+        generator = state['generator']
+        generator.export_facility_data_to_json(os.path.join(directory, 'facility_data.json'))
+        generator.export_tghg_to_json(os.path.join(directory, 'tghg_data.json'))
+        main = state['main']
+        main.export_processing_times_to_json(os.path.join(directory, 'times.json'))
+        main.export_inventory_to_json(os.path.join(directory, 'inventory.json'))
+        main.export_pghg_to_json(os.path.join(directory, 'pghg.json'))
+
+    def _setup_model_build(self, state):
+        state['instance'] = state['main'].instance()
+        return None
+
+    def _stage_model_build(self, state):
+        engine = ScenarioEngine(state['instance'], solver_mode=self.solver_mode)
+        state['scenario'] = engine.scenarios(1)[0]
+        engine.build_model([state['scenario']], ('TTS', 'TTR'))
+        state['engine'] = engine
+
+    def _stage_solve_tts(self, state):
+        engine = state['engine']
+        engine.solve_batch([state['scenario']], ('TTS',))
+        # Time of the solver calls, without building the model again
+        return engine.stage_times['TTS'][-1]
+
+    def _stage_solve_ttr(self, state):
+        engine = state['engine']
+        engine.solve_batch([state['scenario']], ('TTR',))
+        return sum(engine.stage_times[stage][-1] for stage in ('Lostmargin', 'GHG', 'SI'))
+
+
+def startup_times(targets=None, repeat=3):
+    """Measure the import time of every module in a fresh interpreter and check it against its target."""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    times = {}
+    for module, target in (targets or STARTUP_TARGETS).items():
+        code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+        # The best of a few runs, as the first one may read the modules from a cold disk cache
+        elapsed = min(float(subprocess.run([sys.executable, '-c', code], cwd=directory, capture_output=True, text=True,
+                                           check=True).stdout) for _ in range(repeat))
+        times[module] = {'time': elapsed, 'target': target, 'met': elapsed <= target}
+    return times
+
+
+def write_results(path, results):
+    """Write benchmark results to a JSON file."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(path):
+    """Read benchmark results written by write_results."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, threshold=1.25):
+    """Compare the stages measured in both runs and return one row per stage and size.
+
+    A stage is a regression when its time or peak memory grew by more than threshold times the
+    baseline, and an improvement when it shrank by more than that factor.
+    """
+    rows = []
+    for stage, records in results['stages'].items():
+        for size, record in records.items():
+            base = baseline['stages'].get(stage, {}).get(size)
+            if 'time' not in record or base is None or 'time' not in base:
+                continue
+            row = {'stage': stage, 'size': int(size), 'time': record['time'], 'baseline_time': base['time'],
+                   'peak_mb': record['peak_mb'], 'baseline_peak_mb': base['peak_mb'], 'status': 'unchanged'}
+            ratios = []
+            if max(record['peak_mb'], base['peak_mb']) >= MIN_COMPARED_PEAK_MB:
+                ratios.append(record['peak_mb'] / max(base['peak_mb'], 1e-9))
+            if max(record['time'], base['time']) >= MIN_COMPARED_TIME:
+                ratios.append(record['time'] / max(base['time'], 1e-9))
+            if ratios and max(ratios) > threshold:
+                row['status'] = 'regression'
+            elif ratios and min(ratios) < 1 / threshold:
+                row['status'] = 'improvement'
+            rows.append(row)
+    return rows
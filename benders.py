@@ -0,0 +1,324 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse
+from scipy.optimize import linprog
+
+from instrumentation import instrumentation
+from sparse_lp import SparseLP
+
+# Relative gap between the best solution found and the master bound at which a stage stops
+GAP_TOLERANCE = 1e-6
+# Infeasibility of a subproblem, relative to its largest right-hand side, below which it counts as feasible
+FEASIBILITY_TOLERANCE = 1e-7
+
+# Subproblem chunks of a worker process
+_worker = {}
+
+
+def _init_worker(chunks):
+    _worker['chunks'] = chunks
+
+
+def _solve_worker_chunk(k, u, theta, costs, tolerance):
+    return _solve_chunk(_worker['chunks'][k], u, theta, costs, tolerance)
+
+
+def _cut(chunk, duals, k):
+    """Return the u indices, u coefficients and right-hand side of the cut of the k-th child product of a chunk."""
+    rows = chunk['child_rows'][k]
+    coefficients = -(chunk['H'][rows].T @ duals[rows])
+    indices = np.flatnonzero(coefficients)
+    return indices, coefficients[indices], float(-duals[rows] @ chunk['h'][rows])
+
+
+def _solve_chunk(chunk, u, theta, costs, tolerance):
+    """Solve the flow subproblems of a chunk of child products for the production u.
+
+    Returns the flow cost (None if the flows of a child cannot be routed) and the cuts
+    (theta index or None, u indices, u coefficients, right-hand side) of the violated children.
+    """
+    G, b = chunk['G'], chunk['h'] - chunk['H'] @ u
+    children = chunk['children']
+    if costs:
+        res = linprog(chunk['c'], A_ub=G, b_ub=b, bounds=(0, None), method='highs')
+        if res.status == 0:
+            # The children share no rows or columns, so the duals of each child price its own flow cost
+            values = np.bincount(chunk['col_child'], weights=chunk['c'] * res.x, minlength=len(children))
+            violated = np.flatnonzero(values > theta[children] + tolerance * np.maximum(1, values))
+            return float(values.sum()), [(children[k], *_cut(chunk, res.ineqlin.marginals, k)) for k in violated]
+
+    # Phase one: the least total shortfall s of the BOM rows, G y - s <= b; its duals give the feasibility cuts
+    n_rows, n_flows = G.shape
+    res = linprog(np.concatenate([np.zeros(n_flows), np.ones(n_rows)]),
+                  A_ub=sparse.hstack([G, -sparse.identity(n_rows)], format='csr'), b_ub=b, bounds=(0, None),
+                  method='highs')
+    if res.status != 0:
+        raise RuntimeError(f"HiGHS did not return an optimal solution: {res.message}")
+    shortfall = np.bincount(chunk['row_child'], weights=res.x[n_flows:], minlength=len(children))
+    infeasible = np.flatnonzero(shortfall > FEASIBILITY_TOLERANCE * max(1, np.abs(b).max()))
+    if not len(infeasible):
+        # Flow costs are not needed, or the cost LP failed within the feasibility tolerance
+        return (0.0 if not costs else None), []
+    return None, [(None, *_cut(chunk, res.ineqlin.marginals, k)) for k in infeasible]
+
+
+class BendersLP(SparseLP):
+    """The TTR and TTS LPs of SparseLP solved by Benders decomposition over the flow layer.
+
+    The flows (one column per pair of factories per BOM edge) are most of the LP. The master LP
+    keeps the production, lost sales or TTS columns and the capacity and demand rows, plus one
+    column theta per child product bounding the transport GHG of its flows. Given the production
+    of the master, the flows of every child product form an independent transportation
+    subproblem (its BOM and production/inventory rows). A child whose flows cannot be routed adds
+    a feasibility cut, and a child whose transport GHG is above its theta an optimality cut, until
+    the best feasible solution is within gap_tolerance of the master bound (the certified gap).
+
+    The subproblems only depend on the production, not on the scenario, so the cuts are kept
+    across stages and scenarios, and the master starts from the aggregate balance of every child
+    (producers' production and inventory cover its parents' use). The child products are split
+    into chunks, solved in parallel in a process pool of processes workers. Returns the same
+    results as SparseLP; the certified gap and Benders iterations of every stage are kept in gaps
+    and iterations.
+    """
+
+    def __init__(self, *args, processes=1, chunks=None, gap_tolerance=GAP_TOLERANCE, max_iterations=100, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.processes = processes or os.cpu_count()
+        self.gap_tolerance = gap_tolerance
+        self.max_iterations = max_iterations
+        self.gaps = {'TTS': [], 'Lostmargin': [], 'GHG': [], 'SI': []}
+        self.iterations = {'TTS': [], 'Lostmargin': [], 'GHG': [], 'SI': []}
+        self.pool = None
+
+        # Static rows split into their production (H) and flow (G) columns: H u + G y <= h
+        static = sparse.coo_matrix((self.static_vals, (self.static_rows, self.static_cols)),
+                                   shape=(self.n_static, self.n_u + self.n_y)).tocsr()
+        H = static[:, :self.n_u].tocsr()
+        G = static[:, self.n_u:].tocsc()
+        G_rows = G.tocsr()
+        # Child product of every static row: BOM rows end with their child, production rows are (factory, product)
+        row_child = np.array([key[-1] for key in self.index.bom_rows] + [i for f, i in self.index.factory_product],
+                             dtype=object)
+        # Rows without flows (e.g. production rows of final products) stay in the master
+        has_flows = np.diff(G_rows.indptr) > 0
+        self.master_rows = np.flatnonzero(~has_flows)
+
+        # One subproblem per child product, balanced over the chunks by number of flows
+        flow_child = np.array([flow[1] for flow in self.index.flows], dtype=object)
+        children = list(dict.fromkeys(flow_child))
+        self.n_children = len(children)
+        flows_of = {p: np.flatnonzero(flow_child == p) for p in children}
+        rows_of = {p: np.flatnonzero(has_flows & (row_child == p)) for p in children}
+        n_chunks = min(chunks or self.processes, max(self.n_children, 1))
+        members = [[] for _ in range(n_chunks)]
+        load = np.zeros(n_chunks)
+        for k in sorted(range(self.n_children), key=lambda k: -len(flows_of[children[k]])):
+            chunk = int(np.argmin(load))
+            members[chunk].append(k)
+            load[chunk] += len(flows_of[children[k]])
+
+        flow_cost = self.c_tghg[self.n_u:self.n_u + self.n_y]
+        self.chunks = []
+        # Cuts (theta index or None, u indices, u coefficients, right-hand side) shared by all stages and scenarios
+        self.cuts = []
+        self._cut_keys = set()
+        for chunk_members in members:
+            if not chunk_members:
+                continue
+            rows = np.concatenate([rows_of[children[k]] for k in chunk_members])
+            cols = np.concatenate([flows_of[children[k]] for k in chunk_members])
+            chunk = {'children': np.array(chunk_members), 'G': G_rows[rows][:, cols], 'H': H[rows], 'h': self.static_rhs[rows],
+                     'c': flow_cost[cols],
+                     'row_child': np.repeat(np.arange(len(chunk_members)), [len(rows_of[children[k]]) for k in chunk_members]),
+                     'col_child': np.repeat(np.arange(len(chunk_members)), [len(flows_of[children[k]]) for k in chunk_members])}
+            chunk['child_rows'] = [np.flatnonzero(chunk['row_child'] == k) for k in range(len(chunk_members))]
+            self.chunks.append(chunk)
+            # Every flow leaves one production row and enters one BOM row of its child, so the sum of the rows of
+            # a child is a valid cut: its producers' production and inventory cover the use of its parents
+            for k, child_rows in zip(chunk_members, chunk['child_rows']):
+                coefficients = np.asarray(chunk['H'][child_rows].sum(axis=0)).ravel()
+                indices = np.flatnonzero(coefficients)
+                self._add_cut((None, indices, coefficients[indices], float(chunk['h'][child_rows].sum())))
+        # Master columns: [u | l or TTS | theta per child product]
+        self.theta_col = None
+
+    def close(self):
+        """Shut down the subproblem worker processes."""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def _add_cut(self, cut):
+        theta, indices, coefficients, rhs = cut
+        key = (theta, indices.tobytes(), np.round(coefficients, 9).tobytes(), round(rhs, 9))
+        if key in self._cut_keys:
+            return False
+        self._cut_keys.add(key)
+        self.cuts.append(cut)
+        return True
+
+    def _cut_rows(self, n_cols, optimality):
+        """Return the cuts as rows over the master columns; optimality cuts only when the flow cost matters."""
+        cuts = [cut for cut in self.cuts if optimality or cut[0] is None]
+        rows, cols, vals = [], [], []
+        for row, (theta, indices, coefficients, rhs) in enumerate(cuts):
+            rows.append(np.full(len(indices), row))
+            cols.append(indices)
+            vals.append(coefficients)
+            if theta is not None:
+                rows.append([row])
+                cols.append([self.theta_col + theta])
+                vals.append([-1.0])
+        A = sparse.coo_matrix((np.concatenate(vals or [[]]), (np.concatenate(rows or [[]]).astype(int),
+                                                              np.concatenate(cols or [[]]).astype(int))),
+                              shape=(len(cuts), n_cols))
+        return A, np.array([cut[3] for cut in cuts], dtype=float)
+
+    def _subproblems(self, u, theta, costs):
+        """Solve the flow subproblems for the production u and return the flow cost (None if infeasible) and the new cuts."""
+        with instrumentation.stage('subproblems'):
+            if self.processes > 1 and len(self.chunks) > 1:
+                if self.pool is None:
+                    self.pool = ProcessPoolExecutor(self.processes, initializer=_init_worker, initargs=(self.chunks,))
+                n = len(self.chunks)
+                solved = list(self.pool.map(_solve_worker_chunk, range(n), [u] * n, [theta] * n, [costs] * n,
+                                            [self.gap_tolerance] * n))
+            else:
+                solved = [_solve_chunk(chunk, u, theta, costs, self.gap_tolerance) for chunk in self.chunks]
+        new_cuts = sum(self._add_cut(cut) for _, cuts in solved for cut in cuts)
+        if any(flow_cost is None for flow_cost, _ in solved):
+            return None, new_cuts
+        return sum(flow_cost for flow_cost, _ in solved), new_cuts
+
+    def _master_problem(self, A, b, bounds):
+        """Drop the flow columns and rows of a SparseLP problem and add the theta columns."""
+        keep = np.r_[0:self.n_u, self.n_u + self.n_y:A.shape[1]]
+        rows = np.r_[self.master_rows, self.n_static:A.shape[0]]
+        self.theta_col = len(keep)
+        A = sparse.hstack([A[rows][:, keep], sparse.csr_matrix((len(rows), self.n_children))], format='csr')
+        bounds = np.vstack([bounds[keep], np.tile([0, np.inf], (self.n_children, 1))])
+        return A, b[rows], bounds
+
+    def _master_cost(self, c, flows=False):
+        """Return a cost vector of the SparseLP layout over the master columns, with the flow cost on theta if flows."""
+        keep = np.r_[0:self.n_u, self.n_u + self.n_y:len(c)]
+        return np.concatenate([c[keep], np.full(self.n_children, 1.0 if flows else 0.0)])
+
+    def _benders(self, stage, c, A, b, bounds, x, costs, ghg_bound=None):
+        """Minimize c over the master and flows from the feasible master solution x.
+
+        costs: whether the flow cost is in the objective or, with ghg_bound, in the GHG bound row.
+        Returns the best solution found, its flow cost and objective value.
+        """
+        u = slice(0, self.n_u)
+        flows_in_objective = bool(c[self.theta_col:].any())
+
+        def value(x, flow_cost):
+            return float(c[:self.theta_col] @ x[:self.theta_col]) + (flow_cost if flows_in_objective else 0.0)
+
+        flow_cost = self._subproblems(x[u], x[self.theta_col:], costs)[0] if costs else 0.0
+        upper = value(x, flow_cost)
+        lower = -np.inf
+        for iteration in range(1, self.max_iterations + 1):
+            cut_A, cut_b = self._cut_rows(A.shape[1], optimality=costs)
+            res = self._linprog(c, sparse.vstack([A, cut_A], format='csr'), np.concatenate([b, cut_b]), bounds, stage)
+            lower = max(lower, res.fun)
+            candidate_cost, new_cuts = self._subproblems(res.x[u], res.x[self.theta_col:], costs)
+            if candidate_cost is not None and (ghg_bound is None or float(self.c_pghg[u] @ res.x[u]) + candidate_cost
+                                               <= ghg_bound + self.gap_tolerance * (self.n_children + abs(ghg_bound))):
+                candidate = value(res.x, candidate_cost)
+                if candidate < upper:
+                    x, flow_cost, upper = res.x, candidate_cost, candidate
+            # Without new cuts the master solution satisfies every subproblem, and the bound cannot improve
+            if upper - lower <= self.gap_tolerance * max(1, abs(upper)) or not new_cuts:
+                break
+        self.gaps[stage].append(max(upper - lower, 0.0) / max(1, abs(upper)))
+        self.iterations[stage].append(iteration)
+        return x, flow_cost, upper
+
+    def solve_tts(self, process_time, capacity, demand, disruption_rate, tts_bound=None):
+        """Solve the TTS model of one scenario and return the time to survive."""
+        with instrumentation.stage('build'):
+            c, A, b, bounds = self.tts_problem(process_time, capacity, demand, disruption_rate, tts_bound)
+            A, b, bounds = self._master_problem(A, b, bounds)
+            c = self._master_cost(c)
+        # Surviving no time without production is always feasible
+        x, _, value = self._benders('TTS', c, A, b, bounds, np.zeros(len(c)), costs=False)
+        return float(-value)
+
+    def solve_tts_batch(self, scenarios, tts_bounds=None):
+        """Solve several TTS scenarios one after the other (the cuts found for one serve the next)."""
+        if tts_bounds is None:
+            tts_bounds = [None] * len(scenarios)
+        return [self.solve_tts(*scenario, tts_bound) for scenario, tts_bound in zip(scenarios, tts_bounds)]
+
+    def solve_ttr(self, process_time, capacity, demand, disruption_rate, ttr, relaxation=1.001, lost_sales_bound=None):
+        """Solve the three lexicographic TTR stages of one scenario.
+
+        Returns a dictionary with the lost margin, the PGHG and TGHG of the GHG stage and the SI.
+        """
+        with instrumentation.stage('build'):
+            A, b, bounds = self.ttr_problem(process_time, capacity, demand, disruption_rate, ttr, lost_sales_bound)
+            A, b, bounds = self._master_problem(A, b, bounds)
+        u = slice(0, self.n_u)
+        l = slice(self.n_u, self.n_u + len(self.final_products))
+
+        self.last_stage_times = []
+
+        # Step 1: Optimize the lost margin, from producing nothing and losing the demand the inventory does not cover
+        c_lostmargin = self._master_cost(self.c_lostmargin)
+        x = np.zeros(A.shape[1])
+        x[l] = np.clip(bounds[l, 1] - self.final_inventory, bounds[l, 0], bounds[l, 1])
+        start = time.perf_counter()
+        x, _, lostmargin = self._benders('Lostmargin', c_lostmargin, A, b, bounds, x, costs=False)
+        self.last_stage_times.append(time.perf_counter() - start)
+
+        # Step 2: Optimize GHG with the lost margin fixed at its optimal value
+        c_ghg = self._master_cost(self.c_pghg, flows=True)
+        A = sparse.vstack([A, sparse.csr_matrix(c_lostmargin)], format='csr')
+        b = np.append(b, relaxation * lostmargin)
+        start = time.perf_counter()
+        x, tghg_value, ghg = self._benders('GHG', c_ghg, A, b, bounds, x, costs=True)
+        self.last_stage_times.append(time.perf_counter() - start)
+        pghg_value = float(self.c_pghg[u] @ x[u])
+
+        # Step 3: Optimize SI with GHG fixed at its optimal value
+        A = sparse.vstack([A, sparse.csr_matrix(c_ghg)], format='csr')
+        b = np.append(b, relaxation * ghg)
+        start = time.perf_counter()
+        x, _, si = self._benders('SI', -self._master_cost(self.c_si), A, b, bounds, x, costs=True,
+                                 ghg_bound=relaxation * ghg)
+        self.last_stage_times.append(time.perf_counter() - start)
+
+        return {'Lostmargin': float(lostmargin), 'PGHG': pghg_value, 'TGHG': float(tghg_value), 'SI': float(-si)}
+
+
+def compare(instance, n_scenarios, studies=('TTS', 'TTR'), **benders_options):
+    """Solve the first n_scenarios scenarios with the monolithic scipy LP and with Benders decomposition.
+
+    Returns the solve time of both backends, the largest difference of every objective relative to
+    its monolithic value, and the largest certified gap and mean number of iterations of every stage.
+    """
+    from scenario_engine import STUDY_METRICS, ScenarioEngine
+
+    monolithic = ScenarioEngine(instance, backend='scipy')
+    decomposed = ScenarioEngine(instance, backend='benders', decomposition_options=benders_options)
+    scenarios = monolithic.scenarios(n_scenarios)
+    times = {}
+    results = {}
+    for name, engine in (('monolithic', monolithic), ('benders', decomposed)):
+        start = time.perf_counter()
+        results[name] = engine.solve_scenarios(scenarios, studies)
+        times[name] = time.perf_counter() - start
+    decomposed.lp.close()
+    metrics = [metric for study in studies for metric in STUDY_METRICS[study]]
+    differences = {metric: max(abs(b[metric] - m[metric]) / max(1, abs(m[metric]))
+                               for m, b in zip(results['monolithic'], results['benders']))
+                   for metric in metrics}
+    lp = decomposed.lp
+    return {'times': times, 'differences': differences,
+            'gaps': {stage: max(gaps) for stage, gaps in lp.gaps.items() if gaps},
+            'iterations': {stage: float(np.mean(its)) for stage, its in lp.iterations.items() if its}}
@@ -1,11 +1,13 @@
 import json
+import os
 import random
 import sys
 
-import matplotlib.pyplot as plt
 import networkx as nx
 import numpy as np
 
+from instrumentation import instrumentation
+
 class BOM:
     def __init__(self, n, num_roots, max_depth, max_parents, min_demand, max_demand, seed=None):
         self.n = n
@@ -23,8 +25,10 @@ class BOM:
         if seed is not None:
             random.seed(seed)
 
-        self.create_connected_dag_with_multiple_parents()
-        self.ensure_graph_connected()
+        with instrumentation.stage('dag'):
+            self.create_connected_dag_with_multiple_parents()
+        with instrumentation.stage('connect'):
+            self.ensure_graph_connected()
         self.update_leaf_nodes()
         self.update_root_nodes()
 
@@ -32,7 +36,8 @@ class BOM:
                   self.G.nodes}
         nx.set_node_attributes(self.G, demand, 'demand')
 
-        self.calculate_node_depths()  # Compute node depths after graph is fully constructed
+        with instrumentation.stage('depths'):
+            self.calculate_node_depths()  # Compute node depths after graph is fully constructed
 
     def update_leaf_nodes(self):
         """Update the list of leaf nodes based on the current graph structure."""
@@ -111,6 +116,28 @@ class BOM:
         self.update_leaf_nodes()
         self.update_root_nodes()
 
+    def add_items(self, num_items):
+        """Add num_items items on top of the BOM, keeping the existing items, edges and depths.
+
+        As in the constructor, every new item gets max_parents parents drawn from all items, so a
+        root item that becomes the parent of a new item is no longer a root (and its demand is set
+        to 0), while the new roots get a random demand. Roots and depths are updated for the new
+        items only. The draws are seeded by the seed and the number of items, so the same growth
+        steps give the same BOM.
+        """
+        rng = random.Random(f'{self.seed}:{self.n}')
+        for i in range(self.n, self.n + num_items):
+            parents = rng.sample(list(self.G.nodes), min(self.G.number_of_nodes(), self.max_parents))
+            self.G.add_node(i, demand=rng.randint(self.min_demand, self.max_demand))
+            for parent in parents:
+                self.G.add_edge(parent, i, weight=rng.randint(1, 10))
+                self.G.nodes[parent]['demand'] = 0
+            # A new item is only reached through its parents, so no existing depth can shrink
+            self.depth[i] = min(self.depth[parent] for parent in parents) + 1
+        self.root_nodes = [node for node in self.root_nodes if self.G.out_degree(node) == 0] + \
+                          [node for node in range(self.n, self.n + num_items) if self.G.out_degree(node) == 0]
+        self.n += num_items
+
     def calculate_node_depths(self):
         """Compute and update the depth of each node."""
         # Initialize depth for root nodes
@@ -156,6 +183,9 @@ class BOM:
         return longest_path_length, path
 
     def visualize_graph(self, filename):
+        # matplotlib is only imported when a figure is drawn, so headless generation does not load it
+        import matplotlib.pyplot as plt
+
         # Define scaling factors based on the number of nodes
         num_nodes = len(self.G.nodes)
         node_size = max(500, 2000 / num_nodes)  # Ensure nodes are large enough to see, but scale down with more nodes
@@ -217,9 +247,10 @@ class BOM:
 
         return bom_matrix
 
-    def run(self):
+    def run(self, visualize=True, output_dir='output'):
+        os.makedirs(output_dir, exist_ok=True)
         # Open a file to write the print statements
-        with open('output/BOM_output.txt', 'w') as f:
+        with open(os.path.join(output_dir, 'BOM_output.txt'), 'w') as f:
             # Redirect stdout to the file
             original_stdout = sys.stdout
             sys.stdout = f
@@ -249,7 +280,9 @@ class BOM:
             print(f"Root nodes are {self.root_nodes}")
 
             # Visualize the tree and save the figure
-            self.visualize_graph('output/BOM_visualization.png')
+            if visualize:
+                with instrumentation.stage('visualize'):
+                    self.visualize_graph(os.path.join(output_dir, 'BOM_visualization.png'))
 
             # Create and print the BOM matrix
             bom_matrix = self.create_bom_matrix()
@@ -263,7 +296,8 @@ class BOM:
             }
 
             # Export BOM matrix to JSON
-            self.export_bom_matrix_to_json(bom_matrix, 'output/bom_matrix.json', labels)
+            with instrumentation.stage('export'):
+                self.export_bom_matrix_to_json(bom_matrix, os.path.join(output_dir, 'bom_matrix.json'), labels)
 
             # Restore stdout
             sys.stdout = original_stdout
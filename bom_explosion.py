@@ -0,0 +1,141 @@
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+from flow_index import FlowIndex
+
+# Relative slack on the bounds passed to the solver, so rounding never cuts off the LP optimum
+BOUND_TOLERANCE = 1e-9
+
+
+class BOMExplosion:
+    """Analytic bounds on the TTS and TTR answers from the BOM explosion of the demand.
+
+    A[child, parent] holds the BOM quantities of the edges the LP has BOM constraints for. Summing
+    the BOM and production/inventory constraints over the factories gives, for the total production
+    U of every product, (I - A) U >= Demand * T - Inventory with (I - A)^-1 >= 0, so
+    U >= T * g - h with the gross requirements g = (I - A)^-1 Demand and the exploded inventory
+    h = (I - A)^-1 Inventory. Bounding U by the capacity available to each product, and the
+    process time of all production by the total capacity, bounds TTS from above and the lost sales
+    of TTR from below without an LP. (I - A) is factorized once; all scenarios are bounded with one
+    sparse solve on the stacked scenario arrays.
+    """
+
+    def __init__(self, products, factories, final_products, BOM, factory_product, inventory, profitmargin=None):
+        self.products = list(products)
+        self.factories = list(factories)
+        self.final_products = list(final_products)
+        self.index = FlowIndex(BOM, factory_product)
+        fp = self.index.factory_product
+        product_pos = {p: k for k, p in enumerate(self.products)}
+        n_products = len(self.products)
+
+        # The LP only has BOM constraints for children some factory produces
+        edges = [(child, parent) for (child, parent) in BOM if self.index.product_factories.get(child)]
+        A = sparse.coo_matrix(([BOM[edge] for edge in edges],
+                               ([product_pos[child] for child, parent in edges],
+                                [product_pos[parent] for child, parent in edges])),
+                              shape=(n_products, n_products))
+        self.lu = splu(sparse.csc_matrix(sparse.identity(n_products) - A))
+
+        self.final_pos = np.array([product_pos[i] for i in self.final_products], dtype=int)
+        # (I - A)^-1 restricted to the final product columns: units of each product in one final product
+        unit = np.zeros((n_products, len(self.final_products)))
+        unit[self.final_pos, np.arange(len(self.final_products))] = 1
+        self.final_explosion = self.lu.solve(unit)
+
+        inventory_vector = np.zeros(n_products)
+        for key in fp:
+            inventory_vector[product_pos[key[1]]] += inventory[key]
+        self.final_inventory = inventory_vector[self.final_pos]
+        self.exploded_inventory = self.lu.solve(inventory_vector)
+
+        # (factory, product) pair -> its factory and its product
+        self.fp_factory = np.array([self.factories.index(f) for f, i in fp], dtype=int)
+        self.fp_product = np.array([product_pos[i] for f, i in fp], dtype=int)
+        self.profitmargin = None
+        if profitmargin is not None:
+            self.profitmargin = np.array([profitmargin[i] for i in self.final_products], dtype=float)
+
+    def scenario_arrays(self, scenarios):
+        """Stack (process_time, capacity, demand, disruption_rate) scenarios into arrays with one row per scenario."""
+        fp = self.index.factory_product
+        pt = np.array([[process_time[key] for key in fp] for process_time, _, _, _ in scenarios], dtype=float)
+        cap = np.array([[capacity[f] * (1 - disruption_rate[f]) for f in self.factories]
+                        for _, capacity, _, disruption_rate in scenarios], dtype=float)
+        dem = np.array([[demand[i] for i in self.final_products] for _, _, demand, _ in scenarios], dtype=float)
+        return pt, cap, dem
+
+    def gross_requirements(self, dem):
+        """Return the units of every product needed to make the demand rows of dem."""
+        return dem @ self.final_explosion.T
+
+    def production_rates(self, pt, cap):
+        """Return the most units of each product a scenario can make per unit of time, and its cheapest process time."""
+        n_scenarios = len(pt)
+        rate = np.zeros((n_scenarios, len(self.products)))
+        with np.errstate(divide='ignore'):
+            np.add.at(rate.T, self.fp_product, (cap[:, self.fp_factory] / pt).T)
+        fastest = np.full((n_scenarios, len(self.products)), np.inf)
+        np.minimum.at(fastest.T, self.fp_product, pt.T)
+        fastest[np.isinf(fastest)] = 0
+        return rate, fastest
+
+    def tts_upper_bound(self, pt, cap, dem):
+        """Return an upper bound on the TTS of every scenario."""
+        g = self.gross_requirements(dem)
+        h = self.exploded_inventory
+        rate, fastest = self.production_rates(pt, cap)
+
+        # Every product: T * g - h <= T * rate
+        with np.errstate(divide='ignore', invalid='ignore'):
+            per_product = np.where(g > rate, h / (g - rate), np.inf).min(axis=1)
+
+            # All production: sum_p fastest_p * max(0, T * g_p - h_p) <= T * total capacity, which
+            # holds for every T up to the smallest ratio over the products sorted by h_p / g_p
+            order = np.argsort(np.where(g > 0, h / g, np.inf), axis=1)
+            slope = np.cumsum(np.take_along_axis(fastest * g, order, axis=1), axis=1) - cap.sum(axis=1)[:, None]
+            offset = np.cumsum(np.take_along_axis(fastest * h[None, :], order, axis=1), axis=1)
+            total = np.where(slope > 0, offset / slope, np.inf).min(axis=1)
+        return np.maximum(np.minimum(per_product, total), 0)
+
+    def lost_sales_lower_bound(self, pt, cap, dem, ttr):
+        """Return a lower bound on the lost sales of every final product and scenario for a TTR."""
+        rate, _ = self.production_rates(pt, cap)
+        # Every product p limits the sales of final product i to (TTR * rate_p + h_p) / explosion[p, i]
+        supply = ttr * rate + self.exploded_inventory
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sales = np.where(self.final_explosion[None, :, :] > 0,
+                             supply[:, :, None] / self.final_explosion[None, :, :], np.inf).min(axis=1)
+        return np.clip(dem * ttr - sales, 0, dem * ttr)
+
+    def lostmargin_bounds(self, pt, cap, dem, ttr):
+        """Return lower and upper bounds on the lost margin of every scenario.
+
+        The upper bound is the lost margin of selling the final product inventory only.
+        """
+        lower = self.lost_sales_lower_bound(pt, cap, dem, ttr) @ self.profitmargin
+        upper = np.clip(dem * ttr - self.final_inventory, 0, None) @ self.profitmargin
+        return lower, upper
+
+    def scenario_bounds(self, scenarios, ttr=None):
+        """Return the bounds of a list of scenarios and which of them are decided without an LP.
+
+        'TTS' is the TTS upper bound. 'TTS_decided' flags scenarios whose TTS is known without an LP,
+        'TTS_value': those that cannot survive at all and those that cannot produce anything, whose
+        TTS is the bound set by the final product inventory. With ttr, 'Lost_sales' is the lower
+        bound on the lost sales of every final product and 'Lostmargin_decided' flags scenarios
+        whose lower and upper lost margin bounds meet.
+        """
+        pt, cap, dem = self.scenario_arrays(scenarios)
+        tts = self.tts_upper_bound(pt, cap, dem)
+        rate, _ = self.production_rates(pt, cap)
+        bounds = {'TTS': tts * (1 + BOUND_TOLERANCE), 'TTS_value': tts,
+                  'TTS_decided': (tts <= 0) | ~(rate > 0).any(axis=1)}
+        if ttr is not None:
+            lost_sales = self.lost_sales_lower_bound(pt, cap, dem, ttr)
+            bounds['Lost_sales'] = lost_sales * (1 - BOUND_TOLERANCE)
+            if self.profitmargin is not None:
+                lower, upper = self.lostmargin_bounds(pt, cap, dem, ttr)
+                bounds['Lostmargin_decided'] = upper - lower <= BOUND_TOLERANCE * np.maximum(upper, 1)
+        return bounds
@@ -0,0 +1,143 @@
+import itertools
+
+import numpy as np
+from scipy.cluster.vq import kmeans2
+from scipy.spatial.distance import cdist
+
+# Entries of the distance matrix a step of fast forward selection evaluates at a time
+SELECTION_CHUNK = 2 ** 22
+
+
+class DisruptionLibrary:
+    """Disruption scenarios over the factories of an instance.
+
+    A disruption set maps disrupted factories to their disruption rate. Sets of 1 to max_size
+    factories are enumerated, every factory taking each of the given rates, or sampled. A set's
+    weight is its probability when every factory fails independently with failure_probability
+    (uniform weights by default), normalized over the library. The fixed disruptions of the
+    instance apply in every scenario, as in the scenarios of ScenarioEngine (a presolved engine has
+    already removed the factories they shut down), so their factories are not disrupted again.
+    """
+
+    def __init__(self, factories, capacity, max_size=2, rates=(1.0,), failure_probability=None, fixed_disruption=None):
+        self.fixed_disruption = dict(fixed_disruption or {})
+        self.factories = [f for f in factories if f not in self.fixed_disruption]
+        self.capacity = capacity
+        self.max_size = max_size
+        self.rates = list(rates)
+        # factory -> probability that it is disrupted
+        self.failure_probability = failure_probability
+
+    def enumerate(self):
+        """Return every disruption set of 1 to max_size factories and their weights."""
+        disruptions = []
+        for size in range(1, self.max_size + 1):
+            for disrupted in itertools.combinations(self.factories, size):
+                for rates in itertools.product(self.rates, repeat=size):
+                    disruptions.append(dict(zip(disrupted, rates)))
+        return disruptions, self.weights(disruptions)
+
+    def sample(self, n, seed=0):
+        """Return n disruption sets with a size drawn uniformly from 1 to max_size, and their weights."""
+        rng = np.random.default_rng(seed)
+        disruptions = []
+        for size in rng.integers(1, self.max_size + 1, size=n):
+            disrupted = rng.choice(len(self.factories), size=size, replace=False)
+            disruptions.append({self.factories[f]: self.rates[r]
+                                for f, r in zip(disrupted, rng.integers(len(self.rates), size=size))})
+        return disruptions, self.weights(disruptions)
+
+    def weights(self, disruptions):
+        """Return the normalized weights of disruption sets."""
+        if self.failure_probability is None:
+            weights = np.ones(len(disruptions))
+        else:
+            weights = np.array([np.prod([self.failure_probability[f] if f in disruption else 1 - self.failure_probability[f]
+                                         for f in self.factories]) for disruption in disruptions])
+        return weights / weights.sum()
+
+    def signatures(self, disruptions):
+        """Return the capacity-loss signature of every disruption set, one row of lost capacity per set."""
+        signatures = np.zeros((len(disruptions), len(self.factories)))
+        position = {f: k for k, f in enumerate(self.factories)}
+        for row, disruption in enumerate(disruptions):
+            for f, rate in disruption.items():
+                signatures[row, position[f]] = self.capacity[f] * rate
+        return signatures
+
+    def scenarios(self, disruptions, processtime, capacity, demand):
+        """Return (processtime, capacity, demand, disruptionrate) scenarios of the disruption sets at the given parameters."""
+        scenarios = []
+        for disruption in disruptions:
+            disruptionrate = {f: 0 for f in self.factories}
+            disruptionrate.update(disruption)
+            disruptionrate.update(self.fixed_disruption)
+            scenarios.append((processtime, capacity, demand, disruptionrate))
+        return scenarios
+
+
+def fast_forward_selection(signatures, weights, n_representatives):
+    """Select representatives by fast forward selection and return their indices and weights.
+
+    Representatives are added one at a time, each time the scenario that most reduces the weighted
+    signature distance of all scenarios to their nearest representative; every scenario then
+    passes its weight on to its nearest representative. The N x N distance matrix is the only
+    quadratic array: the cost of the candidates is evaluated SELECTION_CHUNK entries at a time.
+    """
+    n = len(signatures)
+    distance = cdist(signatures, signatures)
+    # Distance of every scenario to its nearest representative so far
+    nearest = np.full(n, np.inf)
+    chunk = max(1, SELECTION_CHUNK // max(n, 1))
+    selected = []
+    cost = np.empty(n)
+    for _ in range(min(n_representatives, n)):
+        for start in range(0, n, chunk):
+            cost[start:start + chunk] = weights @ np.minimum(nearest[:, None], distance[:, start:start + chunk])
+        cost[selected] = np.inf
+        best = int(np.argmin(cost))
+        selected.append(best)
+        nearest = np.minimum(nearest, distance[:, best])
+    owner = np.argmin(distance[:, selected], axis=1)
+    return np.array(selected), np.bincount(owner, weights=weights, minlength=len(selected))
+
+
+def cluster_selection(signatures, weights, n_representatives, seed=0):
+    """Cluster the signatures with k-means and return the member nearest to each centroid and the cluster weights."""
+    centroids, labels = kmeans2(signatures, min(n_representatives, len(signatures)), minit='++', seed=seed)
+    selected, selected_weights = [], []
+    for cluster in np.unique(labels):
+        members = np.flatnonzero(labels == cluster)
+        selected.append(members[np.argmin(np.linalg.norm(signatures[members] - centroids[cluster], axis=1))])
+        selected_weights.append(weights[members].sum())
+    return np.array(selected), np.array(selected_weights)
+
+
+REDUCTION_METHODS = {'fast_forward': fast_forward_selection, 'cluster': cluster_selection}
+
+
+def reduce_scenarios(library, disruptions, weights, n_representatives, method='fast_forward'):
+    """Return the representative disruption sets and their weights."""
+    selected, selected_weights = REDUCTION_METHODS[method](library.signatures(disruptions), weights, n_representatives)
+    return [disruptions[k] for k in selected], selected_weights
+
+
+def compare_reduction(engine, library, disruptions, weights, n_representatives, studies=('TTS',), method='fast_forward'):
+    """Solve all disruption sets and a reduced subset at the nominal parameters and compare the weighted means.
+
+    Returns the reduction ratio and, per objective, the full and reduced estimates and the relative error.
+    """
+    instance = engine.instance
+    representatives, representative_weights = reduce_scenarios(library, disruptions, weights, n_representatives, method)
+    full = engine.solve_scenarios(library.scenarios(disruptions, instance['processtime'], instance['capacity'],
+                                                    instance['demand']), studies)
+    reduced = engine.solve_scenarios(library.scenarios(representatives, instance['processtime'], instance['capacity'],
+                                                       instance['demand']), studies)
+    report = {'scenarios': len(disruptions), 'representatives': len(representatives),
+              'reduction_ratio': len(disruptions) / len(representatives)}
+    for metric in full[0]:
+        full_mean = float(weights @ np.array([result[metric] for result in full]))
+        reduced_mean = float(representative_weights @ np.array([result[metric] for result in reduced]))
+        report[metric] = {'full': full_mean, 'reduced': reduced_mean,
+                          'error': abs(reduced_mean - full_mean) / max(abs(full_mean), 1e-12)}
+    return report
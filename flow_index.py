@@ -0,0 +1,70 @@
+# Parent product of aggregated flows, which carry a child between two factories for all its parents there
+AGGREGATED = '*'
+
+
+class FlowIndex:
+    """Precomputed lookups over the factory/product/BOM structure of the supply chain LP.
+
+    Every lookup the model builders need (which factories make a product, which flows
+    leave a factory for a product, which flows feed each BOM constraint) is answered from a
+    dictionary, so building the flows and constraints is linear in the number of flows and
+    constraints produced.
+
+    excluded_flows are left out of the model. With aggregate=True the flows of a child between
+    two factories are merged over the parents using it at the receiving factory into one
+    (a, child, c, AGGREGATED) flow, and the BOM constraints of those parents into one row.
+    idle_production lists (factory, product) pairs producing nothing in any scenario: a BOM row
+    whose left-hand side only has such pairs is implied by their capacity rows and left out.
+    """
+
+    def __init__(self, BOM, factory_product, excluded_flows=(), aggregate=False, idle_production=()):
+        # Drop duplicate (factory, product) pairs while keeping the input order
+        self.factory_product = list(dict.fromkeys(factory_product))
+        self.aggregate = aggregate
+        excluded = set(excluded_flows)
+
+        # product -> factories producing it, factory -> products it produces
+        self.product_factories = {}
+        self.factory_products = {}
+        for factory, product in self.factory_product:
+            self.product_factories.setdefault(product, []).append(factory)
+            self.factory_products.setdefault(factory, []).append(product)
+
+        # BOM constraints: (factory, parent, child), or (factory, child) when aggregated,
+        # -> ([(factory, parent, quantity)] on the left-hand side, flows on the right-hand side)
+        self.bom_rows = {}
+        for (child, parent) in BOM.keys():
+            if not self.product_factories.get(child):
+                continue
+            for c in self.product_factories.get(parent, []):
+                key = (c, child) if aggregate else (c, parent, child)
+                self.bom_rows.setdefault(key, ([], []))[0].append((c, parent, BOM[child, parent]))
+
+        # Flows (a, child, c, parent) between every producer of a child and every producer of its parent
+        self.flows = []
+        # (factory, product) -> flows shipping that product out of that factory
+        self.flows_out = {key: [] for key in self.factory_product}
+        seen = set()
+        for (child, parent) in BOM.keys():
+            for a in self.product_factories.get(child, []):
+                for c in self.product_factories.get(parent, []):
+                    flow = (a, child, c, parent)
+                    if flow in excluded:
+                        continue
+                    if aggregate:
+                        flow = (a, child, c, AGGREGATED)
+                        if flow in seen:
+                            continue
+                        seen.add(flow)
+                    self.flows.append(flow)
+                    self.flows_out[a, child].append(flow)
+                    self.bom_rows[(c, child) if aggregate else (c, parent, child)][1].append(flow)
+
+        idle = set(idle_production)
+        if idle:
+            self.bom_rows = {key: (u_terms, inflows) for key, (u_terms, inflows) in self.bom_rows.items()
+                             if not all((h, j) in idle for (h, j, quantity) in u_terms)}
+
+    def factory_relations(self):
+        """Return the (factory, factory) pairs connected by at least one flow."""
+        return list(dict.fromkeys((a, c) for (a, b, c, d) in self.flows))
@@ -0,0 +1,198 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+# Instance entries keyed by tuples, sent as lists of [key..., value] rows in JSON
+TUPLE_KEYED = ('BOM', 'pghg', 'distance', 'inventory', 'processtime')
+
+# Warm state of a worker process: the generation function, its imports and a generator with the shapefile loaded
+_worker = {}
+
+
+def instance_to_json(instance):
+    """Return an instance dictionary in a form json.dumps accepts."""
+    data = dict(instance)
+    for key in TUPLE_KEYED:
+        data[key] = [[*index, value] for index, value in instance[key].items()]
+    return data
+
+
+def instance_from_json(data):
+    """Return the instance dictionary of a form made by instance_to_json."""
+    instance = dict(data)
+    for key in TUPLE_KEYED:
+        instance[key] = {tuple(row[:-1]): row[-1] for row in data[key]}
+    instance['factory_product'] = [tuple(pair) for pair in data['factory_product']]
+    instance['disruption_bounds'] = {f: tuple(bounds) for f, bounds in data['disruption_bounds'].items()}
+    return instance
+
+
+def _init_worker(shapefile_path):
+    from pipeline import generate_instance
+    from random_location_generator import RandomLocationGenerator
+
+    _worker['generate'] = generate_instance
+    # The seed and demand range are set by every request
+    _worker['generator'] = RandomLocationGenerator(shapefile_path, 0, 10, 100)
+
+
+def _ready():
+    return os.getpid()
+
+
+def _generate(settings, output_dir):
+    start = time.perf_counter()
+    data = instance_to_json(_worker['generate'](settings, output_dir, _worker['generator']))
+    return data, 1000 * (time.perf_counter() - start)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path != '/status':
+            self._reply(404, {'error': f'Unknown path {self.path}'})
+            return
+        self._reply(200, self.server.service.status())
+
+    def do_POST(self):
+        if self.path != '/instance':
+            self._reply(404, {'error': f'Unknown path {self.path}'})
+            return
+        # Browsers send cross-site form posts without preflight only as form or text content types
+        if self.headers.get('Content-Type', '').split(';')[0].strip().lower() != 'application/json':
+            self._reply(415, {'error': 'Requests must be sent as Content-Type: application/json'})
+            return
+        service = self.server.service
+        start = time.perf_counter()
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            output_dir = service.output_path(request.get('output_dir'))
+            data, generate_ms = service.pool.submit(_generate, request.get('settings', {}), output_dir).result()
+        except Exception as error:
+            service.record(None)
+            # Invalid settings (e.g. num_locations out of range) and output directories are the client's error
+            self._reply(400 if isinstance(error, (ValueError, KeyError)) else 500, {'error': f'{type(error).__name__}: {error}'})
+            return
+        latency_ms = 1000 * (time.perf_counter() - start)
+        service.record(latency_ms)
+        self._reply(200, {'latency_ms': latency_ms, 'generate_ms': generate_ms, 'instance': data})
+
+    def log_message(self, format, *args):
+        # Requests are counted in the status instead of logged to the console
+        pass
+
+
+class GeneratorService:
+    """Long-running local HTTP service generating instances with warm worker processes.
+
+    Each of the workers processes imports the generator once and keeps a RandomLocationGenerator
+    with the shapefile loaded and its country geometries indexed, so a request only pays for
+    generating the instance. POST /instance with a JSON body {"settings": {...}} (the settings of
+    Main, see main.SETTINGS, plus optionally "output_dir" for the files Main writes) answers with the
+    instance, as made by instance_to_json, and its latency in milliseconds; GET /status reports the
+    requests served. Requests are handled concurrently, up to one per worker. Output directories are
+    relative to output_root and may not leave it; requests must be sent as application/json.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8765, workers=None, shapefile_path='shapefiles/TM_WORLD_BORDERS-0.3.shp',
+                 output_root='service_output'):
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count()
+        self.shapefile_path = shapefile_path
+        self.output_root = os.path.realpath(output_root)
+        self.pool = None
+        self.server = None
+        self.started = None
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.latencies = []
+
+    def start(self):
+        """Start the workers, wait until they are warm and bind the server; return its URL."""
+        if not os.path.exists(self.shapefile_path):
+            raise FileNotFoundError(f"Shapefile not found: {self.shapefile_path}")
+        os.makedirs(self.output_root, exist_ok=True)
+        self.pool = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.shapefile_path,))
+        for future in [self.pool.submit(_ready) for _ in range(self.workers)]:
+            future.result()
+        self.server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self.server.service = self
+        self.started = time.time()
+        return f'http://{self.host}:{self.server.server_address[1]}'
+
+    def serve_forever(self):
+        """Serve requests until shutdown is called (or the process is interrupted)."""
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def shutdown(self):
+        """Stop serve_forever from another thread."""
+        self.server.shutdown()
+
+    def close(self):
+        if self.server is not None:
+            self.server.server_close()
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def output_path(self, output_dir):
+        """Return the directory output_dir names under the output root, or None for none.
+
+        Raises ValueError if output_dir is absolute or leaves the output root.
+        """
+        if output_dir is None:
+            return None
+        path = os.path.realpath(os.path.join(self.output_root, output_dir))
+        if os.path.isabs(output_dir) or os.path.commonpath([self.output_root, path]) != self.output_root:
+            raise ValueError(f"Output directory {output_dir} is not inside the output root of the service")
+        return path
+
+    def record(self, latency_ms):
+        with self._lock:
+            self.requests += 1
+            if latency_ms is None:
+                self.errors += 1
+            else:
+                self.latencies.append(latency_ms)
+
+    def status(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            return {'workers': self.workers, 'uptime': time.time() - self.started, 'requests': self.requests,
+                    'errors': self.errors,
+                    'mean_latency_ms': sum(latencies) / len(latencies) if latencies else None,
+                    'median_latency_ms': latencies[len(latencies) // 2] if latencies else None}
+
+
+def request_instance(settings, url='http://127.0.0.1:8765', output_dir=None, timeout=600):
+    """Request an instance from a running GeneratorService.
+
+    output_dir optionally names a directory under the output root of the service for the files Main
+    writes. Returns the instance and the reply with its latency in milliseconds.
+    Raises RuntimeError with the error of the service if the request failed.
+    """
+    body = json.dumps({'settings': settings, 'output_dir': output_dir}).encode()
+    try:
+        with urlopen(Request(url + '/instance', data=body, headers={'Content-Type': 'application/json'}),
+                     timeout=timeout) as response:
+            reply = json.load(response)
+    except HTTPError as error:
+        raise RuntimeError(json.load(error).get('error', str(error))) from None
+    return instance_from_json(reply.pop('instance')), reply
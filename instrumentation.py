@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows: the peak resident memory is not recorded there
+    resource = None
+
+# Context manager handed out while the instrumentation is disabled, so an instrumented block costs one call
+_DISABLED = nullcontext()
+
+
+class Instrumentation:
+    """Wall time, CPU time and peak memory per named stage and per solver call, written to a JSON metrics file.
+
+    Stages nest: a stage opened inside another is recorded under their names joined by '/'
+    (e.g. 'bom/visualize'), and the runs of a stage are accumulated. The peak memory of a stage is
+    the peak of the memory Python allocated while it ran, above what was allocated when it started;
+    it is tracked with tracemalloc only when trace_memory is set, since tracing slows Python down.
+    The peak resident memory of the process so far is recorded at the end of every stage. Solver
+    calls are summarized per stage with the largest model solved; they are also kept one by one
+    with the number of variables and constraints of the model when call_detail is set.
+    Stages can be opened from several threads: each thread nests its own stages (tracemalloc
+    peaks are process-wide, so the peak memory of stages running concurrently is shared).
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False
+        self.call_detail = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget all recorded stages and solver calls."""
+        self.stages = {}
+        self.solvers = {}
+        self.solver_calls = []
+        # Per thread: names of the open stages, and the traced memory at their start and their peak so far
+        self._local = threading.local()
+
+    def _open(self):
+        local = self._local
+        if not hasattr(local, 'stack'):
+            local.stack, local.starts, local.peaks = [], [], []
+        return local
+
+    def enable(self, trace_memory=False, call_detail=False):
+        self.enabled = True
+        self.trace_memory = trace_memory
+        self.call_detail = call_detail
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.enabled = False
+        self.trace_memory = False
+        self.call_detail = False
+
+    def stage(self, name):
+        """Return a context manager recording the block it wraps as stage name."""
+        if not self.enabled:
+            return _DISABLED
+        return self._measure(name)
+
+    def solver_call(self, name, model=None, variables=None, constraints=None):
+        """Return a context manager recording the solver call it wraps, with the size of the model solved.
+
+        The size is read from a Pyomo model (active constraints only) or given as variables and constraints.
+        """
+        if not self.enabled:
+            return _DISABLED
+        if model is not None:
+            variables, constraints = model.nvariables(), model.nconstraints()
+        return self._measure(name, {'variables': variables, 'constraints': constraints})
+
+    @contextmanager
+    def _measure(self, name, call=None):
+        local = self._open()
+        if self.trace_memory:
+            # The enclosing stage keeps its peak so far before the peak is reset for this stage
+            current, peak = tracemalloc.get_traced_memory()
+            if local.peaks:
+                local.peaks[-1] = max(local.peaks[-1], peak)
+            tracemalloc.reset_peak()
+            local.starts.append(current)
+            local.peaks.append(current)
+        local.stack.append(name)
+        path = '/'.join(local.stack)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            local.stack.pop()
+            record = {'wall': wall, 'cpu': cpu}
+            if self.trace_memory:
+                stage_peak = max(local.peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if local.peaks:
+                    local.peaks[-1] = max(local.peaks[-1], stage_peak)
+                tracemalloc.reset_peak()
+                record['peak_mb'] = (stage_peak - local.starts.pop()) / 2 ** 20
+            self._accumulate(path, record, call)
+
+    def _accumulate(self, path, record, call=None):
+        max_rss_mb = None
+        if resource is not None:
+            # ru_maxrss is in kilobytes on Linux
+            max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        with self._lock:
+            stage = self.stages.setdefault(path, {'count': 0, 'wall': 0.0, 'cpu': 0.0})
+            stage['count'] += 1
+            stage['wall'] += record['wall']
+            stage['cpu'] += record['cpu']
+            if 'peak_mb' in record:
+                stage['peak_mb'] = max(stage.get('peak_mb', 0.0), record['peak_mb'])
+            if max_rss_mb is not None:
+                stage['max_rss_mb'] = max_rss_mb
+            if call is None:
+                return
+            summary = self.solvers.setdefault(path, {'count': 0, 'wall': 0.0, 'max_variables': 0,
+                                                     'max_constraints': 0})
+            summary['count'] += 1
+            summary['wall'] += record['wall']
+            summary['max_variables'] = max(summary['max_variables'], call['variables'] or 0)
+            summary['max_constraints'] = max(summary['max_constraints'], call['constraints'] or 0)
+            if self.call_detail:
+                self.solver_calls.append(dict(call, stage=path, **record))
+
+    def write(self, path, **meta):
+        """Write the recorded stages and solver summaries (and calls), with meta describing the run, to a JSON file."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            data = {'meta': meta, 'stages': self.stages, 'solvers': self.solvers}
+            if self.call_detail:
+                data['solver_calls'] = self.solver_calls
+            with open(path, 'w') as f:
+                json.dump(data, f, indent=2)
+
+
+# Instrumentation shared by all modules; disabled until a script enables it
+instrumentation = Instrumentation()
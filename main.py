@@ -1,29 +1,61 @@
+import argparse
 import random
 import json
 import os
+import networkx as nx
+import numpy as np
 from bom import BOM
+from instrumentation import instrumentation
 from random_location_generator import RandomLocationGenerator
 
+# Settings asked by Main.get_user_input, in the order they are asked
+SETTINGS = ('n', 'num_roots', 'max_depth', 'max_parents', 'seed', 'min_demand', 'max_demand', 'num_locations',
+            'locality')
+
+
 class Main:
-    def __init__(self):
+    def __init__(self, settings=None, plots=True, metrics_path=None, trace_memory=False, output_dir=None,
+                 location_generator=None):
+        # Folder of the report, figures and JSON files (None keeps the output folder)
+        self.output_dir = output_dir
+        # Profit margin of every final product, drawn when the instance is first built
+        self.profit_margins = {}
         # Open the report file in write mode
-        self.report_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output', 'instance_report.txt')
+        self.report_file = os.path.join(output_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output'),
+                                        'instance_report.txt')
+        # Settings by name (see SETTINGS); missing ones take the default of an empty answer. None asks the user
+        self.settings = settings
+        # plots=False skips the BOM and location figures, and the import of the plotting libraries
+        self.plots = plots
+        # Time and memory per generation stage are written to metrics_path (None disables the instrumentation)
+        if metrics_path is not None:
+            instrumentation.enable(trace_memory)
         self.log("Starting Main class initialization...")
         self.get_user_input()
-        self.bom = BOM(self.n, self.num_roots, self.max_depth, self.max_parents, self.min_demand,
-                       self.max_demand, self.seed)
+        with instrumentation.stage('bom'):
+            self.bom = BOM(self.n, self.num_roots, self.max_depth, self.max_parents, self.min_demand,
+                           self.max_demand, self.seed)
         # Call the run method on the BOM instance
-        self.bom.run()
+        with instrumentation.stage('bom_run'):
+            self.bom.run(visualize=plots, output_dir=self.output_path(''))
 
         # Pass min_demand and max_demand to RandomLocationGenerator
-        self.location_generator = RandomLocationGenerator(
-            'shapefiles/TM_WORLD_BORDERS-0.3.shp',
-            fixed_seed=self.seed,
-            min_demand=self.min_demand,
-            max_demand=self.max_demand
-        )
-        # Generate and visualize random locations before running the main logic
-        self.location_generator.generate_random_locations(self.num_locations)
+        with instrumentation.stage('locations'):
+            if location_generator is None:
+                self.location_generator = RandomLocationGenerator(
+                    'shapefiles/TM_WORLD_BORDERS-0.3.shp',
+                    fixed_seed=self.seed,
+                    min_demand=self.min_demand,
+                    max_demand=self.max_demand
+                )
+            else:
+                # A generator with the shapefile already loaded (e.g. kept by a long-running service) is reused
+                self.location_generator = location_generator
+                location_generator.fixed_seed = self.seed
+                location_generator.min_demand = self.min_demand
+                location_generator.max_demand = self.max_demand
+            # Generate and visualize random locations before running the main logic
+            self.location_generator.generate_random_locations(self.num_locations, plot=plots, output_dir=output_dir)
 
         # Store the list of nodes from BOM
         self.nodes = self.bom.get_nodes()
@@ -34,76 +66,100 @@ class Main:
         self.log(f"List of facility indices: {[fac.index for fac in self.facilities]}")
 
         # Create a mapping of nodes to facilities
-        self.node_facilities_mapping = self.create_node_facilities_mapping()
+        with instrumentation.stage('mapping'):
+            self.node_facilities_mapping = self.create_node_facilities_mapping()
         for node, facilities in self.node_facilities_mapping.items():
             self.log(f"Item {node} alternative facilities are: {[fac.index for fac in facilities]}")
 
         # Create the processing times dictionary
-        self.processing_times = self.create_processing_times()
+        with instrumentation.stage('processing_times'):
+            self.processing_times = self.create_processing_times()
         for node, times in self.processing_times.items():
             self.log(f"Processing times for item {node}:")
             for facility, time in times.items():
                 self.log(f"  Facility {facility.index}: {time}")
 
         # Export processing times to JSON
-        self.export_processing_times_to_json('output/times.json')
+        with instrumentation.stage('export_processing_times'):
+            self.export_processing_times_to_json(self.output_path('times.json'))
 
         # Create the inventory dictionary
-        self.inventory = self.create_inventory()
+        with instrumentation.stage('inventory'):
+            self.inventory = self.create_inventory()
         for node, inventory in self.inventory.items():
             self.log(f"Inventory for item {node}:")
             for facility, inv in inventory.items():
                 self.log(f"  Facility {facility.index}: {inv}")
 
         # Export inventory to JSON
-        self.export_inventory_to_json('output/inventory.json')
+        with instrumentation.stage('export_inventory'):
+            self.export_inventory_to_json(self.output_path('inventory.json'))
 
         # Create the PGHG dictionary
-        self.pghg = self.create_pghg()
+        with instrumentation.stage('pghg'):
+            self.pghg = self.create_pghg()
         for node, pghg in self.pghg.items():
             self.log(f"PGHG for item {node}:")
             for facility, value in pghg.items():
                 self.log(f"  Facility {facility.index}: {value}")
 
         # Export PGHG to JSON
-        self.export_pghg_to_json('output/pghg.json')
+        with instrumentation.stage('export_pghg'):
+            self.export_pghg_to_json(self.output_path('pghg.json'))
+
+        if metrics_path is not None:
+            instrumentation.write(metrics_path, items=self.n, facilities=self.num_locations, seed=self.seed)
+            instrumentation.disable()
+
+    def output_path(self, filename):
+        """Return the path of an output file."""
+        return os.path.join(self.output_dir or 'output', filename)
+
+    def ask(self, setting, prompt):
+        """Return the answer for a setting, from the settings given to Main or else typed by the user."""
+        if self.settings is None:
+            return input(prompt)
+        answer = self.settings.get(setting)
+        return '' if answer is None else str(answer)
 
     def get_user_input(self):
-        n_input = input(
+        n_input = self.ask('n',
             "Enter the number of items in the Bill of Material (between 8 to 20, or press Enter to randomly assign): ")
         self.n = int(n_input) if n_input else random.randint(8, 20)
 
-        num_roots_input = input(
+        num_roots_input = self.ask('num_roots',
             f"Enter the number of root items (or press Enter to randomly assign between 2 and {self.n // 2}): ")
         self.num_roots = int(num_roots_input) if num_roots_input else random.randint(2, self.n // 2)
 
-        max_depth_input = input(
+        max_depth_input = self.ask('max_depth',
             "Enter the maximum tier (depth of the BOM tree) or press Enter to use the default (3): ")
         self.max_depth = int(max_depth_input) if max_depth_input else 3
 
-        max_parents_input = input(
+        max_parents_input = self.ask('max_parents',
             "Enter the maximum number of parent items a component/subassembly could have or press Enter to use the default (2): ")
         self.max_parents = int(max_parents_input) if max_parents_input else 2
 
-        seed_input = input("Enter a seed value (or press Enter to use a random seed): ")
+        seed_input = self.ask('seed', "Enter a seed value (or press Enter to use a random seed): ")
         self.seed = int(seed_input) if seed_input else random.randint(0, 10000)
 
-        min_demand_input = input(
+        min_demand_input = self.ask('min_demand',
             "Enter the minimum demand value for final items (leaf nodes) or press Enter to use the default (10): ")
         self.min_demand = int(min_demand_input) if min_demand_input else 10
 
-        max_demand_input = input(
+        max_demand_input = self.ask('max_demand',
             "Enter the maximum demand value for final items (leaf nodes) or press Enter to use the default (100): ")
         self.max_demand = int(max_demand_input) if max_demand_input else 100
 
         # Get number of facility locations
         while True:
             try:
-                num_locations_input = input(
+                num_locations_input = self.ask('num_locations',
                     f"Enter the number of facility locations to generate (between {self.n // 2} and {self.n}, or press Enter to randomly assign): ")
                 if num_locations_input:
                     self.num_locations = int(num_locations_input)
                     if self.num_locations < (self.n // 2) or self.num_locations > self.n:
+                        if self.settings is not None:
+                            raise ValueError(f"num_locations must be between {self.n // 2} and {self.n}")
                         print(f"Please enter a number between {self.n // 2} and {self.n}.")
                     else:
                         break
@@ -111,10 +167,21 @@ class Main:
                     self.num_locations = random.randint(self.n // 2, self.n)
                     break
             except ValueError:
+                if self.settings is not None:
+                    raise
                 print("Invalid input. Please enter a valid integer.")
 
+        # Proximity-aware eligibility (see create_regional_mapping); no answer draws the facilities of an item from all
+        locality_input = self.ask('locality',
+            "Enter the number of nearby facilities an item's alternative facilities are drawn from (or press Enter to draw them from all facilities): ")
+        self.locality = int(locality_input) if locality_input else None
+        if self.locality is not None and self.locality < 2:
+            raise ValueError("locality must be at least 2")
+
     def create_node_facilities_mapping(self):
         """Create a mapping of nodes to a random list of facilities."""
+        if self.locality is not None:
+            return self.create_regional_mapping()
         mapping = {}
         for node in self.nodes:
             num_facilities = random.randint(2, max(3, len(self.facilities) // 3))
@@ -122,6 +189,48 @@ class Main:
             mapping[node] = selected_facilities
         return mapping
 
+    def facility_tree(self):
+        """Return a k-d tree over the facilities, as unit vectors so that nearer means a shorter great-circle distance."""
+        # Loaded here as the uniform mapping does not need scipy
+        from scipy.spatial import cKDTree
+
+        lat, lon = np.radians([[fac.lat, fac.lon] for fac in self.facilities]).T
+        return cKDTree(np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)]))
+
+    def region_size(self):
+        return min(self.locality, len(self.facilities))
+
+    def create_regional_mapping(self):
+        """Create a mapping of nodes to random facilities drawn from regions of nearby facilities.
+
+        The region of an item is the locality facilities nearest to a center facility, found for all
+        items of a BOM tier at once with a k-d tree. A final product's center is drawn from all
+        facilities and a component's center from the region of an item it is used in, so the lanes
+        between the facilities of a component and those of the items using it stay regional. An item
+        gets at most a third of its region, so the lanes per BOM edge do not grow with the facilities.
+        """
+        tree = self.facility_tree()
+        size = self.region_size()
+        # Positions in self.facilities of the facilities of every item's region
+        self.regions = {}
+        # Final products first, then the components of the items already placed
+        for tier in nx.topological_generations(self.bom.G.reverse(copy=False)):
+            centers = []
+            for node in tier:
+                users = list(self.bom.G.successors(node))
+                if users:
+                    centers.append(random.choice(self.regions[random.choice(users)]))
+                else:
+                    centers.append(random.randrange(len(self.facilities)))
+            _, regions = tree.query(tree.data[centers], k=size)
+            for node, region in zip(tier, np.reshape(regions, (len(tier), size))):
+                self.regions[node] = region.tolist()
+        mapping = {}
+        for node in self.nodes:
+            num_facilities = min(size, random.randint(2, max(3, size // 3)))
+            mapping[node] = [self.facilities[k] for k in random.sample(self.regions[node], num_facilities)]
+        return mapping
+
     def create_processing_times(self):
         """Create a processing times dictionary for each node and its facilities."""
         processing_times = {}
@@ -155,6 +264,111 @@ class Main:
                 pghg[node][facility] = time * self.max_demand
         return pghg
 
+    def draw_profit_margins(self):
+        """Return the profit margin of every final product, drawing those not drawn yet."""
+        # A product that stays final when the instance grows keeps its profit margin
+        rng = random.Random(self.seed)
+        return {i: self.profit_margins.setdefault(i, rng.randint(400, 700))
+                for i in (f'P{node}' for node in self.bom.root_nodes)}
+
+    def grow(self, items=0, locations=0):
+        """Add items on top of the BOM and facility locations without regenerating the instance.
+
+        Existing items, BOM edges, facilities, distances, eligible facilities and parameter values
+        stay identical: only the distances of the new facilities are computed, a new item is
+        eligible at facilities drawn among all of them, and an existing item is also eligible at
+        each new facility with the probability of its share of the old ones. With a locality, items
+        keep their regions and a new item gets a region around the region of one of its components
+        (see create_regional_mapping). A final product that
+        becomes a component of a new item loses its demand (see BOM.add_items). The draws are seeded
+        by the seed and the sizes before growing, so the same growth steps give the same instance.
+        The files written by __init__ are not rewritten.
+        """
+        # Final products that become components keep the margins they had before growing
+        self.draw_profit_margins()
+        rng = random.Random(f'{self.seed}:{self.n}:{self.num_locations}')
+        old_nodes, old_facilities = list(self.nodes), list(self.facilities)
+        if locations:
+            with instrumentation.stage('grow_locations'):
+                self.location_generator.add_random_locations(locations)
+            self.facilities = self.location_generator.get_facilities()
+            self.num_locations = len(self.facilities)
+        if items:
+            with instrumentation.stage('grow_bom'):
+                self.bom.add_items(items)
+            self.nodes = self.bom.get_nodes()
+            self.n = self.bom.n
+        new_facilities = self.facilities[len(old_facilities):]
+        mapping = self.node_facilities_mapping
+        tree = self.facility_tree() if self.locality is not None and len(self.nodes) > len(old_nodes) else None
+        with instrumentation.stage('grow_tables'):
+            for node in self.nodes:
+                new_node = node not in mapping
+                if not new_node:
+                    share = 0 if self.locality is not None else len(mapping[node]) / len(old_facilities)
+                    facilities = new_facilities
+                    mapping[node] = mapping[node] + [fac for fac in facilities if rng.random() < share]
+                elif tree is not None:
+                    facilities = self.facilities
+                    size = self.region_size()
+                    center = rng.choice(self.regions[rng.choice(list(self.bom.G.predecessors(node)))])
+                    self.regions[node] = np.reshape(tree.query(tree.data[center], k=size)[1], size).tolist()
+                    num_facilities = min(size, rng.randint(2, max(3, size // 3)))
+                    mapping[node] = [facilities[k] for k in rng.sample(self.regions[node], num_facilities)]
+                else:
+                    facilities = self.facilities
+                    num_facilities = rng.randint(2, max(3, len(facilities) // 3))
+                    mapping[node] = rng.sample(facilities, num_facilities)
+                if new_node:
+                    self.processing_times[node], self.inventory[node], self.pghg[node] = {}, {}, {}
+                for facility in facilities:
+                    eligible = facility in mapping[node]
+                    time = rng.randint(5, 10) if eligible else 0
+                    self.processing_times[node][facility] = time
+                    self.inventory[node][facility] = (rng.randint(self.min_demand * 2, self.max_demand * 2)
+                                                      if eligible else 0)
+                    self.pghg[node][facility] = time * self.max_demand
+        self.log(f"Grown by {len(self.nodes) - len(old_nodes)} items and {len(new_facilities)} facilities to "
+                 f"{self.n} items and {self.num_locations} facilities")
+
+    def instance(self):
+        """Return the generated network as a TTR/TTS instance dictionary (see instance_data.get_instance)."""
+        mapping = self.node_facilities_mapping
+        product = {node: f'P{node}' for node in self.nodes}
+        factory = {fac.index: f'F{fac.index}' for fac in self.facilities}
+        final_products = [product[node] for node in self.bom.root_nodes]
+        profit_margins = self.draw_profit_margins()
+        # Only the distances between facilities a BOM edge can connect are used by the models
+        distance = {}
+        for child, parent in self.bom.G.edges:
+            for fac1 in mapping[child]:
+                for fac2 in mapping[parent]:
+                    distance[factory[fac1.index], factory[fac2.index]] = fac1.distances[fac2.index]
+
+        def by_factory_product(table):
+            return {(factory[fac.index], product[node]): table[node][fac] for node in self.nodes for fac in mapping[node]}
+
+        return {
+            'products': [product[node] for node in self.nodes],
+            'factories': [factory[fac.index] for fac in self.facilities],
+            'final_products': final_products,
+            'BOM': {(product[child], product[parent]): weight for child, parent, weight in self.bom.G.edges(data='weight')},
+            'factory_product': [(factory[fac.index], product[node]) for node in self.nodes for fac in mapping[node]],
+            'TTR': 6,
+            'profitmargin': profit_margins,
+            'pghg': by_factory_product(self.pghg),
+            'TGHG': 5,
+            'distance': distance,
+            'inventory': by_factory_product(self.inventory),
+            'si': {factory[fac.index]: fac.si for fac in self.facilities},
+            'processtime': by_factory_product(self.processing_times),
+            'capacity': {factory[fac.index]: fac.capacity for fac in self.facilities},
+            'demand': {product[node]: self.bom.G.nodes[node]['demand'] for node in self.bom.root_nodes},
+            # The first facility is disrupted by 20 to 30% in every scenario
+            'disruption_bounds': {factory[self.facilities[0].index]: (0.2, 0.3)},
+            'fixed_disruption': {},
+        }
+
     def export_processing_times_to_json(self, filename):
         """Export processing times to a JSON file with headers."""
         # Ensure the output directory exists
@@ -209,5 +423,31 @@ class Main:
             f.write(message + "\n")
 
 
+def main(argv=None):
+    """Generate an instance from the command line; without settings, they are asked on the console."""
+    parser = argparse.ArgumentParser(description="Generate a random supply chain instance.")
+    parser.add_argument('--items', dest='n', type=int, help="number of items in the BOM")
+    parser.add_argument('--roots', dest='num_roots', type=int, help="number of root items")
+    parser.add_argument('--max-depth', type=int, help="maximum tier of the BOM tree")
+    parser.add_argument('--max-parents', type=int, help="maximum number of parents of an item")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--min-demand', type=int, help="minimum demand of the final items")
+    parser.add_argument('--max-demand', type=int, help="maximum demand of the final items")
+    parser.add_argument('--locations', dest='num_locations', type=int, help="number of facility locations")
+    parser.add_argument('--locality', type=int,
+                        help="draw the facilities of an item from this many facilities near each other")
+    parser.add_argument('--defaults', action='store_true',
+                        help="do not ask the settings not given, use their defaults")
+    parser.add_argument('--no-plots', action='store_true', help="skip the BOM and location figures")
+    parser.add_argument('--metrics', help="write the time and memory per generation stage to this JSON file "
+                                          "(no instrumentation without it)")
+    parser.add_argument('--trace-memory', action='store_true', help="also trace the memory Python allocates per stage")
+    args = parser.parse_args(argv)
+
+    settings = {setting: getattr(args, setting) for setting in SETTINGS if getattr(args, setting) is not None}
+    return Main(settings if settings or args.defaults else None, plots=not args.no_plots,
+                metrics_path=args.metrics, trace_memory=args.trace_memory)
+
+
 if __name__ == "__main__":
-    Main()
\ No newline at end of file
+    main()
\ No newline at end of file
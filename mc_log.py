@@ -0,0 +1,167 @@
+import json
+import math
+import os
+import struct
+
+
+class RunningStats:
+    """Streaming mean and variance of a sequence of values (Welford's algorithm)."""
+
+    def __init__(self, n=0, mean=0.0, m2=0.0):
+        self.n = n
+        self.mean = mean
+        # Sum of squared deviations from the mean
+        self.m2 = m2
+
+    def update(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def copy(self):
+        return RunningStats(self.n, self.mean, self.m2)
+
+    def variance(self):
+        """Return the sample variance (ddof=1)."""
+        return self.m2 / (self.n - 1) if self.n > 1 else math.nan
+
+    def sem(self):
+        """Return the standard error of the mean."""
+        return math.sqrt(self.variance() / self.n) if self.n > 1 else math.nan
+
+    def confidence_interval(self, confidence_level=0.95):
+        """Return the t-based confidence interval of the mean."""
+        # scipy.stats takes most of a second to import, so it is only loaded once an interval is needed
+        from scipy import stats
+        return stats.t.interval(confidence_level, self.n - 1, loc=self.mean, scale=self.sem())
+
+    def state(self):
+        return [self.n, self.mean, self.m2]
+
+
+class MonteCarloStats:
+    """Running statistics of every objective of a Monte Carlo study.
+
+    Every group_size consecutive values (an antithetic pair, a Sobol or LHS replicate) form one
+    observation, their mean, as in ScenarioEngine.estimator_values; an incomplete last group counts
+    as an observation of its own.
+    """
+
+    def __init__(self, metrics, group_size=1, state=None):
+        self.metrics = list(metrics)
+        self.group_size = group_size
+        self.n = 0
+        self.stats = {metric: RunningStats() for metric in self.metrics}
+        # Values of the incomplete group
+        self.pending = []
+        if state is not None:
+            self.n = state['n']
+            self.stats = {metric: RunningStats(*state['stats'][metric]) for metric in self.metrics}
+            self.pending = state['pending']
+
+    def update(self, result):
+        """Add the objective values of one scenario."""
+        self.n += 1
+        self.pending.append({metric: result[metric] for metric in self.metrics})
+        if len(self.pending) == self.group_size:
+            for metric in self.metrics:
+                self.stats[metric].update(self._group_mean(metric))
+            self.pending = []
+
+    def _group_mean(self, metric):
+        return sum(values[metric] for values in self.pending) / len(self.pending)
+
+    def summary(self, metric):
+        """Return the running statistics of a metric, counting an incomplete group as one observation."""
+        if not self.pending:
+            return self.stats[metric]
+        running = self.stats[metric].copy()
+        running.update(self._group_mean(metric))
+        return running
+
+    def state(self):
+        return {'n': self.n, 'stats': {metric: self.stats[metric].state() for metric in self.metrics},
+                'pending': self.pending}
+
+
+class ResultLog:
+    """Append-only on-disk log of the objective values of every solved scenario, with checkpoints.
+
+    The log starts with a JSON header line describing the run, followed by one fixed-size record of
+    float64 values per scenario, in scenario order. A record cut short by a crash is dropped when
+    the log is reopened. Every checkpoint_every scenarios the log is flushed to disk and the running
+    statistics are written atomically to path + '.checkpoint', so a resumed run only replays the
+    records logged after the last checkpoint.
+    """
+
+    def __init__(self, path, metrics, run=None, checkpoint_every=10):
+        self.path = path
+        self.checkpoint_path = path + '.checkpoint'
+        self.metrics = list(metrics)
+        self.checkpoint_every = checkpoint_every
+        self.record = struct.Struct(f'<{len(self.metrics)}d')
+        # Round trip through JSON so the header compares equal to the one read back
+        header = json.loads(json.dumps({'metrics': self.metrics, 'run': run or {}}))
+
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                found = json.loads(f.readline())
+                self.data_start = f.tell()
+            if found != header:
+                raise ValueError(f"{path} was written by a different run: {found}")
+            # Drop a record cut short by a crash
+            self.n_records = (os.path.getsize(path) - self.data_start) // self.record.size
+            with open(path, 'r+b') as f:
+                f.truncate(self.data_start + self.n_records * self.record.size)
+        else:
+            with open(path, 'wb') as f:
+                f.write(json.dumps(header).encode() + b'\n')
+                self.data_start = f.tell()
+            self.n_records = 0
+            if os.path.exists(self.checkpoint_path):
+                os.remove(self.checkpoint_path)
+        self.file = open(path, 'ab')
+
+    def __len__(self):
+        return self.n_records
+
+    def append(self, result):
+        """Append the objective values of the next scenario."""
+        self.file.write(self.record.pack(*(float(result[metric]) for metric in self.metrics)))
+        self.n_records += 1
+
+    def results(self, start=0, stop=None):
+        """Read back the logged scenarios start to stop as result dictionaries."""
+        self.file.flush()
+        stop = len(self) if stop is None else min(stop, len(self))
+        with open(self.path, 'rb') as f:
+            f.seek(self.data_start + start * self.record.size)
+            data = f.read((stop - start) * self.record.size)
+        return [dict(zip(self.metrics, values)) for values in self.record.iter_unpack(data)]
+
+    def checkpoint(self, mc_stats):
+        """Flush the log to disk and save the running statistics of the scenarios logged so far."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(mc_stats.state(), f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def restore(self, group_size=1):
+        """Return the running statistics of all logged scenarios, from the last checkpoint onwards."""
+        state = None
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                state = json.load(f)
+            # A checkpoint ahead of the log (log records lost) cannot be used
+            if state['n'] > len(self):
+                state = None
+        mc_stats = MonteCarloStats(self.metrics, group_size, state)
+        for result in self.results(mc_stats.n):
+            mc_stats.update(result)
+        return mc_stats
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,233 @@
+import highspy
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+from instrumentation import instrumentation
+
+# Scenario parameters a sweep can vary, with the position of each in a scenario tuple
+PARAMETERS = {'process_time': 0, 'capacity': 1, 'demand': 2, 'disruption': 3}
+# Primal feasibility tolerance of the basis ranging
+RANGING_TOLERANCE = 1e-9
+
+
+def highs_model(c, A, b, bounds):
+    """Return a HiGHS model of min c x s.t. A x <= b within the column bounds, solved with the simplex method."""
+    A = A.tocsc()
+    lp = highspy.HighsLp()
+    lp.num_col_, lp.num_row_ = A.shape[1], A.shape[0]
+    lp.col_cost_ = c
+    lp.col_lower_, lp.col_upper_ = bounds[:, 0], bounds[:, 1]
+    lp.row_lower_, lp.row_upper_ = np.full(len(b), -np.inf), b
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+    lp.a_matrix_.start_, lp.a_matrix_.index_, lp.a_matrix_.value_ = A.indptr, A.indices, A.data
+    highs = highspy.Highs()
+    highs.setOptionValue('output_flag', False)
+    # The simplex method keeps a basis to re-solve from and to range
+    highs.setOptionValue('solver', 'simplex')
+    highs.passModel(lp)
+    return highs
+
+
+class ParametricSweep:
+    """TTS or lost margin of one scenario as a function of scenario parameters varied along a grid.
+
+    The LP of the scenario (SparseLP layout of a scipy or benders engine) is loaded once into a
+    HiGHS model; each grid point only changes the bounds and coefficients the varied parameters
+    touch, and HiGHS re-solves from the basis of the previous point. Capacities, disruption rates
+    and demands are right-hand sides of the lost margin LP: the basis of a solved point is ranged
+    along the direction of the sweep, and the points within that range are on the same linear
+    piece of the curve and are not solved. Process times, and every parameter of the TTS LP, are
+    coefficients, so those sweeps solve every point (warm).
+    """
+
+    def __init__(self, engine, scenario=None, objective='TTS'):
+        if getattr(engine, 'lp', None) is None:
+            raise ValueError("A parametric sweep needs an engine with the scipy or benders backend")
+        if objective not in ('TTS', 'Lostmargin'):
+            raise ValueError(f"objective must be 'TTS' or 'Lostmargin', not {objective!r}")
+        self.engine = engine
+        self.lp = engine.lp
+        self.objective = objective
+        instance = engine.instance
+        if scenario is None:
+            # Nominal scenario: the instance parameters, with only the fixed disruptions
+            disruptionrate = {f: 0 for f in instance['factories']}
+            disruptionrate.update(instance['fixed_disruption'])
+            scenario = (instance['processtime'], instance['capacity'], instance['demand'], disruptionrate)
+        self.scenario = scenario
+        self.ttr = instance['TTR']
+        self.highs = None
+
+    def _problem(self, scenario):
+        if self.objective == 'TTS':
+            return self.lp.tts_problem(*scenario)
+        A, b, bounds = self.lp.ttr_problem(*scenario, self.ttr)
+        return self.lp.c_lostmargin, A, b, bounds
+
+    def _load(self, scenario):
+        """Load the LP of a scenario into a new HiGHS model."""
+        c, A, b, bounds = self._problem(scenario)
+        self.highs = highs_model(c, A, b, bounds)
+        self.A = A.tocsr()
+        self.b = b.copy()
+        self.bounds = bounds.copy()
+
+    def _update(self, scenario):
+        """Change the bounds and coefficients of the loaded LP that differ for a scenario."""
+        _, A, b, bounds = self._problem(scenario)
+        changed = sparse.find(A - self.A)
+        for row, col in zip(*changed[:2]):
+            self.highs.changeCoeff(int(row), int(col), float(A[row, col]))
+        rows = np.flatnonzero(b != self.b)
+        if len(rows):
+            self.highs.changeRowsBounds(len(rows), rows, np.full(len(rows), -np.inf), b[rows])
+        cols = np.flatnonzero(np.any(bounds != self.bounds, axis=1))
+        if len(cols):
+            self.highs.changeColsBounds(len(cols), cols, bounds[cols, 0], bounds[cols, 1])
+        self.A, self.b, self.bounds = A, b, bounds
+
+    def _solve(self):
+        with instrumentation.solver_call(self.objective, variables=self.A.shape[1], constraints=self.A.shape[0]):
+            self.highs.run()
+        if self.highs.getModelStatus() != highspy.HighsModelStatus.kOptimal:
+            raise RuntimeError(f"HiGHS did not return an optimal solution: {self.highs.getModelStatus()}")
+        value = self.highs.getInfo().objective_function_value
+        return -value if self.objective == 'TTS' else value
+
+    def _ranging(self, row_rate, col_lower_rate, col_upper_rate):
+        """Return the step interval (s_min, s_max) along the given bound rates over which the basis stays optimal,
+        and the rate of the objective along it.
+
+        The basic variables (columns and row activities r = A x) move with the nonbasic bounds:
+        [A_B, -I_B] d_B = -A_N d_N + I_N d_r. The basis stays dual feasible, as only bounds move, and
+        primal feasible while every basic variable stays within its moving bounds.
+        """
+        basis = self.highs.getBasis()
+        solution = self.highs.getSolution()
+        basic, upper = highspy.HighsBasisStatus.kBasic, highspy.HighsBasisStatus.kUpper
+        lower = highspy.HighsBasisStatus.kLower
+        col_status = np.array([status == basic for status in basis.col_status])
+        row_status = np.array([status == basic for status in basis.row_status])
+        n_rows, n_cols = self.A.shape
+        if col_status.sum() + row_status.sum() != n_rows:
+            return 0.0, 0.0, 0.0
+        # Rates of the nonbasic columns and rows, at the bound they sit at
+        col_rate = np.zeros(n_cols)
+        at_lower = np.array([status == lower for status in basis.col_status])
+        at_upper = np.array([status == upper for status in basis.col_status])
+        col_rate[at_lower] = col_lower_rate[at_lower]
+        col_rate[at_upper] = col_upper_rate[at_upper]
+        nonbasic_rows = np.array([status == upper for status in basis.row_status])
+        rhs = -(self.A @ col_rate) + np.where(nonbasic_rows, row_rate, 0.0)
+        basic_cols = np.flatnonzero(col_status)
+        basic_rows = np.flatnonzero(row_status)
+        B = sparse.hstack([self.A[:, basic_cols], -sparse.identity(n_rows, format='csr')[:, basic_rows]], format='csc')
+        try:
+            direction = splu(B).solve(rhs)
+        except RuntimeError:
+            # Singular basis matrix
+            return 0.0, 0.0, 0.0
+        col_rate[basic_cols] = direction[:len(basic_cols)]
+
+        # Basic variable v + s * rate within [lo + s * lo_rate, hi + s * hi_rate]
+        value = np.concatenate([np.asarray(solution.col_value)[basic_cols], np.asarray(solution.row_value)[basic_rows]])
+        rate = direction
+        lo = np.concatenate([self.bounds[basic_cols, 0], np.full(len(basic_rows), -np.inf)])
+        hi = np.concatenate([self.bounds[basic_cols, 1], self.b[basic_rows]])
+        lo_rate = np.concatenate([col_lower_rate[basic_cols], np.zeros(len(basic_rows))])
+        hi_rate = np.concatenate([col_upper_rate[basic_cols], row_rate[basic_rows]])
+        s_min, s_max = -np.inf, np.inf
+        for slope, slack in ((rate - hi_rate, hi - value), (lo_rate - rate, value - lo)):
+            finite = np.isfinite(slack)
+            slope, slack = slope[finite], np.maximum(slack[finite], 0) + RANGING_TOLERANCE * (1 + np.abs(value[finite]))
+            positive, negative = slope > RANGING_TOLERANCE, slope < -RANGING_TOLERANCE
+            if positive.any():
+                s_max = min(s_max, float(np.min(slack[positive] / slope[positive])))
+            if negative.any():
+                s_min = max(s_min, float(np.max(slack[negative] / slope[negative])))
+        return s_min, s_max, float(self.lp.c_lostmargin @ col_rate)
+
+    @staticmethod
+    def _add_piece(pieces, piece):
+        """Append a linear piece, or extend the last piece if the new one lies on the same line (a degenerate basis change)."""
+        if pieces:
+            last = pieces[-1]
+            if (np.isclose(piece['slope'], last['slope'])
+                    and np.isclose(piece['value'], last['value'] + (piece['start'] - last['start']) * last['slope'])):
+                last['end'] = piece['end']
+                return
+        pieces.append({key: piece[key] for key in ('start', 'end', 'value', 'slope')})
+
+    def scenario_at(self, parameter, keys, value, relative=False):
+        """Return the scenario with the parameter of every key set to value (or scaled by value if relative)."""
+        position = PARAMETERS[parameter]
+        scenario = list(self.scenario)
+        values = dict(scenario[position])
+        for key in keys:
+            values[key] = values[key] * value if relative else value
+        scenario[position] = values
+        return tuple(scenario)
+
+    def run(self, grid, parameter, keys=None, relative=False):
+        """Sweep a parameter along the grid and return the curve.
+
+        parameter is 'disruption', 'capacity' (keys are factories), 'demand' (final products) or
+        'process_time' ((factory, product) pairs); keys=None varies every key together. The
+        parameter of every key is set to the grid value, or scaled by it if relative.
+        Returns the grid, the objective value at every point, which points were solved, the linear
+        pieces found by ranging (start, end, value at start, slope) and the simplex iterations.
+        """
+        if parameter not in PARAMETERS:
+            raise ValueError(f"parameter must be one of {', '.join(PARAMETERS)}, not {parameter!r}")
+        if keys is None:
+            keys = list(self.scenario[PARAMETERS[parameter]])
+        grid = np.asarray(grid, dtype=float)
+        # Right-hand side parameters of the lost margin LP can be ranged
+        ranged = self.objective == 'Lostmargin' and parameter != 'process_time'
+        values = np.zeros(len(grid))
+        solved = np.zeros(len(grid), dtype=bool)
+        pieces = []
+        iterations = 0
+        piece = None
+        for k, point in enumerate(grid):
+            scenario = self.scenario_at(parameter, keys, point, relative)
+            if piece is not None:
+                _, A, b, bounds = self._problem(scenario)
+                s = point - piece['start']
+                linear = (np.allclose(b, piece['b'] + s * piece['row_rate'])
+                          and np.allclose(bounds[:, 0], piece['bounds'][:, 0] + s * piece['lower_rate'])
+                          and np.allclose(bounds[:, 1], piece['bounds'][:, 1] + s * piece['upper_rate']))
+                if linear and piece['s_min'] <= s <= piece['s_max']:
+                    values[k] = piece['value'] + s * piece['slope']
+                    piece['end'] = point
+                    continue
+            if self.highs is None:
+                self._load(scenario)
+            else:
+                self._update(scenario)
+            values[k] = self._solve()
+            solved[k] = True
+            iterations += self.highs.getInfo().simplex_iteration_count
+            if piece is not None:
+                self._add_piece(pieces, piece)
+                piece = None
+            if ranged and k + 1 < len(grid):
+                # Bound rates per unit of the grid, from this point to the next; linear in the grid value
+                _, _, b_next, bounds_next = self._problem(self.scenario_at(parameter, keys, grid[k + 1], relative))
+                step = grid[k + 1] - point
+                if step == 0:
+                    continue
+                row_rate = (b_next - self.b) / step
+                # Infinite bounds stay infinite
+                finite = np.isfinite(bounds_next) & np.isfinite(self.bounds)
+                bound_rate = np.zeros(self.bounds.shape)
+                bound_rate[finite] = (bounds_next[finite] - self.bounds[finite]) / step
+                lower_rate, upper_rate = bound_rate[:, 0], bound_rate[:, 1]
+                s_min, s_max, slope = self._ranging(row_rate, lower_rate, upper_rate)
+                piece = {'start': point, 'end': point, 'value': values[k], 'slope': slope, 's_min': s_min, 's_max': s_max,
+                         'b': self.b.copy(), 'bounds': self.bounds.copy(), 'row_rate': row_rate,
+                         'lower_rate': lower_rate, 'upper_rate': upper_rate}
+        if piece is not None:
+            self._add_piece(pieces, piece)
+        return {'grid': grid, 'values': values, 'solved': solved, 'pieces': pieces, 'iterations': iterations}
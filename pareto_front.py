@@ -0,0 +1,205 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from pyomo.contrib.appsi.base import TerminationCondition
+from pyomo.contrib.appsi.solvers import Highs
+from pyomo.environ import Constraint, Objective, Param, minimize
+
+from scenario_engine import ScenarioEngine
+
+# Weight of the secondary objectives in the payoff table solves, and of the augmentation of the
+# epsilon-constraint objective relative to the objective ranges
+PAYOFF_WEIGHT = 1e-6
+AUGMENTATION = 1e-3
+# Tolerance of the dominance test between front points, relative to the range of each objective over the points
+# (at least 1, so a range of zero does not make the test exact)
+DOMINANCE_TOLERANCE = 1e-6
+
+# Engine and last epsilon model of a worker process
+_worker = {}
+
+
+class EpsilonModel:
+    """TTR model of one scenario with epsilon constraints on GHG and SI, kept loaded in a persistent HiGHS.
+
+    Successive solves only change the epsilon bounds or the active objective, so HiGHS re-solves
+    from the previous basis.
+    """
+
+    def __init__(self, engine, scenario):
+        m = engine.build_model([scenario], ('TTR',))
+        b = m.Scenarios[0]
+        self.lostmargin = b.Lostmargin
+        self.ghg = b.PGHG_value + b.TGHG_value
+        self.si = b.SI_value
+        m.GHG_Bound = Param(mutable=True, initialize=0)
+        m.SI_Bound = Param(mutable=True, initialize=0)
+        m.GHG_Constraint = Constraint(expr=self.ghg <= m.GHG_Bound)
+        m.SI_Constraint = Constraint(expr=self.si >= m.SI_Bound)
+        # Augmentation weights of the epsilon-constrained objectives, so the front points are efficient
+        m.GHG_Weight = Param(mutable=True, initialize=0)
+        m.SI_Weight = Param(mutable=True, initialize=0)
+        m.obj_epsilon = Objective(expr=self.lostmargin + m.GHG_Weight * self.ghg - m.SI_Weight * self.si, sense=minimize)
+        # Payoff table: each objective with the other two as small secondary terms
+        m.obj1 = Objective(expr=self.lostmargin + PAYOFF_WEIGHT * (self.ghg - self.si), sense=minimize)
+        m.obj2 = Objective(expr=self.ghg + PAYOFF_WEIGHT * (self.lostmargin - self.si), sense=minimize)
+        m.obj3 = Objective(expr=-self.si + PAYOFF_WEIGHT * (self.lostmargin + self.ghg), sense=minimize)
+        self.model = m
+        self.solver = Highs()
+        self.solver.config.load_solution = False
+
+    def solve(self, objective, epsilon=None):
+        """Solve with one objective active, under the (GHG, SI) epsilon bounds if given.
+
+        Returns the (lost margin, GHG, SI) of the solution, or None if the problem is infeasible.
+        """
+        m = self.model
+        for name in ('obj_epsilon', 'obj1', 'obj2', 'obj3'):
+            if name == objective:
+                getattr(m, name).activate()
+            else:
+                getattr(m, name).deactivate()
+        if epsilon is None:
+            m.GHG_Constraint.deactivate()
+            m.SI_Constraint.deactivate()
+        else:
+            m.GHG_Constraint.activate()
+            m.SI_Constraint.activate()
+            m.GHG_Bound.value, m.SI_Bound.value = epsilon
+        results = self.solver.solve(m)
+        if results.termination_condition != TerminationCondition.optimal:
+            return None
+        results.solution_loader.load_vars()
+        return self.lostmargin(), self.ghg(), self.si()
+
+
+def _init_worker(instance, engine_options):
+    _worker['engine'] = ScenarioEngine(instance, **engine_options)
+    _worker['model'] = None
+
+
+def _model(scenario_id, scenario):
+    # Rows of the same scenario handled one after the other by a worker share its model and basis
+    if _worker['model'] is None or _worker['model'][0] != scenario_id:
+        _worker['model'] = (scenario_id, EpsilonModel(_worker['engine'], scenario))
+    return _worker['model'][1]
+
+
+def _payoff(scenario_id, scenario):
+    """Return the objective values of the optima of the three objectives."""
+    model = _model(scenario_id, scenario)
+    return [model.solve(objective) for objective in ('obj1', 'obj2', 'obj3')]
+
+
+def _solve_row(scenario_id, scenario, ghg_bound, si_bounds, weights):
+    """Sweep the SI bounds of one GHG bound in increasing order and return the points and cell counts.
+
+    A solution with SI above the next bounds is also the solution of those cells, which are skipped
+    as redundant; once a cell is infeasible the tighter ones are too, and the rest of the row is skipped.
+    """
+    model = _model(scenario_id, scenario)
+    model.model.GHG_Weight.value, model.model.SI_Weight.value = weights
+    points = []
+    counts = {'solved': 0, 'redundant': 0, 'infeasible': 0}
+    k = 0
+    while k < len(si_bounds):
+        point = model.solve('obj_epsilon', (ghg_bound, si_bounds[k]))
+        counts['solved'] += 1
+        if point is None:
+            counts['infeasible'] += len(si_bounds) - k - 1
+            break
+        points.append(point)
+        k += 1
+        while k < len(si_bounds) and si_bounds[k] <= point[2]:
+            counts['redundant'] += 1
+            k += 1
+    return points, counts
+
+
+def non_dominated(points):
+    """Return the points (lost margin, GHG, SI) no other point improves on without being worse in another objective.
+
+    Points within DOMINANCE_TOLERANCE (relative to the range of each objective) of each other count
+    once; the points returned are the solved values, sorted by lost margin, GHG and SI.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    if not len(points):
+        return []
+    points = points[np.lexsort(points.T[::-1])]
+    # Minimize all three objectives
+    costs = points * np.array([1, 1, -1])
+    scale = np.maximum(np.ptp(costs, axis=0), 1) * DOMINANCE_TOLERANCE
+    kept = []
+    for k, cost in enumerate(costs):
+        if not any(np.all(np.abs(costs[j] - cost) <= scale) for j in kept):
+            kept.append(k)
+    costs = costs[kept]
+    front = []
+    for k, cost in zip(kept, costs):
+        weakly_better = np.all(costs <= cost + scale, axis=1)
+        strictly_better = np.any(costs < cost - scale, axis=1)
+        if not np.any(weakly_better & strictly_better):
+            front.append(points[k])
+    return front
+
+
+class ParetoFront:
+    """Epsilon-constraint Pareto fronts of lost margin (obj1), GHG (obj2) and SI (obj3) per scenario.
+
+    The payoff table of each scenario gives the ranges of GHG and SI, which are cut into a
+    grid_points x grid_points grid of epsilon bounds. Lost margin is minimized in every cell with
+    GHG <= bound and SI >= bound, plus a small augmentation rewarding lower GHG and higher SI so the
+    points are efficient. The rows of the grid (one GHG bound each) are solved in parallel in a
+    process pool; a row sweeps its SI bounds in a persistent HiGHS model, warm-started from the
+    previous cell, and skips redundant and infeasible cells.
+    """
+
+    def __init__(self, instance, grid_points=6, processes=None, presolve=False, aggregate_flows=False):
+        self.instance = instance
+        self.grid_points = grid_points
+        self.processes = processes or os.cpu_count()
+        self.engine_options = {'presolve': presolve, 'aggregate_flows': aggregate_flows}
+        # Grid cells per scenario: solved, skipped as redundant and skipped as infeasible
+        self.counts = []
+
+    def _map(self, pool, function, *arguments):
+        if pool is None:
+            return list(map(function, *arguments))
+        return list(pool.map(function, *arguments))
+
+    def fronts(self, scenarios):
+        """Return the non-dominated (lost margin, GHG, SI) points of every scenario."""
+        pool = None
+        if self.processes > 1:
+            pool = ProcessPoolExecutor(self.processes, initializer=_init_worker,
+                                       initargs=(self.instance, self.engine_options))
+        else:
+            _init_worker(self.instance, self.engine_options)
+        try:
+            ids = list(range(len(scenarios)))
+            payoffs = self._map(pool, _payoff, ids, scenarios)
+
+            tasks = []
+            for scenario_id, (scenario, payoff) in enumerate(zip(scenarios, payoffs)):
+                lostmargin = [point[0] for point in payoff]
+                ghg = [point[1] for point in payoff]
+                si = [point[2] for point in payoff]
+                ghg_bounds = np.linspace(min(ghg), max(ghg), self.grid_points)
+                si_bounds = np.linspace(min(si), max(si), self.grid_points).tolist()
+                lostmargin_range = max(lostmargin) - min(lostmargin)
+                weights = tuple(AUGMENTATION * lostmargin_range / span if span > 0 else 0
+                                for span in (max(ghg) - min(ghg), max(si) - min(si)))
+                tasks.extend((scenario_id, scenario, float(bound), si_bounds, weights) for bound in ghg_bounds)
+            rows = self._map(pool, _solve_row, *zip(*tasks))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        points = [list(payoff) for payoff in payoffs]
+        self.counts = [{'solved': 3, 'redundant': 0, 'infeasible': 0} for _ in scenarios]
+        for (scenario_id, *_), (row_points, counts) in zip(tasks, rows):
+            points[scenario_id].extend(row_points)
+            for key, count in counts.items():
+                self.counts[scenario_id][key] += count
+        return [non_dominated(scenario_points) for scenario_points in points]
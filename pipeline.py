@@ -0,0 +1,164 @@
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from main import Main
+from mc_log import MonteCarloStats
+from scenario_engine import STUDY_METRICS, ScenarioEngine
+
+
+def generate_instance(settings, output_dir=None, location_generator=None):
+    """Generate an instance headless with Main and return its TTR/TTS instance dictionary.
+
+    The files Main writes go to output_dir, or to a temporary folder removed afterwards.
+    location_generator optionally reuses a RandomLocationGenerator with the shapefile loaded.
+    """
+    # Settings left to their random default are drawn from the seed, so a run can be repeated
+    if settings.get('seed') is not None:
+        random.seed(settings['seed'])
+    if output_dir is not None:
+        return Main(settings, plots=False, output_dir=output_dir, location_generator=location_generator).instance()
+    with tempfile.TemporaryDirectory() as directory:
+        return Main(settings, plots=False, output_dir=directory, location_generator=location_generator).instance()
+
+
+def solve_instance(instance, studies, n_scenarios, engine_options):
+    """Solve n_scenarios scenarios of an instance and return the mean and standard error of every objective."""
+    engine = ScenarioEngine(instance, **engine_options)
+    metrics = [metric for study in studies for metric in STUDY_METRICS[study]]
+    mc_stats = MonteCarloStats(metrics)
+    for result in engine.solve_scenarios(engine.scenarios(n_scenarios), studies):
+        mc_stats.update(result)
+    return {metric: {'mean': mc_stats.summary(metric).mean, 'sem': mc_stats.summary(metric).sem()}
+            for metric in metrics}
+
+
+class StageStats:
+    """Items, busy time and waiting time of the workers of a pipeline stage."""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+        # Generation: time blocked on a full queue (backpressure); solving: time waiting for an instance
+        self.waiting = 0.0
+
+    def report(self, wall_time):
+        return {'workers': self.workers, 'items': self.items, 'errors': self.errors, 'busy': self.busy,
+                'waiting': self.waiting, 'utilization': self.busy / (wall_time * self.workers) if wall_time else 0.0}
+
+
+class Pipeline:
+    """Generate instances and solve their Monte Carlo scenarios as two concurrent stages.
+
+    Generation workers run Main headless in a process pool and put the instances in a bounded
+    asyncio queue; solve workers take them from the queue and solve n_scenarios scenarios each in
+    a process (or thread) pool, so generating the next instances overlaps with solving the previous
+    ones. A generation worker waits while the queue is full, so at most generate_workers +
+    queue_size + solve_workers instances are in memory whatever the number of settings, which may
+    be a lazy iterable. An instance whose generation or solve fails is reported with its error.
+    """
+
+    def __init__(self, settings, studies=('TTS', 'TTR'), n_scenarios=20, engine_options=None, generate_workers=1,
+                 solve_workers=1, queue_size=2, solve_executor='process', output_root=None, results_path=None):
+        self.settings = settings
+        self.studies = tuple(studies)
+        self.n_scenarios = n_scenarios
+        self.engine_options = engine_options or {}
+        self.generate_workers = generate_workers
+        self.solve_workers = solve_workers
+        self.queue_size = queue_size
+        # 'process', or 'thread' with the scipy backend only: Pyomo redirects the process output around a
+        # solver call, which is not thread-safe. Threads save pickling the instances but share the GIL
+        self.solve_executor = solve_executor
+        # Folder of a subfolder of generated files per instance (None discards the files)
+        self.output_root = output_root
+        # JSON lines file the result of every instance is appended to as soon as it is solved
+        self.results_path = results_path
+        self.results = []
+        self.stats = {}
+        self.max_queued = 0
+        self.wall_time = 0.0
+
+    def run(self):
+        """Run the pipeline over all settings and return the results ordered as the settings."""
+        asyncio.run(self._run())
+        return sorted(self.results, key=lambda result: result['index'])
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.queue_size)
+        # Shared by the generation workers, which each take the next settings
+        pending = iter(enumerate(self.settings))
+        self.results = []
+        self.stats = {'generate': StageStats(self.generate_workers), 'solve': StageStats(self.solve_workers)}
+        solve_executor = ProcessPoolExecutor if self.solve_executor == 'process' else ThreadPoolExecutor
+        start = time.perf_counter()
+        with ProcessPoolExecutor(self.generate_workers) as generate_pool, solve_executor(self.solve_workers) as solve_pool:
+            generators = [asyncio.create_task(self._generate(loop, generate_pool, pending, queue))
+                          for _ in range(self.generate_workers)]
+            solvers = [asyncio.create_task(self._solve(loop, solve_pool, queue)) for _ in range(self.solve_workers)]
+            await asyncio.gather(*generators)
+            for _ in solvers:
+                await queue.put(None)
+            await asyncio.gather(*solvers)
+        self.wall_time = time.perf_counter() - start
+
+    async def _generate(self, loop, pool, pending, queue):
+        stats = self.stats['generate']
+        for k, settings in pending:
+            output_dir = None if self.output_root is None else os.path.join(self.output_root, f'instance_{k:06d}')
+            start = time.perf_counter()
+            try:
+                instance = await loop.run_in_executor(pool, generate_instance, settings, output_dir)
+            except Exception as error:
+                stats.errors += 1
+                self._record({'index': k, 'settings': settings, 'error': f'generation: {error}'})
+                continue
+            finally:
+                stats.busy += time.perf_counter() - start
+            stats.items += 1
+            start = time.perf_counter()
+            await queue.put((k, settings, instance))
+            stats.waiting += time.perf_counter() - start
+            self.max_queued = max(self.max_queued, queue.qsize())
+
+    async def _solve(self, loop, pool, queue):
+        stats = self.stats['solve']
+        while True:
+            start = time.perf_counter()
+            item = await queue.get()
+            stats.waiting += time.perf_counter() - start
+            if item is None:
+                return
+            k, settings, instance = item
+            start = time.perf_counter()
+            try:
+                summary = await loop.run_in_executor(pool, solve_instance, instance, self.studies, self.n_scenarios,
+                                                     self.engine_options)
+            except Exception as error:
+                stats.errors += 1
+                self._record({'index': k, 'settings': settings, 'error': f'solve: {error}'})
+                continue
+            finally:
+                stats.busy += time.perf_counter() - start
+            stats.items += 1
+            self._record({'index': k, 'settings': settings, 'products': len(instance['products']),
+                          'factories': len(instance['factories']), 'factory_products': len(instance['factory_product']),
+                          'summary': summary})
+
+    def _record(self, result):
+        self.results.append(result)
+        if self.results_path is not None:
+            with open(self.results_path, 'a') as f:
+                f.write(json.dumps(result) + '\n')
+
+    def report(self):
+        """Return the wall time, the largest queue length and the items, busy and waiting time of every stage."""
+        return {'wall_time': self.wall_time, 'max_queued': self.max_queued, 'queue_size': self.queue_size,
+                'stages': {name: stats.report(self.wall_time) for name, stats in self.stats.items()}}
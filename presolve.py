@@ -0,0 +1,111 @@
+from flow_index import AGGREGATED, FlowIndex
+
+
+class Presolve:
+    """Shrink the supply chain LP before it is built.
+
+    - Dominated flows are eliminated: flows into a (factory, product) whose production is zero in
+      every scenario because the factory is fully disrupted, and flows out of such a
+      (factory, product) without initial inventory. An optimal solution never uses them.
+    - The BOM rows of such idle (factory, product) pairs are implied by their capacity rows and
+      left out.
+    - With aggregate_flows=True the flows of a child between two factories are merged over the
+      parents using it at the receiving factory. Every supplier of the child can serve every such
+      parent and the flow costs only depend on the factories, so the aggregation is exact;
+      disaggregate() maps an aggregated solution back to the original flows.
+
+    These reductions keep the optimum of every objective. Two further reductions change the model
+    and are only made when asked for: prune_products prunes the products that cannot reach a final
+    product, with their BOM edges and (factory, product) pairs, and drop_unpriced_lanes drops the
+    lanes without a Distance entry. Production and transport they remove count in the PGHG and SI
+    objectives, so the optimum of the TTR study can change.
+
+    reduced_instance is the instance with the pruned data and the 'excluded_flows',
+    'idle_production' and 'aggregate_flows' options of FlowIndex; processtime, capacity and demand
+    keep their nominal keys so scenarios are drawn exactly as for the original instance.
+    """
+
+    def __init__(self, instance, prune_products=False, drop_unpriced_lanes=False, aggregate_flows=False):
+        self.instance = instance
+        self.original_index = FlowIndex(instance['BOM'], instance['factory_product'])
+
+        # Products reaching a final product: reverse search from the final products over the BOM
+        children = {}
+        for (child, parent) in instance['BOM']:
+            children.setdefault(parent, []).append(child)
+        reachable = set(instance['final_products'])
+        queue = list(instance['final_products'])
+        while queue:
+            for child in children.get(queue.pop(), []):
+                if child not in reachable:
+                    reachable.add(child)
+                    queue.append(child)
+        if not prune_products:
+            reachable = set(instance['products'])
+        self.pruned_products = [p for p in instance['products'] if p not in reachable]
+        BOM = {edge: quantity for edge, quantity in instance['BOM'].items() if edge[1] in reachable}
+        factory_product = [key for key in self.original_index.factory_product if key[1] in reachable]
+
+        # (factory, product) pairs that produce nothing in any scenario
+        disrupted = {f for f, rate in instance['fixed_disruption'].items() if rate >= 1}
+        idle = {(f, i) for (f, i) in factory_product if f in disrupted and instance['processtime'][f, i] > 0}
+
+        self.dropped_lanes = []
+        self.dominated_flows = []
+        for flow in FlowIndex(BOM, factory_product).flows:
+            a, child, c, parent = flow
+            if drop_unpriced_lanes and (a, c) not in instance['distance']:
+                self.dropped_lanes.append(flow)
+            elif (c, parent) in idle or ((a, child) in idle and instance['inventory'][a, child] == 0):
+                self.dominated_flows.append(flow)
+        excluded_flows = self.dropped_lanes + self.dominated_flows
+
+        self.idle_production = sorted(idle)
+        self.index = FlowIndex(BOM, factory_product, excluded_flows, aggregate_flows, self.idle_production)
+        self.reduced_instance = dict(instance, products=[p for p in instance['products'] if p in reachable],
+                                     BOM=BOM, factory_product=factory_product, excluded_flows=excluded_flows,
+                                     idle_production=self.idle_production, aggregate_flows=aggregate_flows)
+
+    def model_size(self, index=None):
+        """Return the (variables, constraints) shared by the TTR and TTS models built over index."""
+        index = index or self.index
+        n_fp = len(index.factory_product)
+        # BOM and production rows, then the demand and capacity rows
+        constraints = len(index.bom_rows) + n_fp + len(self.instance['final_products']) + len(self.instance['factories'])
+        return n_fp + len(index.flows), constraints
+
+    def report(self):
+        """Print the model size before and after presolve and what was removed."""
+        variables, constraints = self.model_size(self.original_index)
+        reduced_variables, reduced_constraints = self.model_size()
+        print(f"Presolve: {variables} -> {reduced_variables} variables, {constraints} -> {reduced_constraints} constraints")
+        print(f"  pruned products: {len(self.pruned_products)}, unpriced lanes: {len(self.dropped_lanes)}, "
+              f"dominated flows: {len(self.dominated_flows)}"
+              + (f", aggregated flows: {len(self.index.flows)}" if self.index.aggregate else ""))
+
+    def disaggregate(self, u, y):
+        """Map flow values of the reduced model to the flows (a, child, c, parent) of the original model.
+
+        u maps (factory, product) to production and y maps reduced flows to their values. An
+        aggregated flow fills the BOM requirements of the parents at the receiving factory in
+        order; what is shipped beyond them is assigned to the first parent the lane serves.
+        """
+        flows = dict.fromkeys(self.original_index.flows, 0.0)
+        if not self.index.aggregate:
+            flows.update(y)
+            return flows
+        excluded = set(self.reduced_instance['excluded_flows'])
+        for (c, child), (u_terms, inflows) in self.index.bom_rows.items():
+            needs = [[parent, quantity * u.get((h, parent), 0.0)] for (h, parent, quantity) in u_terms]
+            for (a, _, _, _) in inflows:
+                remaining = y.get((a, child, c, AGGREGATED), 0.0)
+                parents = [need for need in needs if (a, child, c, need[0]) not in excluded]
+                for need in parents:
+                    shipped = min(remaining, need[1])
+                    if shipped > 0:
+                        flows[a, child, c, need[0]] += shipped
+                        need[1] -= shipped
+                        remaining -= shipped
+                if remaining > 0:
+                    flows[a, child, c, parents[0][0]] += remaining
+        return flows
@@ -3,13 +3,13 @@ import os
 from collections import Counter
 from math import radians, sin, cos, sqrt, atan2
 
-import geopandas as gpd
-import matplotlib.pyplot as plt
 import numpy as np
 import shapefile
+from shapely import STRtree, prepare
 from shapely.geometry import Point, shape
 
 from facility import Facility  # Import the Facility class
+from instrumentation import instrumentation
 
 class RandomLocationGenerator:
     def __init__(self, shapefile_path, fixed_seed, min_demand, max_demand):
@@ -37,11 +37,13 @@ class RandomLocationGenerator:
         ]
         self.shp = None
         self.filtered_data = None
+        self.tree = None
         self.count = Counter()
         self.facility_objects = []
 
-        self.load_shapefile()
-        self.filter_shapes_and_records()
+        with instrumentation.stage('load_shapefile'):
+            self.load_shapefile()
+            self.filter_shapes_and_records()
 
     def load_shapefile(self):
         if not os.path.exists(self.shapefile_path):
@@ -52,16 +54,20 @@ class RandomLocationGenerator:
     def filter_shapes_and_records(self):
         self.filtered_data = [(boundary, record) for boundary, record in
                               zip(self.shp.shapes(), self.shp.records()) if record[2] in self.country_codes]
+        # Country geometries are converted and prepared once, and indexed for the point-in-country test of sample
+        geometries = [shape(boundary) for boundary, record in self.filtered_data]
+        for geometry in geometries:
+            prepare(geometry)
+        self.tree = STRtree(geometries)
 
     def sample(self, num_locations, min_x=-180, max_x=180, min_y=-90, max_y=90):
         locations = []
         while len(locations) < num_locations:
             location = (np.random.uniform(min_x, max_x), np.random.uniform(min_y, max_y))
-            for boundary, record in sorted(self.filtered_data, key=lambda x: -self.count[x[1][2]]):
-                if Point(location).within(shape(boundary)):
-                    self.count[record[2]] += 1
-                    locations.append(location)
-                    break
+            countries = self.tree.query(Point(location), predicate='within')
+            if len(countries):
+                self.count[self.filtered_data[countries[0]][1][2]] += 1
+                locations.append(location)
         return locations
 
     @staticmethod
@@ -74,36 +80,39 @@ class RandomLocationGenerator:
         r = 6371  # Radius of earth in kilometers
         return r * c
 
-    def generate_random_locations(self, num_locations):
+    def generate_random_locations(self, num_locations, plot=True, output_dir=None):
+        """Sample the facilities and write their figure and files to output_dir (the output folder by default)."""
         np.random.seed(self.fixed_seed)  # Ensure the same seed is used for reproducibility
-        random_locations = self.sample(num_locations)
+        with instrumentation.stage('sample'):
+            random_locations = self.sample(num_locations)
 
-        # Clear any previous facility objects
-        self.facility_objects = []
+        self.create_facilities(random_locations)
+        with instrumentation.stage('distances'):
+            self.compute_distances()
 
-        for index, (lon, lat) in enumerate(random_locations):
-            ttr = np.random.randint(2, 11)  # Random TTR between 2 and 10
-            si = np.random.randint(1, 11)  # Random SI between 1 and 10
-            capacity = np.random.randint(self.min_demand * 5, self.min_demand * 10 + 1)  # Capacity between min_demand * 2 and min_demand * 5
-            facility_obj = Facility(index, lat, lon, ttr, si, capacity)
-            self.facility_objects.append(facility_obj)
+        if plot:
+            with instrumentation.stage('plot'):
+                self.plot_locations(random_locations, num_locations, output_dir)
 
-        # Sort facility objects based on their indices
-        self.facility_objects.sort(key=lambda fac: fac.index)
+        # Ensure the 'output' directory exists
+        output_directory = os.path.abspath(output_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output'))
+        os.makedirs(output_directory, exist_ok=True)
 
-        # Compute distances between all facilities
-        for i, fac1 in enumerate(self.facility_objects):
-            for j, fac2 in enumerate(self.facility_objects):
-                if i < j:  # Ensure each pair is only processed once
-                    distance = self.haversine(fac1.lon, fac1.lat, fac2.lon, fac2.lat)
-                    fac1.distances[fac2.index] = distance
-                    fac2.distances[fac1.index] = distance  # Assign the distance from j to i
-                    # Compute TGHG
-                    fac1.tghg[fac2.index] = distance * 1.05
-                    fac2.tghg[fac1.index] = distance * 1.05  # Assign the TGHG from j to i
-                elif i == j:
-                    fac1.distances[fac1.index] = 0  # Distance to itself is zero
-                    fac1.tghg[fac1.index] = 0  # TGHG to itself is zero
+        # Write Facility objects to Facilities.txt
+        with instrumentation.stage('export'):
+            facilities_file = os.path.join(output_directory, 'Facilities.txt')
+            with open(facilities_file, 'w') as f:
+                for fac in self.facility_objects:
+                    f.write(f"{fac}\n")
+            # print(f"Facility details saved to {facilities_file}")
+            self.export_facility_data_to_json(os.path.join(output_directory, 'facility_data.json'))
+            self.export_tghg_to_json(os.path.join(output_directory, 'tghg_data.json'))
+
+    def plot_locations(self, random_locations, num_locations, output_dir=None):
+        """Plot the locations and the distances between them on the world map and save the figure."""
+        # geopandas and matplotlib take most of the import time of the generator: only load them to plot
+        import geopandas as gpd
+        import matplotlib.pyplot as plt
 
         # Create GeoDataFrame for plotting
         gdf_locations = gpd.GeoDataFrame(geometry=[Point(lon, lat) for lon, lat in random_locations],
@@ -144,7 +153,7 @@ class RandomLocationGenerator:
         plt.pause(2)
 
         # Ensure the 'output' directory exists
-        output_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output')
+        output_directory = output_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output')
         os.makedirs(output_directory, exist_ok=True)
 
         # Save the plot as a PNG file in the 'output' directory
@@ -152,14 +161,55 @@ class RandomLocationGenerator:
         plt.savefig(file_name)
         plt.close()
 
-        # Write Facility objects to Facilities.txt
-        facilities_file = os.path.join(output_directory, 'Facilities.txt')
-        with open(facilities_file, 'w') as f:
-            for fac in self.facility_objects:
-                f.write(f"{fac}\n")
-        # print(f"Facility details saved to {facilities_file}")
-        self.export_facility_data_to_json('facility_data.json')
-        self.export_tghg_to_json('tghg_data.json')
+    def add_random_locations(self, num_locations):
+        """Sample num_locations more facilities and compute only their distances; the existing facilities stay unchanged.
+
+        The new locations are drawn with the seed and the number of existing facilities, so the same
+        growth steps give the same facilities. Returns the new facilities.
+        """
+        start = len(self.facility_objects)
+        np.random.seed([self.fixed_seed, start])
+        with instrumentation.stage('sample'):
+            locations = self.sample(num_locations)
+        self.add_facilities(locations)
+        with instrumentation.stage('distances'):
+            self.compute_distances(start)
+        return self.facility_objects[start:]
+
+    def create_facilities(self, locations):
+        """Create a Facility with random TTR, SI and capacity at every (lon, lat) location."""
+        # Clear any previous facility objects
+        self.facility_objects = []
+        self.add_facilities(locations)
+
+    def add_facilities(self, locations):
+        """Append a Facility with random TTR, SI and capacity at every (lon, lat) location."""
+        for index, (lon, lat) in enumerate(locations, len(self.facility_objects)):
+            ttr = np.random.randint(2, 11)  # Random TTR between 2 and 10
+            si = np.random.randint(1, 11)  # Random SI between 1 and 10
+            capacity = np.random.randint(self.min_demand * 5, self.min_demand * 10 + 1)  # Capacity between min_demand * 2 and min_demand * 5
+            facility_obj = Facility(index, lat, lon, ttr, si, capacity)
+            self.facility_objects.append(facility_obj)
+
+        # Sort facility objects based on their indices
+        self.facility_objects.sort(key=lambda fac: fac.index)
+
+    def compute_distances(self, start=0):
+        """Compute the distances and TGHG between every pair of facilities, or only the pairs with a facility from start on."""
+        # Compute distances between all facilities
+        for i, fac1 in enumerate(self.facility_objects):
+            for j in range(max(i, start), len(self.facility_objects)):
+                fac2 = self.facility_objects[j]
+                if i < j:  # Ensure each pair is only processed once
+                    distance = self.haversine(fac1.lon, fac1.lat, fac2.lon, fac2.lat)
+                    fac1.distances[fac2.index] = distance
+                    fac2.distances[fac1.index] = distance  # Assign the distance from j to i
+                    # Compute TGHG
+                    fac1.tghg[fac2.index] = distance * 1.05
+                    fac2.tghg[fac1.index] = distance * 1.05  # Assign the TGHG from j to i
+                elif i == j:
+                    fac1.distances[fac1.index] = 0  # Distance to itself is zero
+                    fac1.tghg[fac1.index] = 0  # TGHG to itself is zero
 
     def get_facilities(self):
         """Return the list of Facility objects."""
@@ -0,0 +1,75 @@
+import hashlib
+import json
+import sqlite3
+
+
+def _canonical(obj):
+    """Return obj as JSON-serializable data that does not depend on dict order or int/float types."""
+    if isinstance(obj, dict):
+        return sorted([_canonical(key), _canonical(value)] for key, value in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return [_canonical(item) for item in obj]
+    if isinstance(obj, bool) or obj is None or isinstance(obj, str):
+        return obj
+    # Numbers: repr of the float round-trips exactly, and 5 and 5.0 give the same LP
+    return repr(float(obj))
+
+
+def fingerprint(*parts):
+    """Return a hex digest identifying the content of parts."""
+    return hashlib.sha256(json.dumps(_canonical(parts), separators=(',', ':')).encode()).hexdigest()
+
+
+class ResultCache:
+    """Persistent cache of the objective values of solved scenarios, in an SQLite file.
+
+    Entries are keyed by a fingerprint of the instance data, the model variant, the study and the
+    scenario parameters, so a scenario is only solved once for the same model whatever the run it
+    belongs to. When more than max_entries results are stored, the least recently used are evicted.
+    """
+
+    def __init__(self, path, max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                                'used INTEGER NOT NULL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+        # Logical clock of the least recently used eviction
+        self.clock = self.connection.execute('SELECT COALESCE(MAX(used), 0) FROM results').fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys):
+        """Return the cached values of keys as a dictionary, leaving out the keys not cached."""
+        found = {}
+        keys = list(keys)
+        # Stay below the SQLite limit on query parameters
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self.connection.execute(f"SELECT key, value FROM results WHERE key IN ({','.join('?' * len(chunk))})",
+                                           chunk).fetchall()
+            found.update((key, json.loads(value)) for key, value in rows)
+        self.clock += 1
+        self.connection.executemany('UPDATE results SET used = ? WHERE key = ?', [(self.clock, key) for key in found])
+        self.connection.commit()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        """Store (key, value) pairs and evict the least recently used entries beyond max_entries."""
+        self.clock += 1
+        self.connection.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+                                    [(key, json.dumps(value), self.clock) for key, value in items])
+        excess = self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0] - self.max_entries
+        if excess > 0:
+            self.connection.execute('DELETE FROM results WHERE key IN '
+                                    '(SELECT key FROM results ORDER BY used LIMIT ?)', (excess,))
+        self.connection.commit()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
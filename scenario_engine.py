@@ -0,0 +1,541 @@
+import random
+import time
+
+import numpy as np
+
+from flow_index import FlowIndex
+from instrumentation import instrumentation
+from mc_log import MonteCarloStats, ResultLog
+from presolve import Presolve
+from result_cache import ResultCache, fingerprint
+from scenario_sampler import ScenarioSampler, group_size
+
+# Objective values reported by each study
+STUDY_METRICS = {'TTR': ('Lostmargin', 'PGHG', 'TGHG', 'SI'), 'TTS': ('TTS',)}
+
+
+def instance_fingerprint(instance):
+    """Return the fingerprint of the instance data the results of a scenario depend on."""
+    # Sampling settings only decide which scenarios are drawn, not how a scenario is solved
+    return fingerprint({key: values for key, values in instance.items()
+                        if key not in ('processtime', 'capacity', 'demand', 'disruption_bounds', 'fixed_disruption')})
+
+
+class ScenarioEngine:
+    """Generate and build every Monte Carlo scenario once and derive the TTS and TTR solves from it.
+
+    A scenario is a (processtime, capacity, demand, disruptionrate) tuple of perturbed parameters.
+    With the pyomo backend a batch of scenarios becomes one model with a block per scenario; the
+    BOM and production/inventory constraints of a block are shared, and the TTS and TTR demand and
+    capacity constraints are activated in turn for the TTS solve and the three lexicographic TTR
+    stages. With the scipy backend the same scenario arrays feed SparseLP, and with the benders
+    backend BendersLP, which solves the flows in subproblems per child product (see BendersLP;
+    decomposition_options are passed to it). The pyomo backend is the reference path.
+
+    solver_mode (pyomo backend) 'cold' starts CBC from scratch for each lexicographic TTR stage;
+    'persistent' keeps the model in an in-memory HiGHS instance (Pyomo APPSI), so stages 2 and 3
+    only push the added constraint and the new objective and re-solve from the previous basis.
+    batch_size scenarios are stacked into one block-diagonal LP per solver call, which amortizes
+    the solver launch and file I/O of the pyomo backend. With sampling='random' scenario i is drawn
+    from random.Random(i); 'mc', 'sobol', 'lhs' and 'antithetic' draw all perturbations of a pass as
+    one NumPy array with ScenarioSampler. Studies run with the same sampling and sampling_seed see
+    the same scenarios (common random numbers). Antithetic pairs and the randomized Sobol and LHS
+    replicates are the independent observations of the confidence interval (group_size scenarios each).
+
+    With presolve=True the models are built over the reduced instance of Presolve, while the
+    scenarios are still drawn from the full instance; aggregate_flows merges the flows of a child
+    between two factories over its parents (see FlowIndex). With prefilter=True the BOM explosion
+    bounds every scenario first: TTS-only scenarios the bounds decide are solved without an LP,
+    and the TTS upper bound and lost sales lower bounds are passed to the solver for the rest.
+    With screening=True (scipy and benders backends) the nominal TTS and TTR LPs are solved once and
+    every batch of scenarios is first evaluated from their optimal bases (see SensitivityScreen):
+    only the scenarios whose perturbation leaves the range where a basis stays optimal are solved.
+    With cache_path the results of every scenario and study are kept in a ResultCache, so scenarios
+    solved before for the same instance and model variant are not solved again. With shared (a
+    SharedInstance, scipy backend) the LP is assembled over the memory-mapped arrays of a published
+    instance instead of being built, and instance only needs the scenario tables (see SharedInstance.instance).
+    """
+
+    def __init__(self, instance, backend='pyomo', solver_mode='cold', batch_size=1, sampling='random',
+                 sampling_seed=0, presolve=False, aggregate_flows=False, prefilter=False,
+                 cache_path=None, cache_max_entries=100000, decomposition_options=None, screening=False,
+                 shared=None):
+        self.instance = instance
+        self.backend = backend
+        self.solver_mode = solver_mode
+        self.batch_size = batch_size
+        self.sampling = sampling
+        self.sampling_seed = sampling_seed
+        # Consecutive scenarios forming one independent observation
+        self.group_size = group_size(sampling)
+        self.prefilter = prefilter
+        self.instance_fingerprint = shared.fingerprint if shared is not None else instance_fingerprint(instance)
+        # Every option changing the model solved or the precision of its results keys the cached results
+        self.model_variant = {'backend': backend, 'solver': 'cbc' if backend == 'pyomo' and solver_mode == 'cold' else 'highs',
+                              'relaxation': 1.001, 'presolve': presolve, 'aggregate_flows': aggregate_flows,
+                              'prefilter': prefilter}
+        if backend == 'benders':
+            from benders import GAP_TOLERANCE
+
+            self.model_variant['gap_tolerance'] = (decomposition_options or {}).get('gap_tolerance', GAP_TOLERANCE)
+        if screening:
+            self.model_variant['screening'] = True
+        self.cache = ResultCache(cache_path, cache_max_entries) if cache_path is not None else None
+
+        if shared is not None:
+            if backend != 'scipy' or presolve or prefilter or aggregate_flows != shared.aggregate_flows:
+                raise ValueError("A shared instance is solved with the scipy backend, without presolve or prefilter "
+                                 "and with the aggregate_flows it was published with")
+            # The LP is assembled over the shared arrays, no flow index is built
+            self.index = None
+            self.model_data = instance
+        elif presolve:
+            self.presolve = Presolve(instance, aggregate_flows=aggregate_flows)
+            self.presolve.report()
+            self.index = self.presolve.index
+            # Data the models are built from
+            self.model_data = self.presolve.reduced_instance
+        else:
+            self.index = FlowIndex(instance['BOM'], instance['factory_product'], aggregate=aggregate_flows)
+            self.model_data = instance
+        self.factory_relations = self.index.factory_relations() if self.index is not None else None
+        # Solve time of every solver call, per TTS solve and per lexicographic TTR stage
+        self.stage_times = {'TTS': [], 'Lostmargin': [], 'GHG': [], 'SI': []}
+
+        # Pyomo and the scipy solvers are imported by the backend that uses them only
+        if backend in ('scipy', 'benders'):
+            if backend == 'scipy':
+                from sparse_lp import SparseLP as LP
+                options = {}
+            else:
+                from benders import BendersLP as LP
+                options = decomposition_options or {}
+
+            # Scenario-independent rows and cost vectors are assembled once
+            data = self.model_data
+            if shared is not None:
+                self.lp = shared.lp()
+            else:
+                self.lp = LP(data['products'], data['factories'], data['final_products'],
+                             data['BOM'], data['factory_product'], data['inventory'],
+                             pghg=data['pghg'], distance=data['distance'], tghg=data['TGHG'],
+                             si=data['si'], profitmargin=data['profitmargin'],
+                             excluded_flows=data.get('excluded_flows', ()), aggregate_flows=aggregate_flows,
+                             idle_production=data.get('idle_production', ()), **options)
+        else:
+            from pyomo.environ import SolverFactory
+
+            self.solver = SolverFactory('appsi_highs' if solver_mode == 'persistent' else 'cbc')
+
+        if prefilter:
+            from bom_explosion import BOMExplosion
+
+            data = self.model_data
+            self.explosion = BOMExplosion(data['products'], data['factories'], data['final_products'], data['BOM'],
+                                          data['factory_product'], data['inventory'], data['profitmargin'])
+        # Scenarios bounded by the prefilter, and how many TTS solves it decided
+        self.prefilter_counts = {'scenarios': 0, 'TTS_decided': 0, 'Lostmargin_decided': 0}
+
+        self.screen = None
+        if screening:
+            if backend not in ('scipy', 'benders'):
+                raise ValueError("Sensitivity screening needs the scipy or benders backend")
+            from screening import SensitivityScreen
+
+            self.screen = SensitivityScreen(self.lp, self.instance, self.model_variant['relaxation'])
+
+        if sampling != 'random':
+            self.sampler = ScenarioSampler(instance['processtime'], instance['capacity'], instance['demand'],
+                                           instance['disruption_bounds'], instance['fixed_disruption'],
+                                           method=sampling, seed=sampling_seed)
+
+    def random_scenario(self, iter):
+        """Draw scenario iter from random.Random(iter)."""
+        # IMPORTANT: we should generate random valuse and for each time these value are fixed for all 3 run of objective functions so
+        #  we can use random.Random(i) which i is iteration. A generator per call draws the same values as
+        #  random.seed(i) without sharing the global state with engines solving in other threads
+        rng = random.Random(iter)
+
+        disruptionrate = {i: 0 for i in self.instance['factories']}
+
+        # Apply perturbation to uncertain parameters (10% perturbation)
+        for f, (low, high) in self.instance['disruption_bounds'].items():
+            disruptionrate[f] = rng.uniform(low, high)
+        disruptionrate.update(self.instance['fixed_disruption'])
+
+        scenario_processtime = {key: original_value * rng.uniform(0.9, 1.1)
+                                for key, original_value in self.instance['processtime'].items()}
+        scenario_capacity = {key: int(round(original_value * rng.uniform(0.9, 1.1)))
+                             for key, original_value in self.instance['capacity'].items()}
+
+        # Apply perturbation to Demand
+        scenario_demand = {key: int(round(original_value * rng.uniform(0.9, 1.1)))
+                           for key, original_value in self.instance['demand'].items()}
+        return scenario_processtime, scenario_capacity, scenario_demand, disruptionrate
+
+    def scenarios(self, n, start=0):
+        """Return scenarios start to n."""
+        with instrumentation.stage('sampling'):
+            if self.sampling != 'random':
+                return self.sampler.scenarios(n)[start:]
+            return [self.random_scenario(iter) for iter in range(start, n)]
+
+    def run_description(self):
+        """Return the settings that determine the scenarios and their results, stored with logged runs."""
+        return {'instance': self.instance_fingerprint, 'sampling': self.sampling, 'sampling_seed': self.sampling_seed,
+                'group_size': self.group_size}
+
+    def estimator_values(self, values):
+        """Return the values the confidence interval is computed on (antithetic pairs and QMC replicates are averaged)."""
+        if self.sampling != 'random':
+            return self.sampler.estimator_values(values)
+        return np.asarray(values, dtype=float)
+
+    def build_model(self, batch, studies, bounds=None):
+        """Build one Pyomo model with a block per scenario of the batch, with optional prefilter bounds per scenario."""
+        from pyomo.environ import Block, ConcreteModel, Param, Set
+
+        data = self.model_data
+        fp = self.index.factory_product
+        # Create a Concrete Model
+        m = ConcreteModel()
+
+        # set of All products
+        m.Products = Set(initialize=data['products'])
+        # set of all factories
+        m.Factories = Set(initialize=data['factories'])
+        # set of final products
+        m.Final_Products = Set(initialize=data['final_products'])
+        m.Factory_Product = Set(dimen=2, initialize=self.index.factory_product)
+        # set of Flows
+        m.Flows = Set(dimen=4, initialize=self.index.flows)
+        m.Factory_Relation = Set(dimen=2, initialize=self.factory_relations)
+
+        # Deterministic parameters
+        m.Inventory = Param(m.Factory_Product, initialize={key: data['inventory'][key] for key in fp})
+        if 'TTR' in studies:
+            m.Profitmargin = Param(m.Final_Products, initialize=data['profitmargin'])
+            m.PGHG = Param(m.Factory_Product, initialize={key: data['pghg'][key] for key in fp})
+            m.Distance = Param(m.Factory_Relation, initialize={key: data['distance'][key] for key in self.factory_relations
+                                                               if key in data['distance']})
+            m.SI = Param(m.Factories, initialize=data['si'])
+
+        m.Scenarios = Block(range(len(batch)))
+        for k, scenario in enumerate(batch):
+            self.build_scenario(m.Scenarios[k], m, scenario, studies, bounds[k] if bounds else None)
+        return m
+
+    def build_scenario(self, b, m, scenario, studies, bound=None):
+        """Add the parameters, variables and constraints of one scenario to block b."""
+        from pyomo.environ import ConstraintList, Expression, NonNegativeReals, Param, Var
+
+        scenario_processtime, scenario_capacity, scenario_demand, disruptionrate = scenario
+        index = self.index
+        TTR = self.instance['TTR']
+        TGHG = self.instance['TGHG']
+
+        # Uncertain parameters
+        b.Process_Time = Param(m.Factory_Product, initialize={key: scenario_processtime[key] for key in index.factory_product},
+                               mutable=True)
+        b.Capacity = Param(m.Factories, initialize=scenario_capacity, mutable=True)
+        b.Demand = Param(m.Final_Products, initialize=scenario_demand, mutable=True)
+        b.Disruption_Rate = Param(m.Factories, initialize=disruptionrate, mutable=True)
+
+        # Variables
+        b.u = Var(m.Factory_Product, within=NonNegativeReals)
+        b.y = Var(m.Flows, within=NonNegativeReals)
+
+        # Constraints shared by both studies
+        b.Constraints = ConstraintList()
+
+        # BOM constraints
+        for u_terms, inflows in index.bom_rows.values():
+            b.Constraints.add(sum(b.u[h, j] * quantity for (h, j, quantity) in u_terms) <= sum(b.y[flow] for flow in inflows))
+
+        #Production and Inventory constraint
+        for (f, i) in m.Factory_Product:
+            b.Constraints.add(sum(b.y[flow] for flow in index.flows_out[f, i]) <= b.u[f, i] + m.Inventory[f, i])
+
+        if 'TTS' in studies:
+            b.TTS = Var(within=NonNegativeReals)
+            if bound is not None:
+                b.TTS.setub(bound['TTS'])
+            b.TTS_Constraints = ConstraintList()
+
+            # Demand satisfying
+            for i in m.Final_Products:
+                b.TTS_Constraints.add(sum(b.u[f, i] + m.Inventory[f, i] for f in index.product_factories.get(i, [])) >= b.Demand[i] * b.TTS)
+
+            # Capacity constraint
+            for f in m.Factories:
+                b.TTS_Constraints.add(sum(b.Process_Time[f, i] * b.u[f, i] for i in index.factory_products.get(f, [])) <= b.Capacity[f] * b.TTS * (1 - b.Disruption_Rate[f]))
+
+        if 'TTR' in studies:
+            b.l = Var(m.Final_Products, within=NonNegativeReals)
+            if bound is not None:
+                for i, lost_sales in zip(self.model_data['final_products'], bound['Lost_sales']):
+                    b.l[i].setlb(lost_sales)
+
+            # Objective values of the lexicographic stages
+            b.Lostmargin = Expression(expr=sum(m.Profitmargin[i] * b.l[i] for i in m.Final_Products))
+            b.PGHG_value = Expression(expr=sum(m.PGHG[f, i] * b.u[f, i] for f, i in m.Factory_Product))
+            b.TGHG_value = Expression(expr=sum(TGHG * m.Distance[f1, f2] * b.y[f1, p1, f2, p2] for (f1, p1, f2, p2) in m.Flows if (f1, f2) in m.Distance))
+            b.SI_value = Expression(expr=sum(m.SI[f] * b.u[f, i] for (f, i) in m.Factory_Product))
+
+            b.TTR_Constraints = ConstraintList()
+
+            # Demand satisfying
+            for i in m.Final_Products:
+                b.TTR_Constraints.add(b.l[i] + sum(b.u[f, i] + m.Inventory[f, i] for f in index.product_factories.get(i, [])) >= b.Demand[i] * TTR)
+
+            # Upper bound for lost sales
+            for i in m.Final_Products:
+                b.TTR_Constraints.add(b.l[i] <= b.Demand[i] * TTR)
+
+            # Capacity constraint
+            for f in m.Factories:
+                b.TTR_Constraints.add(sum(b.Process_Time[f, i] * b.u[f, i] for i in index.factory_products.get(f, [])) <= b.Capacity[f] * TTR * (1 - b.Disruption_Rate[f]))
+
+    def _solve(self, m, stage):
+        with instrumentation.solver_call(stage, model=m):
+            start = time.perf_counter()
+            # tee=False keeps the solver log out of the console
+            self.solver.solve(m, tee=False)
+            self.stage_times[stage].append(time.perf_counter() - start)
+
+    def solve_batch(self, batch, studies, bounds=None):
+        """Solve the studies for a batch of scenarios and return one result dictionary per scenario."""
+        if self.backend in ('scipy', 'benders'):
+            return self._solve_batch_sparse(batch, studies, bounds)
+        from pyomo.environ import Objective, maximize, minimize, value
+
+        with instrumentation.stage('build'):
+            m = self.build_model(batch, studies, bounds)
+        blocks = [m.Scenarios[k] for k in range(len(batch))]
+        results = [{} for _ in batch]
+
+        # The blocks share no variables, so optimizing the sum of their objectives optimizes every scenario
+        if 'TTS' in studies:
+            for b in blocks:
+                if 'TTR' in studies:
+                    b.TTR_Constraints.deactivate()
+            m.obj_TTS = Objective(expr=sum(b.TTS for b in blocks), sense=maximize)
+            self._solve(m, 'TTS')
+            for result, b in zip(results, blocks):
+                result['TTS'] = value(b.TTS)
+            m.obj_TTS.deactivate()
+            for b in blocks:
+                b.TTS_Constraints.deactivate()
+                if 'TTR' in studies:
+                    b.TTR_Constraints.activate()
+
+        if 'TTR' in studies:
+            # Step 1: Optimize the first objective
+            m.obj1 = Objective(expr=sum(b.Lostmargin for b in blocks), sense=minimize)
+            self._solve(m, 'Lostmargin')
+            for result, b in zip(results, blocks):
+                result['Lostmargin'] = value(b.Lostmargin)
+
+            # Step 2: Optimize the second objective
+            # Fixing optimal value for the first objective function
+            for result, b in zip(results, blocks):
+                b.TTR_Constraints.add(b.Lostmargin <= 1.001 * result['Lostmargin'])
+            m.obj1.deactivate()
+            m.obj2 = Objective(expr=sum(b.PGHG_value + b.TGHG_value for b in blocks), sense=minimize)
+            self._solve(m, 'GHG')
+            for result, b in zip(results, blocks):
+                result['PGHG'] = value(b.PGHG_value)
+                result['TGHG'] = value(b.TGHG_value)
+
+            # Step 3: Optimize the third objective
+            # Fixing optimal value for the second objective function
+            for result, b in zip(results, blocks):
+                b.TTR_Constraints.add(b.PGHG_value + b.TGHG_value <= 1.001 * (result['PGHG'] + result['TGHG']))
+            m.obj2.deactivate()
+            m.obj3 = Objective(expr=sum(b.SI_value for b in blocks), sense=maximize)
+            self._solve(m, 'SI')
+            for result, b in zip(results, blocks):
+                result['SI'] = value(b.SI_value)
+        return results
+
+    def _solve_batch_sparse(self, batch, studies, bounds=None):
+        results = [{} for _ in batch]
+        if bounds is None:
+            bounds = [{'TTS': None, 'Lost_sales': None} for _ in batch]
+        if 'TTS' in studies:
+            start = time.perf_counter()
+            if len(batch) == 1:
+                tts_values = [self.lp.solve_tts(*batch[0], bounds[0]['TTS'])]
+            else:
+                tts_values = self.lp.solve_tts_batch(batch, [bound['TTS'] for bound in bounds])
+            self.stage_times['TTS'].append(time.perf_counter() - start)
+            for result, tts in zip(results, tts_values):
+                result['TTS'] = tts
+        if 'TTR' in studies:
+            for result, scenario, bound in zip(results, batch, bounds):
+                result.update(self.lp.solve_ttr(*scenario, self.instance['TTR'], lost_sales_bound=bound['Lost_sales']))
+                for stage, stage_time in zip(('Lostmargin', 'GHG', 'SI'), self.lp.last_stage_times):
+                    self.stage_times[stage].append(stage_time)
+        return results
+
+    def solve_scenarios(self, scenarios, studies):
+        """Solve scenarios in batches of batch_size and return one result dictionary per scenario."""
+        if self.cache is None:
+            return self._solve_scenarios(scenarios, studies)
+
+        # Look up every (scenario, study); each scenario is solved for the studies it misses
+        keys = [{study: fingerprint(self.instance_fingerprint, self.model_variant, study, scenario) for study in studies}
+                for scenario in scenarios]
+        with instrumentation.stage('cache'):
+            cached = self.cache.get_many(key for scenario_keys in keys for key in scenario_keys.values())
+        results = [{} for _ in scenarios]
+        missing = {}
+        for k, scenario_keys in enumerate(keys):
+            for study, key in scenario_keys.items():
+                if key in cached:
+                    results[k].update(cached[key])
+            missing_studies = tuple(study for study, key in scenario_keys.items() if key not in cached)
+            if missing_studies:
+                missing.setdefault(missing_studies, []).append(k)
+        for missing_studies, indices in missing.items():
+            solved = self._solve_scenarios([scenarios[k] for k in indices], missing_studies)
+            items = []
+            for k, result in zip(indices, solved):
+                results[k].update(result)
+                items.extend((keys[k][study], {metric: result[metric] for metric in STUDY_METRICS[study]})
+                             for study in missing_studies)
+            with instrumentation.stage('cache'):
+                self.cache.put_many(items)
+        return results
+
+    def _solve_scenarios(self, scenarios, studies):
+        if self.screen is None:
+            return self._solve_unscreened(scenarios, studies)
+
+        # Scenarios the nominal bases decide get their results without a solve; the rest are solved for the studies they miss
+        with instrumentation.stage('screening'):
+            results = self.screen.screen(scenarios, studies)
+        missing = {}
+        for k, result in enumerate(results):
+            missing_studies = tuple(study for study in studies if STUDY_METRICS[study][0] not in result)
+            if missing_studies:
+                missing.setdefault(missing_studies, []).append(k)
+        for missing_studies, indices in missing.items():
+            for k, result in zip(indices, self._solve_unscreened([scenarios[k] for k in indices], missing_studies)):
+                results[k].update(result)
+        return results
+
+    def _solve_unscreened(self, scenarios, studies):
+        if not self.prefilter:
+            results = []
+            for batch_start in range(0, len(scenarios), self.batch_size):
+                results.extend(self.solve_batch(scenarios[batch_start:batch_start + self.batch_size], studies))
+            return results
+
+        # Bound all scenarios at once; with the TTS study alone a scenario decided by the bounds needs no LP
+        with instrumentation.stage('prefilter'):
+            bounds = self.explosion.scenario_bounds(scenarios, self.instance['TTR'] if 'TTR' in studies else None)
+        self.prefilter_counts['scenarios'] += len(scenarios)
+        self.prefilter_counts['Lostmargin_decided'] += int(bounds.get('Lostmargin_decided', np.zeros(0)).sum())
+        results = [None] * len(scenarios)
+        remaining = []
+        for k in range(len(scenarios)):
+            if bounds['TTS_decided'][k] and 'TTR' not in studies:
+                results[k] = {'TTS': float(bounds['TTS_value'][k])}
+                self.prefilter_counts['TTS_decided'] += 1
+            else:
+                remaining.append(k)
+        for batch_start in range(0, len(remaining), self.batch_size):
+            batch = remaining[batch_start:batch_start + self.batch_size]
+            batch_bounds = [{'TTS': float(bounds['TTS'][k]),
+                             'Lost_sales': bounds['Lost_sales'][k].tolist() if 'Lost_sales' in bounds else None}
+                            for k in batch]
+            for k, result in zip(batch, self.solve_batch([scenarios[k] for k in batch], studies, batch_bounds)):
+                results[k] = result
+        return results
+
+    def report_stage_times(self):
+        """Print the solve time of each solver call type, so the effect of the solver settings is visible."""
+        for stage, times in self.stage_times.items():
+            if times:
+                print(f"{stage} solve time: mean {1000 * np.mean(times):.2f} ms, total {sum(times):.2f} s over {len(times)} solves")
+        if self.backend == 'benders':
+            for stage, gaps in self.lp.gaps.items():
+                if gaps:
+                    print(f"{stage} decomposition: largest certified gap {max(gaps):.2e}, "
+                          f"mean {np.mean(self.lp.iterations[stage]):.1f} Benders iterations")
+        if self.prefilter:
+            counts = self.prefilter_counts
+            print(f"Prefilter: {counts['TTS_decided']} TTS solves avoided and {counts['Lostmargin_decided']} lost margins "
+                  f"fixed by the BOM explosion bounds over {counts['scenarios']} scenarios")
+        if self.screen is not None:
+            counts = self.screen.counts
+            print(f"Screening: {counts['TTS']} TTS and {counts['TTR']} TTR solves avoided over {counts['scenarios']} "
+                  f"scenarios by the nominal optimal bases")
+        if self.cache is not None:
+            print(f"Result cache: {self.cache.hits} hits, {self.cache.misses} solves, {len(self.cache)} entries")
+
+
+def run_monte_carlo(engine, studies, confidence_level=0.95, Initial_iterations=20, Step_size=10, tolerance=0.3,
+                    max_iterations=50, log_path=None, checkpoint_every=10):
+    """Add scenarios until the confidence interval of every objective is within tolerance of its mean.
+
+    Each pass only solves the scenarios added since the previous pass and updates streaming
+    statistics. With log_path the results are appended to a ResultLog with a checkpoint every
+    checkpoint_every scenarios, and a run interrupted with the same log_path resumes after the last
+    logged scenario.
+    The interval is computed over the independent observations of the sampling (antithetic pairs,
+    Sobol or LHS replicates, see ScenarioSampler), so the scenario counts are rounded up to whole
+    observations.
+    Returns a dictionary of value lists per objective, empty if the tolerance was never reached.
+    """
+    metrics = [metric for study in studies for metric in STUDY_METRICS[study]]
+    group = engine.group_size
+    Initial_iterations = -(-Initial_iterations // group) * group
+    Step_size = -(-Step_size // group) * group
+    results = []
+    log = None
+    if log_path is not None:
+        log = ResultLog(log_path, metrics, engine.run_description(), checkpoint_every)
+        mc_stats = log.restore(group)
+        if mc_stats.n:
+            print(f"Resuming after {mc_stats.n} logged scenarios.")
+    else:
+        mc_stats = MonteCarloStats(metrics, group)
+
+    Total_iterations = 0
+    while Total_iterations < max_iterations:
+        if mc_stats.n < Initial_iterations:
+            for result in engine.solve_scenarios(engine.scenarios(Initial_iterations, start=mc_stats.n), studies):
+                mc_stats.update(result)
+                if log is None:
+                    results.append(result)
+                    continue
+                log.append(result)
+                if len(log) % checkpoint_every == 0:
+                    log.checkpoint(mc_stats)
+
+        # A resumed run is past this pass only if its check failed
+        if mc_stats.n == Initial_iterations:
+            # Check if the margin of error of every objective is within tolerance of its mean value
+            achieved = True
+            for metric in metrics:
+                running = mc_stats.summary(metric)
+                confidence_interval = running.confidence_interval(confidence_level)
+                margin_of_error = (confidence_interval[1] - confidence_interval[0]) / 2
+                if not margin_of_error <= tolerance * running.mean:
+                    achieved = False
+                    break
+            if achieved:
+                print(f"95% confidence level achieved within 5% tolerance after {Initial_iterations} simulations.")
+                if log is not None:
+                    log.checkpoint(mc_stats)
+                    results = log.results(0, Initial_iterations)
+                    log.close()
+                return {metric: [result[metric] for result in results] for metric in metrics}
+        Initial_iterations += Step_size
+        Total_iterations += 1
+    if log is not None:
+        log.checkpoint(mc_stats)
+        log.close()
+    return {metric: [] for metric in metrics}
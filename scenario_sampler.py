@@ -0,0 +1,126 @@
+import numpy as np
+
+# Points of a randomized replicate of 'sobol' and 'lhs' sampling (a power of two, the size Sobol points are balanced for)
+REPLICATE_SIZE = 8
+
+
+class ScenarioSampler:
+    """Vectorized, variance-reduced sampling of the uncertain parameters of the MC studies.
+
+    All perturbations of N scenarios are drawn as one (N, d) array of uniforms, one column per
+    perturbed key of Process_Time, Capacity and Demand and per disrupted factory, with:
+      - 'mc': plain Monte Carlo from a seeded NumPy generator,
+      - 'sobol': independently scrambled replicates of replicate_size Sobol points,
+      - 'lhs': independent Latin hypercube replicates of replicate_size points,
+      - 'antithetic': Monte Carlo pairs (u, 1 - u).
+    The draws only depend on the method, the seed and the instance keys, so two samplers built
+    with the same arguments (e.g. in the TTR and TTS studies) share common random numbers, and the
+    first k scenarios are the same whatever the number of scenarios drawn.
+
+    The points within a Sobol or LHS replicate, like an antithetic pair, are not independent: the
+    mean of each group of group_size consecutive scenarios is one independent observation, and the
+    confidence interval is computed on these means (see estimator_values).
+    """
+
+    methods = ('mc', 'sobol', 'lhs', 'antithetic')
+
+    def __init__(self, processtime, capacity, demand, disruption_bounds, fixed_disruption=None,
+                 method='sobol', seed=0, perturbation=0.1, replicate_size=REPLICATE_SIZE):
+        if method not in self.methods:
+            raise ValueError(f"Unknown sampling method {method!r}, expected one of {self.methods}")
+        if method == 'sobol' and replicate_size & (replicate_size - 1):
+            raise ValueError(f"Sobol replicates need a power of two points, not {replicate_size}")
+        self.processtime = processtime
+        self.capacity = capacity
+        self.demand = demand
+        # factory -> (low, high) of a sampled disruption rate, factory -> fixed disruption rate
+        self.disruption_bounds = disruption_bounds
+        self.fixed_disruption = fixed_disruption or {}
+        self.method = method
+        self.seed = seed
+        self.perturbation = perturbation
+        self.replicate_size = replicate_size
+        self.group_size = group_size(method, replicate_size)
+
+        self.processtime_keys = list(processtime)
+        self.capacity_keys = list(capacity)
+        self.demand_keys = list(demand)
+        self.disrupted_keys = list(disruption_bounds)
+        self.processtime_nominal = np.array([processtime[key] for key in self.processtime_keys], dtype=float)
+        self.capacity_nominal = np.array([capacity[key] for key in self.capacity_keys], dtype=float)
+        self.demand_nominal = np.array([demand[key] for key in self.demand_keys], dtype=float)
+        self.disruption_low = np.array([disruption_bounds[key][0] for key in self.disrupted_keys], dtype=float)
+        self.disruption_high = np.array([disruption_bounds[key][1] for key in self.disrupted_keys], dtype=float)
+        self.dimension = len(self.disrupted_keys) + len(self.processtime_keys) + len(self.capacity_keys) + len(self.demand_keys)
+
+    def uniforms(self, n):
+        """Return an (n, dimension) array of uniforms on [0, 1) drawn with the sampling method."""
+        if self.method in ('sobol', 'lhs'):
+            # Loaded here as importing scipy.stats is slow and the other methods only need NumPy
+            from scipy.stats import qmc
+
+            # Replicate k is randomized from its own stream of the seed, so it does not depend on n
+            replicates = []
+            for k in range(-(-n // self.replicate_size)):
+                rng = np.random.default_rng([self.seed, k])
+                if self.method == 'sobol':
+                    engine = qmc.Sobol(self.dimension, scramble=True, seed=rng)
+                    replicates.append(engine.random_base2(int(np.log2(self.replicate_size))))
+                else:
+                    replicates.append(qmc.LatinHypercube(self.dimension, seed=rng).random(self.replicate_size))
+            return np.concatenate(replicates or [np.empty((0, self.dimension))])[:n]
+        rng = np.random.default_rng(self.seed)
+        if self.method == 'antithetic':
+            half = rng.random(((n + 1) // 2, self.dimension))
+            pairs = np.empty((2 * len(half), self.dimension))
+            pairs[0::2] = half
+            pairs[1::2] = 1 - half
+            return pairs[:n]
+        return rng.random((n, self.dimension))
+
+    def sample(self, n):
+        """Return the perturbed parameters of n scenarios as arrays with one row per scenario."""
+        u = self.uniforms(n)
+        columns = np.cumsum([0, len(self.disrupted_keys), len(self.processtime_keys), len(self.capacity_keys)])
+        factor = 1 - self.perturbation + 2 * self.perturbation * u[:, columns[1]:]
+        return {
+            'Disruption_Rate': self.disruption_low + (self.disruption_high - self.disruption_low) * u[:, :columns[1]],
+            'Process_Time': self.processtime_nominal * factor[:, :columns[2] - columns[1]],
+            'Capacity': np.rint(self.capacity_nominal * factor[:, columns[2] - columns[1]:columns[3] - columns[1]]),
+            'Demand': np.rint(self.demand_nominal * factor[:, columns[3] - columns[1]:]),
+        }
+
+    def scenarios(self, n):
+        """Return n scenarios as (processtime, capacity, demand, disruptionrate) dictionaries."""
+        draws = self.sample(n)
+        scenarios = []
+        for k in range(n):
+            disruptionrate = {key: 0 for key in self.capacity_keys}
+            disruptionrate.update(zip(self.disrupted_keys, draws['Disruption_Rate'][k].tolist()))
+            disruptionrate.update(self.fixed_disruption)
+            scenarios.append((
+                dict(zip(self.processtime_keys, draws['Process_Time'][k].tolist())),
+                dict(zip(self.capacity_keys, draws['Capacity'][k].astype(int).tolist())),
+                dict(zip(self.demand_keys, draws['Demand'][k].astype(int).tolist())),
+                disruptionrate,
+            ))
+        return scenarios
+
+    def estimator_values(self, values):
+        """Return the values the confidence interval should be computed on.
+
+        The values of a group of group_size consecutive scenarios (an antithetic pair, a Sobol or
+        LHS replicate) are averaged into one independent value; an incomplete last group counts as
+        one value. Plain Monte Carlo values are returned unchanged.
+        """
+        values = np.asarray(values, dtype=float)
+        if self.group_size == 1:
+            return values
+        return np.array([group.mean() for group in np.split(values, range(self.group_size, len(values), self.group_size))])
+
+
+def group_size(method, replicate_size=REPLICATE_SIZE):
+    """Return the number of consecutive scenarios of a sampling method forming one independent observation."""
+    if method in ('sobol', 'lhs'):
+        return replicate_size
+    return 2 if method == 'antithetic' else 1
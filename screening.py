@@ -0,0 +1,233 @@
+import highspy
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+from instrumentation import instrumentation
+from parametric import highs_model
+
+# Relative tolerance of the refined basic solutions and of the primal and dual feasibility checks
+SCREENING_TOLERANCE = 1e-9
+# Refinement steps of the basic solution and duals of a scenario before it is sent to the solver
+MAX_REFINEMENTS = 25
+
+
+class StageBasis:
+    """Optimal basis of a nominal LP min c x s.t. A x <= b within bounds, evaluated for perturbed scenarios.
+
+    A scenario changes b, the bounds and the coefficients at the positions (rows, cols). With the
+    LU factors of the nominal basis matrix, the basic solution and the duals of every scenario of a
+    batch are solved at once: the first step is the first-order change (ranging along the scenario
+    direction), and refinement steps correct it for the changed coefficients. Where the refined
+    solution is primal feasible and the reduced costs keep their signs, the nominal basis is
+    optimal for the scenario and its objective value needs no solve.
+    """
+
+    def __init__(self, c, A, b, bounds, rows, cols, stage):
+        self.c = c
+        self.A = A.tocsr()
+        self.rows = rows
+        self.cols = cols
+        n_rows, n_cols = self.A.shape
+        # Scatter the products of the changed coefficients into rows and into columns
+        positions = np.arange(len(rows))
+        self.row_scatter = sparse.csr_matrix((np.ones(len(rows)), (rows, positions)), shape=(n_rows, len(rows)))
+        self.col_scatter = sparse.csr_matrix((np.ones(len(cols)), (cols, positions)), shape=(n_cols, len(cols)))
+
+        highs = highs_model(c, A, b, bounds)
+        with instrumentation.solver_call(stage, variables=n_cols, constraints=n_rows):
+            highs.run()
+        if highs.getModelStatus() != highspy.HighsModelStatus.kOptimal:
+            raise RuntimeError(f"HiGHS did not return an optimal solution: {highs.getModelStatus()}")
+        basis = highs.getBasis()
+        solution = highs.getSolution()
+        basic, upper = highspy.HighsBasisStatus.kBasic, highspy.HighsBasisStatus.kUpper
+        col_basic = np.array([status == basic for status in basis.col_status])
+        row_basic = np.array([status == basic for status in basis.row_status])
+        self.basic_cols = np.flatnonzero(col_basic)
+        self.basic_rows = np.flatnonzero(row_basic)
+        self.at_upper = np.array([status == upper for status in basis.col_status])
+        self.at_lower = ~col_basic & ~self.at_upper
+        self.nonbasic_rows = ~row_basic
+        self.x = np.asarray(solution.col_value)
+        self.r = np.asarray(solution.row_value)
+        self.value = float(c @ self.x)
+        self.lu = None
+        if len(self.basic_cols) + len(self.basic_rows) == n_rows:
+            B = sparse.hstack([self.A[:, self.basic_cols], -sparse.identity(n_rows, format='csr')[:, self.basic_rows]],
+                              format='csc')
+            try:
+                self.lu = splu(B)
+            except RuntimeError:
+                # Singular basis matrix: every scenario is solved
+                pass
+        if self.lu is not None:
+            self.pi = self.lu.solve(np.concatenate([c[self.basic_cols], np.zeros(len(self.basic_rows))]), trans='T')
+
+    def evaluate(self, coefficients, b, lower, upper):
+        """Return the objective value, the solution and whether the nominal basis is optimal, for every scenario.
+
+        coefficients holds the changes of the coefficients at (rows, cols), b, lower and upper the
+        right-hand sides and bounds, one column per scenario.
+        """
+        n_scenarios = b.shape[1]
+        if self.lu is None:
+            return np.full(n_scenarios, np.nan), None, np.zeros(n_scenarios, dtype=bool)
+        n_basic = len(self.basic_cols)
+        # Nonbasic columns and rows stay at their (moved) bounds
+        x = np.repeat(self.x[:, None], n_scenarios, axis=1)
+        x[self.at_lower] = lower[self.at_lower]
+        x[self.at_upper] = upper[self.at_upper]
+        r = np.repeat(self.r[:, None], n_scenarios, axis=1)
+        r[self.nonbasic_rows] = b[self.nonbasic_rows]
+        converged = np.zeros(n_scenarios, dtype=bool)
+        for _ in range(MAX_REFINEMENTS):
+            residual = self.A @ x + self.row_scatter @ (coefficients * x[self.cols]) - r
+            scale = 1 + np.maximum(np.abs(x).max(axis=0), np.abs(r).max(axis=0))
+            converged = np.abs(residual).max(axis=0) <= SCREENING_TOLERANCE * scale
+            if converged.all():
+                break
+            step = self.lu.solve(-residual)
+            x[self.basic_cols] += step[:n_basic]
+            r[self.basic_rows] += step[n_basic:]
+
+        # Duals of the basis with the changed coefficients: B^T pi = (c_B, 0)
+        target = np.concatenate([self.c[self.basic_cols], np.zeros(len(self.basic_rows))])[:, None]
+        pi = np.repeat(self.pi[:, None], n_scenarios, axis=1)
+        dual_converged = np.zeros(n_scenarios, dtype=bool)
+        cost_scale = 1 + np.abs(self.c).max()
+        for _ in range(MAX_REFINEMENTS):
+            column_duals = self.A.T @ pi + self.col_scatter @ (coefficients * pi[self.rows])
+            residual = np.vstack([column_duals[self.basic_cols], -pi[self.basic_rows]]) - target
+            dual_converged = np.abs(residual).max(axis=0) <= SCREENING_TOLERANCE * cost_scale
+            if dual_converged.all():
+                break
+            pi -= self.lu.solve(residual, trans='T')
+        reduced_costs = self.c[:, None] - (self.A.T @ pi + self.col_scatter @ (coefficients * pi[self.rows]))
+
+        tolerance = SCREENING_TOLERANCE * (1 + np.abs(x))
+        valid = converged & dual_converged
+        valid &= np.all(x[self.basic_cols] >= lower[self.basic_cols] - tolerance[self.basic_cols], axis=0)
+        valid &= np.all(x[self.basic_cols] <= upper[self.basic_cols] + tolerance[self.basic_cols], axis=0)
+        valid &= np.all(r[self.basic_rows] <= b[self.basic_rows] + SCREENING_TOLERANCE * (1 + np.abs(r[self.basic_rows])),
+                        axis=0)
+        # Minimization: reduced costs are nonnegative at lower bounds, nonpositive at upper bounds and on binding rows
+        dual_tolerance = SCREENING_TOLERANCE * cost_scale
+        valid &= np.all(reduced_costs[self.at_lower] >= -dual_tolerance, axis=0)
+        valid &= np.all(reduced_costs[self.at_upper] <= dual_tolerance, axis=0)
+        valid &= np.all(pi[self.nonbasic_rows] <= dual_tolerance, axis=0)
+        valid &= np.all(np.isfinite(x), axis=0)
+        return self.c @ x, x, valid
+
+
+class SensitivityScreen:
+    """Evaluate Monte Carlo scenarios from the optimal bases of the nominal TTS and TTR LPs.
+
+    The nominal scenario has the instance process times, capacities and demands, and disruption
+    rates at the middle of their bounds. Its TTS LP and three lexicographic TTR stages (SparseLP
+    layout) are solved once with HiGHS; the scenarios of a batch are then evaluated against those
+    bases together (see StageBasis). A scenario whose perturbation keeps a basis optimal gets the
+    objective values of that basis, which are the LP optimum up to the screening tolerance; the
+    others are left to the solver. With alternative optima the PGHG/TGHG split and the SI of a
+    screened scenario may come from another optimal solution than the solver would return.
+    """
+
+    def __init__(self, lp, instance, relaxation=1.001):
+        self.lp = lp
+        self.ttr = instance['TTR']
+        self.relaxation = relaxation
+        disruptionrate = {f: 0 for f in instance['factories']}
+        disruptionrate.update({f: (low + high) / 2 for f, (low, high) in instance['disruption_bounds'].items()})
+        disruptionrate.update(instance['fixed_disruption'])
+        self.nominal = (instance['processtime'], instance['capacity'], instance['demand'], disruptionrate)
+        self.n_fact = len(lp.factories)
+        self.n_final = len(lp.final_products)
+        self.n_ttr_cols = lp.n_u + lp.n_y + self.n_final
+        # Process time coefficients, in the capacity rows
+        self.pt_rows = lp.n_static + lp.capacity_rows
+        self.pt_cols = np.arange(lp.n_u)
+        self.tts_basis = None
+        self.ttr_bases = None
+        # Scenarios screened, and the solves the screen avoided per study
+        self.counts = {'scenarios': 0, 'TTS': 0, 'TTR': 0}
+
+    def _tts_basis(self):
+        if self.tts_basis is None:
+            lp = self.lp
+            c, A, b, bounds = lp.tts_problem(*self.nominal)
+            tts_col = len(c) - 1
+            rows = np.concatenate([self.pt_rows, lp.n_static + np.arange(self.n_fact + self.n_final)])
+            cols = np.concatenate([self.pt_cols, np.full(self.n_fact + self.n_final, tts_col)])
+            self.tts_basis = StageBasis(c, A, b, bounds, rows, cols, 'TTS')
+        return self.tts_basis
+
+    def _ttr_bases(self):
+        if self.ttr_bases is None:
+            lp = self.lp
+            A, b, bounds = lp.ttr_problem(*self.nominal, self.ttr)
+            lostmargin = StageBasis(lp.c_lostmargin, A, b, bounds, self.pt_rows, self.pt_cols, 'Lostmargin')
+            c_ghg = lp.c_pghg + lp.c_tghg
+            A = sparse.vstack([A, sparse.csr_matrix(lp.c_lostmargin)], format='csr')
+            b = np.append(b, self.relaxation * lostmargin.value)
+            ghg = StageBasis(c_ghg, A, b, bounds, self.pt_rows, self.pt_cols, 'GHG')
+            A = sparse.vstack([A, sparse.csr_matrix(c_ghg)], format='csr')
+            b = np.append(b, self.relaxation * ghg.value)
+            si = StageBasis(-lp.c_si, A, b, bounds, self.pt_rows, self.pt_cols, 'SI')
+            self.ttr_bases = (lostmargin, ghg, si)
+        return self.ttr_bases
+
+    def _screen_tts(self, pt, cap, dem, results):
+        basis = self._tts_basis()
+        _, _, b, bounds = self.lp.tts_problem(*self.nominal)
+        n_scenarios = pt.shape[1]
+        nominal_pt, nominal_cap, nominal_dem = self.lp.scenario_arrays(*self.nominal)
+        # Capacity and demand are the coefficients of the TTS column
+        coefficients = np.vstack([pt - nominal_pt[:, None], -(cap - nominal_cap[:, None]), dem - nominal_dem[:, None]])
+        values, _, valid = basis.evaluate(coefficients, np.repeat(b[:, None], n_scenarios, axis=1),
+                                          np.repeat(bounds[:, :1], n_scenarios, axis=1),
+                                          np.repeat(bounds[:, 1:], n_scenarios, axis=1))
+        for k in np.flatnonzero(valid):
+            results[k]['TTS'] = float(-values[k])
+        return int(valid.sum())
+
+    def _screen_ttr(self, pt, cap, dem, results):
+        lostmargin, ghg, si = self._ttr_bases()
+        lp = self.lp
+        n_scenarios = pt.shape[1]
+        nominal_pt = lp.scenario_arrays(*self.nominal)[0]
+        coefficients = pt - nominal_pt[:, None]
+        b = np.vstack([np.repeat(lp.static_rhs[:, None], n_scenarios, axis=1), cap * self.ttr,
+                       lp.final_inventory[:, None] - dem * self.ttr])
+        lower = np.zeros((self.n_ttr_cols, n_scenarios))
+        upper = np.full((self.n_ttr_cols, n_scenarios), np.inf)
+        upper[lp.n_u + lp.n_y:] = dem * self.ttr
+
+        # Every stage bounds the objective of the previous one at its value in the scenario
+        lostmargin_values, _, valid = lostmargin.evaluate(coefficients, b, lower, upper)
+        lostmargin_values = np.where(valid, lostmargin_values, lostmargin.value)
+        b = np.vstack([b, self.relaxation * lostmargin_values])
+        ghg_values, x, ghg_valid = ghg.evaluate(coefficients, b, lower, upper)
+        valid &= ghg_valid
+        ghg_values = np.where(valid, ghg_values, ghg.value)
+        b = np.vstack([b, self.relaxation * ghg_values])
+        si_values, _, si_valid = si.evaluate(coefficients, b, lower, upper)
+        valid &= si_valid
+        for k in np.flatnonzero(valid):
+            results[k].update({'Lostmargin': float(lostmargin_values[k]), 'PGHG': float(lp.c_pghg @ x[:, k]),
+                               'TGHG': float(lp.c_tghg @ x[:, k]), 'SI': float(-si_values[k])})
+        return int(valid.sum())
+
+    def screen(self, scenarios, studies):
+        """Return one result dictionary per scenario with the studies the nominal bases decide (possibly none)."""
+        results = [{} for _ in scenarios]
+        if not scenarios:
+            return results
+        # Scenario arrays, one column per scenario
+        arrays = [self.lp.scenario_arrays(*scenario) for scenario in scenarios]
+        pt, cap, dem = (np.column_stack([array[k] for array in arrays]) for k in range(3))
+        self.counts['scenarios'] += len(scenarios)
+        if 'TTS' in studies:
+            self.counts['TTS'] += self._screen_tts(pt, cap, dem, results)
+        if 'TTR' in studies:
+            self.counts['TTR'] += self._screen_ttr(pt, cap, dem, results)
+        return results
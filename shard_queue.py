@@ -0,0 +1,218 @@
+import importlib
+import json
+import os
+import socket
+import time
+import uuid
+
+from mc_log import MonteCarloStats
+from scenario_engine import STUDY_METRICS, ScenarioEngine
+from scenario_sampler import group_size
+from shared_instance import SharedInstance
+
+# Seconds after which a claimed shard whose worker stopped renewing its lease is handed out again
+LEASE_TIMEOUT = 300
+
+
+class ShardQueue:
+    """File-based work queue of Monte Carlo scenario shards in a directory shared by all nodes.
+
+    A shard names the instance (a module with get_instance(), or the directory it was published to),
+    the engine options, the studies and a range of scenario seeds. The coordinator writes shards to pending/; a worker claims one by
+    renaming it into claimed/ (a rename is atomic, so only one worker gets it), renews the claim
+    while solving, and writes the results to results/ before releasing the claim. A claim not
+    renewed for lease_timeout seconds belongs to a dead worker and is moved back to pending/.
+    """
+
+    def __init__(self, directory, lease_timeout=LEASE_TIMEOUT):
+        self.directory = directory
+        self.lease_timeout = lease_timeout
+        self.pending = os.path.join(directory, 'pending')
+        self.claimed = os.path.join(directory, 'claimed')
+        self.results = os.path.join(directory, 'results')
+        for path in (self.pending, self.claimed, self.results):
+            os.makedirs(path, exist_ok=True)
+
+    def write_shards(self, n_scenarios, shard_size, studies, instance_module='instance_data', engine_options=None,
+                     shared_instance=None):
+        """Write the shards of scenarios 0 to n_scenarios and return their names (coordinator).
+
+        shared_instance optionally names the directory the instance was published to (see publish_instance):
+        workers then memory-map its arrays instead of each building the instance and its LP.
+        """
+        # Shards, claims and results left by a previous run in this directory would be merged with this one
+        for path in (self.pending, self.claimed, self.results):
+            for name in os.listdir(path):
+                os.remove(os.path.join(path, name))
+        run = uuid.uuid4().hex
+        self._write_atomic(os.path.join(self.directory, 'manifest.json'),
+                           {'run': run, 'n_scenarios': n_scenarios, 'shard_size': shard_size, 'studies': list(studies),
+                            'instance': instance_module, 'engine': engine_options or {}, 'shared': shared_instance})
+        names = []
+        for start in range(0, n_scenarios, shard_size):
+            name = f'shard-{start:09d}.json'
+            shard = {'run': run, 'instance': instance_module, 'engine': engine_options or {}, 'studies': list(studies),
+                     'shared': shared_instance, 'start': start, 'stop': min(start + shard_size, n_scenarios)}
+            self._write_atomic(os.path.join(self.pending, name), shard)
+            names.append(name)
+        return names
+
+    def run_id(self):
+        """Return the id of the run the coordinator last wrote to the queue, or None if there is none."""
+        try:
+            with open(os.path.join(self.directory, 'manifest.json')) as f:
+                return json.load(f).get('run')
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _result_run(path):
+        # Run of a result shard, or None if there is none
+        try:
+            with open(path) as f:
+                return json.load(f).get('run')
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _write_atomic(path, data):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def claim(self, worker_id):
+        """Claim a pending shard and return (name, claim path), or None if none is pending."""
+        for name in sorted(os.listdir(self.pending)):
+            if name.endswith('.tmp'):
+                continue
+            claim_path = os.path.join(self.claimed, f'{name}@{worker_id}')
+            try:
+                os.rename(os.path.join(self.pending, name), claim_path)
+                # A rename keeps the modification time of the pending shard: start the lease now
+                os.utime(claim_path)
+            except FileNotFoundError:
+                # Another worker claimed it first
+                continue
+            return name, claim_path
+        return None
+
+    def requeue_expired(self):
+        """Move claims not renewed within the lease timeout back to pending and return how many were moved."""
+        requeued = 0
+        now = time.time()
+        run = self.run_id()
+        for claim in os.listdir(self.claimed):
+            name = claim.split('@')[0]
+            claim_path = os.path.join(self.claimed, claim)
+            try:
+                if now - os.path.getmtime(claim_path) < self.lease_timeout:
+                    continue
+                if self._result_run(os.path.join(self.results, name)) == run:
+                    os.remove(claim_path)
+                else:
+                    os.rename(claim_path, os.path.join(self.pending, name))
+                    requeued += 1
+            except FileNotFoundError:
+                # Renewed, finished or requeued by someone else in the meantime
+                continue
+        return requeued
+
+    def finished(self):
+        """Return whether no shard is pending or claimed."""
+        return not os.listdir(self.pending) and not os.listdir(self.claimed)
+
+    def run_worker(self, worker_id=None, poll_interval=1.0):
+        """Solve shards until the queue is empty and return the number of shards solved (worker)."""
+        worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+        engines = {}
+        solved = 0
+        while True:
+            claimed = self.claim(worker_id)
+            if claimed is None:
+                if self.finished():
+                    return solved
+                if not self.requeue_expired():
+                    time.sleep(poll_interval)
+                continue
+            name, claim_path = claimed
+            try:
+                with open(claim_path) as f:
+                    shard = json.load(f)
+            except FileNotFoundError:
+                continue
+            result_path = os.path.join(self.results, name)
+            run = self.run_id()
+            # A shard of a previous run is dropped, a result of a previous run is solved again
+            if shard.get('run') == run and self._result_run(result_path) != run:
+                # One engine per instance and engine options, reused across shards
+                key = json.dumps([shard['instance'], shard['engine'], shard.get('shared')], sort_keys=True)
+                if key not in engines:
+                    if shard.get('shared') is not None:
+                        shared = SharedInstance(shard['shared'])
+                        engines[key] = ScenarioEngine(shared.instance(), shared=shared, **shard['engine'])
+                    else:
+                        instance = importlib.import_module(shard['instance']).get_instance()
+                        engines[key] = ScenarioEngine(instance, **shard['engine'])
+                engine = engines[key]
+                results = []
+                for scenario in engine.scenarios(shard['stop'], start=shard['start']):
+                    results.extend(engine.solve_scenarios([scenario], tuple(shard['studies'])))
+                    # Renew the claim so the shard is not handed out again while this worker is alive
+                    try:
+                        os.utime(claim_path)
+                    except FileNotFoundError:
+                        # The lease expired and the shard went back to the queue: leave it to its new owner
+                        break
+                else:
+                    metrics = [metric for study in shard['studies'] for metric in STUDY_METRICS[study]]
+                    self._write_atomic(result_path, {'run': run, 'start': shard['start'], 'stop': shard['stop'],
+                                                     'values': {metric: [result[metric] for result in results]
+                                                                for metric in metrics}})
+                    solved += 1
+            try:
+                os.remove(claim_path)
+            except FileNotFoundError:
+                pass
+
+    def merge(self, confidence_level=0.95):
+        """Assemble the result shards in scenario order and return the values and statistics of every objective.
+
+        The statistics are computed over the independent observations of the sampling of the run
+        (antithetic pairs, Sobol or LHS replicates, see ScenarioSampler).
+
+        Raises RuntimeError if scenarios are missing, e.g. while workers are still running, or if a
+        result shard belongs to another run than the manifest.
+        """
+        with open(os.path.join(self.directory, 'manifest.json')) as f:
+            manifest = json.load(f)
+        n_scenarios = manifest['n_scenarios']
+        shards = []
+        for name in sorted(os.listdir(self.results)):
+            if name.endswith('.json'):
+                with open(os.path.join(self.results, name)) as f:
+                    shard = json.load(f)
+                if shard.get('run') != manifest.get('run'):
+                    raise RuntimeError(f"Result shard {name} belongs to another run than the manifest of {self.directory}")
+                shards.append(shard)
+        shards.sort(key=lambda shard: shard['start'])
+        expected = 0
+        for shard in shards:
+            if shard['start'] != expected:
+                raise RuntimeError(f"Scenarios {expected} to {shard['start']} have no results yet")
+            expected = shard['stop']
+        if not shards or expected != n_scenarios:
+            raise RuntimeError(f"Scenarios {expected} to {n_scenarios} have no results yet")
+
+        metrics = list(shards[0]['values'])
+        values = {metric: [value for shard in shards for value in shard['values'][metric]] for metric in metrics}
+        sampling = manifest['engine'].get('sampling', 'random')
+        mc_stats = MonteCarloStats(metrics, group_size(sampling))
+        for k in range(expected):
+            mc_stats.update({metric: values[metric][k] for metric in metrics})
+        summary = {}
+        for metric in metrics:
+            running = mc_stats.summary(metric)
+            summary[metric] = {'mean': running.mean, 'std': running.variance() ** 0.5,
+                               'confidence_interval': tuple(float(bound) for bound in running.confidence_interval(confidence_level))}
+        return values, summary
@@ -0,0 +1,118 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from scenario_engine import instance_fingerprint
+
+# Tables of an instance published as key and value arrays, with the names each key component indexes
+TABLES = {'processtime': ('factories', 'products'), 'inventory': ('factories', 'products'),
+          'pghg': ('factories', 'products'), 'distance': ('factories', 'factories'), 'BOM': ('products', 'products'),
+          'capacity': ('factories',), 'si': ('factories',), 'demand': ('products',), 'profitmargin': ('products',)}
+# Entries of the instance kept in the metadata
+METADATA = ('products', 'factories', 'final_products', 'TTR', 'TGHG', 'disruption_bounds', 'fixed_disruption')
+# Entries a ScenarioEngine draws the scenarios from (see SharedInstance.instance)
+SCENARIO_TABLES = ('processtime', 'capacity', 'demand')
+
+
+def publish_instance(instance, directory, aggregate_flows=False):
+    """Write the instance tables, the flow index and the SparseLP arrays of an instance to directory as .npy files.
+
+    The SparseLP is assembled once here; the directory is written under a temporary name and then
+    renamed, so workers never see it half written. Returns directory.
+    """
+    from sparse_lp import SparseLP
+
+    lp = SparseLP(instance['products'], instance['factories'], instance['final_products'], instance['BOM'],
+                  instance['factory_product'], instance['inventory'], pghg=instance['pghg'],
+                  distance=instance['distance'], tghg=instance['TGHG'], si=instance['si'],
+                  profitmargin=instance['profitmargin'], excluded_flows=instance.get('excluded_flows', ()),
+                  aggregate_flows=aggregate_flows, idle_production=instance.get('idle_production', ()))
+    positions = {space: {name: k for k, name in enumerate(instance[space])} for space in ('products', 'factories')}
+
+    def keys(space_names, entries):
+        # Every key as a row of positions, in the order of the instance
+        rows = [key if isinstance(key, tuple) else (key,) for key in entries]
+        return np.array([[positions[space][name] for space, name in zip(space_names, row)] for row in rows],
+                        dtype=np.int32).reshape(len(rows), len(space_names))
+
+    arrays = {}
+    for name, space_names in TABLES.items():
+        arrays[name + '_keys'] = keys(space_names, instance[name])
+        arrays[name] = np.array(list(instance[name].values()), dtype=float)
+    arrays['factory_product'] = keys(('factories', 'products'), instance['factory_product'])
+    arrays['flows'] = keys(('factories', 'products', 'factories', 'products'), lp.index.flows)
+    arrays['lp_factory_product'] = keys(('factories', 'products'), lp.factory_product)
+    for name, values in lp.arrays().items():
+        arrays['lp_' + name] = np.asarray(values)
+
+    metadata = {key: instance[key] for key in METADATA}
+    metadata['disruption_bounds'] = {f: list(bounds) for f, bounds in instance['disruption_bounds'].items()}
+    metadata.update({'fingerprint': instance_fingerprint(instance), 'aggregate_flows': aggregate_flows,
+                     'arrays': sorted(arrays)})
+    tmp_directory = directory.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    for name, values in arrays.items():
+        np.save(os.path.join(tmp_directory, name + '.npy'), values)
+    with open(os.path.join(tmp_directory, 'metadata.json'), 'w') as f:
+        json.dump(metadata, f)
+    # Processes still mapping the files of a previous publication keep them until they detach
+    shutil.rmtree(directory, ignore_errors=True)
+    os.rename(tmp_directory, directory)
+    return directory
+
+
+class SharedInstance:
+    """Read-only view of an instance published with publish_instance.
+
+    Every array is memory-mapped instead of read: processes attached to the same directory share one
+    copy of the tables, the flow index and the LP arrays in the page cache, so the memory does not
+    grow with the number of workers and attaching costs no copying or unpickling. The scenario
+    tables (instance) and the tables asked for (table) are rebuilt as dictionaries; the LP is
+    assembled directly over the mapped arrays (lp).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'metadata.json')) as f:
+            self.metadata = json.load(f)
+        self.arrays = {name: self._load(name) for name in self.metadata['arrays']}
+        self.fingerprint = self.metadata['fingerprint']
+        self.aggregate_flows = self.metadata['aggregate_flows']
+
+    def _load(self, name):
+        path = os.path.join(self.directory, name + '.npy')
+        try:
+            return np.load(path, mmap_mode='r')
+        except ValueError:
+            # An empty array has nothing to map
+            return np.load(path)
+
+    def _keys(self, name, space_names):
+        names = [self.metadata[space] for space in space_names]
+        rows = self.arrays[name].tolist()
+        if len(space_names) == 1:
+            return [names[0][row[0]] for row in rows]
+        return [tuple(space[k] for space, k in zip(names, row)) for row in rows]
+
+    def table(self, name):
+        """Return a table of the instance as the dictionary it was published from."""
+        return dict(zip(self._keys(name + '_keys', TABLES[name]), self.arrays[name].tolist()))
+
+    def instance(self):
+        """Return the instance entries a ScenarioEngine draws its scenarios from, to pass with the SharedInstance."""
+        instance = {key: self.metadata[key] for key in METADATA}
+        instance['disruption_bounds'] = {f: tuple(bounds) for f, bounds in instance['disruption_bounds'].items()}
+        for name in SCENARIO_TABLES:
+            instance[name] = self.table(name)
+        return instance
+
+    def lp(self):
+        """Return the SparseLP of the instance over the mapped arrays."""
+        from sparse_lp import SparseLP
+
+        arrays = {name[len('lp_'):]: values for name, values in self.arrays.items() if name.startswith('lp_')}
+        return SparseLP.from_arrays(self.metadata['products'], self.metadata['factories'], self.metadata['final_products'],
+                                    self._keys('lp_factory_product', ('factories', 'products')), arrays)
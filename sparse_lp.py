@@ -0,0 +1,261 @@
+import time
+
+import numpy as np
+from scipy import sparse
+from scipy.optimize import linprog
+
+from flow_index import FlowIndex
+from instrumentation import instrumentation
+
+
+class SparseLP:
+    """The TTR and TTS supply chain LPs assembled directly as scipy.sparse matrices.
+
+    Columns are laid out as [u (factory, product) | y (flows) | l (final products) or TTS].
+    The scenario-independent rows (BOM and production/inventory) and the cost vectors are
+    built once; a scenario only fills in process times, capacities, demands and disruption
+    rates before the LP is solved in-process with HiGHS through scipy.optimize.linprog.
+    """
+
+    def __init__(self, products, factories, final_products, BOM, factory_product, inventory,
+                 pghg=None, distance=None, tghg=0, si=None, profitmargin=None,
+                 excluded_flows=(), aggregate_flows=False, idle_production=()):
+        self.products = list(products)
+        self.factories = list(factories)
+        self.final_products = list(final_products)
+        self.BOM = BOM
+        # Solve times of the three stages of the last solve_ttr call
+        self.last_stage_times = []
+        self.index = FlowIndex(BOM, factory_product, excluded_flows, aggregate_flows, idle_production)
+
+        fp = self.index.factory_product
+        flows = self.index.flows
+        self.factory_product = fp
+        self.n_u = len(fp)
+        self.n_y = len(flows)
+        self.u_pos = {key: k for k, key in enumerate(fp)}
+        self.y_pos = {flow: self.n_u + k for k, flow in enumerate(flows)}
+        self.factory_pos = {f: k for k, f in enumerate(self.factories)}
+
+        self.inventory = np.array([inventory[key] for key in fp], dtype=float)
+        # Initial inventory of every final product summed over the factories producing it
+        self.final_inventory = np.array([sum(inventory[f, i] for f in self.index.product_factories.get(i, []))
+                                         for i in self.final_products], dtype=float)
+
+        # Scenario-independent rows: BOM constraints, then production and inventory constraints
+        rows, cols, vals = [], [], []
+        row = 0
+        for u_terms, inflows in self.index.bom_rows.values():
+            for (h, j, quantity) in u_terms:
+                rows.append(row)
+                cols.append(self.u_pos[h, j])
+                vals.append(quantity)
+            for flow in inflows:
+                rows.append(row)
+                cols.append(self.y_pos[flow])
+                vals.append(-1.0)
+            row += 1
+        n_bom = row
+        for key in fp:
+            rows.append(row)
+            cols.append(self.u_pos[key])
+            vals.append(-1.0)
+            for flow in self.index.flows_out[key]:
+                rows.append(row)
+                cols.append(self.y_pos[flow])
+                vals.append(1.0)
+            row += 1
+        self.n_static = row
+        self.static_rows = np.array(rows, dtype=int)
+        self.static_cols = np.array(cols, dtype=int)
+        self.static_vals = np.array(vals, dtype=float)
+        self.static_rhs = np.concatenate([np.zeros(n_bom), self.inventory])
+
+        # Capacity rows: one per factory, process time coefficients on its u columns
+        self.capacity_rows = np.array([self.factory_pos[f] for f, i in fp], dtype=int)
+        # Demand rows: one per final product, over the u columns of the factories producing it
+        demand_rows, demand_cols = [], []
+        for r, i in enumerate(self.final_products):
+            for f in self.index.product_factories.get(i, []):
+                demand_rows.append(r)
+                demand_cols.append(self.u_pos[f, i])
+        self.demand_rows = np.array(demand_rows, dtype=int)
+        self.demand_cols = np.array(demand_cols, dtype=int)
+
+        # Cost vectors of the TTR objectives over the TTR column layout
+        n = self.n_u + self.n_y + len(self.final_products)
+        self.c_lostmargin = np.zeros(n)
+        self.c_pghg = np.zeros(n)
+        self.c_tghg = np.zeros(n)
+        self.c_si = np.zeros(n)
+        if profitmargin is not None:
+            self.c_lostmargin[self.n_u + self.n_y:] = [profitmargin[i] for i in self.final_products]
+        if pghg is not None:
+            self.c_pghg[:self.n_u] = [pghg[key] for key in fp]
+        if distance is not None:
+            for flow, k in self.y_pos.items():
+                if (flow[0], flow[2]) in distance:
+                    self.c_tghg[k] = tghg * distance[flow[0], flow[2]]
+        if si is not None:
+            self.c_si[:self.n_u] = [si[f] for f, i in fp]
+
+    # Arrays a SparseLP is assembled from, e.g. by processes sharing them (see from_arrays)
+    ARRAYS = ('inventory', 'final_inventory', 'static_rows', 'static_cols', 'static_vals', 'static_rhs', 'capacity_rows',
+              'demand_rows', 'demand_cols', 'c_lostmargin', 'c_pghg', 'c_tghg', 'c_si')
+
+    def arrays(self):
+        """Return the arrays and sizes the LPs of every scenario are assembled from."""
+        data = {name: getattr(self, name) for name in self.ARRAYS}
+        data['sizes'] = np.array([self.n_u, self.n_y, self.n_static])
+        return data
+
+    @classmethod
+    def from_arrays(cls, products, factories, final_products, factory_product, arrays):
+        """Return a SparseLP over the arrays of another one (see arrays), e.g. read-only views shared by processes.
+
+        The flow index is not rebuilt; the LP solves scenarios like the SparseLP the arrays come from.
+        """
+        lp = cls.__new__(cls)
+        lp.products = list(products)
+        lp.factories = list(factories)
+        lp.final_products = list(final_products)
+        lp.BOM = None
+        lp.index = None
+        lp.last_stage_times = []
+        lp.factory_product = list(factory_product)
+        for name in cls.ARRAYS:
+            setattr(lp, name, arrays[name])
+        lp.n_u, lp.n_y, lp.n_static = (int(size) for size in arrays['sizes'])
+        return lp
+
+    def scenario_arrays(self, process_time, capacity, demand, disruption_rate):
+        """Return the process time, available capacity rate and demand arrays of a scenario."""
+        pt = np.array([process_time[key] for key in self.factory_product], dtype=float)
+        cap = np.array([capacity[f] * (1 - disruption_rate[f]) for f in self.factories], dtype=float)
+        dem = np.array([demand[i] for i in self.final_products], dtype=float)
+        return pt, cap, dem
+
+    def _matrix(self, pt, demand_coeffs, extra_rows, extra_cols, extra_vals, n_cols):
+        """Stack the static, capacity and demand rows into one CSR matrix."""
+        n_fact = len(self.factories)
+        rows = np.concatenate([self.static_rows,
+                               self.n_static + self.capacity_rows,
+                               self.n_static + n_fact + self.demand_rows,
+                               extra_rows])
+        cols = np.concatenate([self.static_cols, np.arange(self.n_u), self.demand_cols, extra_cols])
+        vals = np.concatenate([self.static_vals, pt, demand_coeffs, extra_vals])
+        n_rows = self.n_static + n_fact + len(self.final_products)
+        return sparse.coo_matrix((vals, (rows, cols)), shape=(n_rows, n_cols)).tocsr()
+
+    def ttr_problem(self, process_time, capacity, demand, disruption_rate, ttr, lost_sales_bound=None):
+        """Return A_ub, b_ub and bounds of the TTR model for one scenario.
+
+        lost_sales_bound optionally holds a lower bound on the lost sales of every final product.
+        """
+        pt, cap, dem = self.scenario_arrays(process_time, capacity, demand, disruption_rate)
+        n_fact = len(self.factories)
+        n_final = len(self.final_products)
+        n_cols = self.n_u + self.n_y + n_final
+        # Demand satisfying: -l_i - sum_f u[f, i] <= inventory_i - Demand_i * TTR
+        l_rows = self.n_static + n_fact + np.arange(n_final)
+        l_cols = self.n_u + self.n_y + np.arange(n_final)
+        A = self._matrix(pt, -np.ones(len(self.demand_rows)), l_rows, l_cols, -np.ones(n_final), n_cols)
+        b = np.concatenate([self.static_rhs, cap * ttr, self.final_inventory - dem * ttr])
+        bounds = np.zeros((n_cols, 2))
+        bounds[:, 1] = np.inf
+        # Upper bound for lost sales
+        bounds[self.n_u + self.n_y:, 1] = dem * ttr
+        if lost_sales_bound is not None:
+            bounds[self.n_u + self.n_y:, 0] = lost_sales_bound
+        return A, b, bounds
+
+    def tts_problem(self, process_time, capacity, demand, disruption_rate, tts_bound=None):
+        """Return c, A_ub, b_ub and bounds of the TTS model for one scenario, with an optional upper bound on TTS."""
+        pt, cap, dem = self.scenario_arrays(process_time, capacity, demand, disruption_rate)
+        n_fact = len(self.factories)
+        n_final = len(self.final_products)
+        n_cols = self.n_u + self.n_y + 1
+        tts_col = n_cols - 1
+        # Capacity: sum_i Process_Time * u - Capacity * (1 - Disruption_Rate) * TTS <= 0
+        # Demand satisfying: Demand_i * TTS - sum_f u[f, i] <= inventory_i
+        extra_rows = np.concatenate([self.n_static + np.arange(n_fact), self.n_static + n_fact + np.arange(n_final)])
+        extra_cols = np.full(n_fact + n_final, tts_col)
+        extra_vals = np.concatenate([-cap, dem])
+        A = self._matrix(pt, -np.ones(len(self.demand_rows)), extra_rows, extra_cols, extra_vals, n_cols)
+        b = np.concatenate([self.static_rhs, np.zeros(n_fact), self.final_inventory])
+        bounds = np.zeros((n_cols, 2))
+        bounds[:, 1] = np.inf
+        if tts_bound is not None:
+            bounds[tts_col, 1] = tts_bound
+        c = np.zeros(n_cols)
+        c[tts_col] = -1.0
+        return c, A, b, bounds
+
+    @staticmethod
+    def _linprog(c, A_ub, b_ub, bounds, stage):
+        with instrumentation.solver_call(stage, variables=len(c), constraints=A_ub.shape[0]):
+            res = linprog(c, A_ub=A_ub, b_ub=b_ub, bounds=bounds, method='highs')
+        if res.status != 0:
+            raise RuntimeError(f"HiGHS did not return an optimal solution: {res.message}")
+        return res
+
+    def solve_tts(self, process_time, capacity, demand, disruption_rate, tts_bound=None):
+        """Solve the TTS model of one scenario and return the time to survive."""
+        with instrumentation.stage('build'):
+            c, A, b, bounds = self.tts_problem(process_time, capacity, demand, disruption_rate, tts_bound)
+        return float(-self._linprog(c, A, b, bounds, 'TTS').fun)
+
+    def solve_tts_batch(self, scenarios, tts_bounds=None):
+        """Solve several TTS scenarios as one block-diagonal LP and return the TTS of each.
+
+        scenarios is a list of (process_time, capacity, demand, disruption_rate) tuples. The blocks
+        share no columns, so maximizing the summed TTS maximizes the TTS of every scenario.
+        tts_bounds optionally holds an upper bound on the TTS of every scenario.
+        """
+        if tts_bounds is None:
+            tts_bounds = [None] * len(scenarios)
+        with instrumentation.stage('build'):
+            problems = [self.tts_problem(*scenario, tts_bound) for scenario, tts_bound in zip(scenarios, tts_bounds)]
+            c = np.concatenate([problem[0] for problem in problems])
+            A = sparse.block_diag([problem[1] for problem in problems], format='csr')
+            b = np.concatenate([problem[2] for problem in problems])
+            bounds = np.vstack([problem[3] for problem in problems])
+        x = self._linprog(c, A, b, bounds, 'TTS').x
+        n_cols = len(problems[0][0])
+        # The TTS column is the last column of every block
+        return [float(x[(k + 1) * n_cols - 1]) for k in range(len(problems))]
+
+    def solve_ttr(self, process_time, capacity, demand, disruption_rate, ttr, relaxation=1.001, lost_sales_bound=None):
+        """Solve the three lexicographic TTR stages of one scenario.
+
+        Returns a dictionary with the lost margin, the PGHG and TGHG of the GHG stage and the SI.
+        """
+        with instrumentation.stage('build'):
+            A, b, bounds = self.ttr_problem(process_time, capacity, demand, disruption_rate, ttr, lost_sales_bound)
+
+        self.last_stage_times = []
+
+        # Step 1: Optimize the lost margin
+        start = time.perf_counter()
+        res = self._linprog(self.c_lostmargin, A, b, bounds, 'Lostmargin')
+        self.last_stage_times.append(time.perf_counter() - start)
+        lostmargin = res.fun
+
+        # Step 2: Optimize GHG with the lost margin fixed at its optimal value
+        c_ghg = self.c_pghg + self.c_tghg
+        A = sparse.vstack([A, sparse.csr_matrix(self.c_lostmargin)], format='csr')
+        b = np.append(b, relaxation * lostmargin)
+        start = time.perf_counter()
+        res = self._linprog(c_ghg, A, b, bounds, 'GHG')
+        self.last_stage_times.append(time.perf_counter() - start)
+        pghg_value = float(self.c_pghg @ res.x)
+        tghg_value = float(self.c_tghg @ res.x)
+
+        # Step 3: Optimize SI with GHG fixed at its optimal value
+        A = sparse.vstack([A, sparse.csr_matrix(c_ghg)], format='csr')
+        b = np.append(b, relaxation * res.fun)
+        start = time.perf_counter()
+        res = self._linprog(-self.c_si, A, b, bounds, 'SI')
+        self.last_stage_times.append(time.perf_counter() - start)
+
+        return {'Lostmargin': float(lostmargin), 'PGHG': pghg_value, 'TGHG': tghg_value, 'SI': float(-res.fun)}